@@ -11,6 +11,7 @@ from alembic import context
 # Importar Base y modelos
 from app.core.database import Base
 from app.models import *  # Importar todos los modelos
+from app.models.quote import is_quote_partition
 from app.core.config import settings
 
 # Alembic Config object
@@ -27,6 +28,13 @@ target_metadata = Base.metadata
 config.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
 
 
+def include_name(name, type_, parent_names) -> bool:
+    """Ignorar las particiones anuales de quotes (se gestionan fuera de los modelos)"""
+    if type_ == "table":
+        return not is_quote_partition(name)
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode."""
     url = config.get_main_option("sqlalchemy.url")
@@ -35,6 +43,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
     )
 
     with context.begin_transaction():
@@ -42,7 +51,11 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+    )
 
     with context.begin_transaction():
         context.run_migrations()
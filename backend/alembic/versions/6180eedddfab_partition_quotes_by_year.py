@@ -0,0 +1,130 @@
+"""partition quotes by year with brin date index
+
+Revision ID: 6180eedddfab
+Revises: 29bc6e996add
+Create Date: 2026-10-19 12:00:00.000000
+
+Convierte quotes en una tabla particionada por rango de fecha:
+- quotes_historic (< 2000) y una partición quotes_yYYYY por año hasta el año siguiente al actual
+- PK (id, date): la clave de partición debe formar parte de las claves únicas
+- uq_quote_asset_date (asset_id, date) se mantiene y cubre las búsquedas por activo,
+  así que desaparecen ix_quotes_asset_id e idx_quote_asset_date (duplicado)
+- ix_quotes_date (btree) se sustituye por ix_quotes_date_brin (BRIN)
+
+Las filas se copian ordenadas por fecha para que el BRIN sea selectivo. Si quotes ya
+está particionada (base creada con create_all a partir de los modelos) solo se crean
+las particiones y los índices.
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6180eedddfab'
+down_revision: Union[str, None] = '29bc6e996add'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FIRST_YEAR = 2000
+
+COLUMNS = "id, asset_id, date, open, high, low, close, volume, source, created_at"
+
+
+def _create_partitions(last_year: int) -> None:
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS quotes_historic PARTITION OF quotes "
+        f"FOR VALUES FROM (MINVALUE) TO ('{FIRST_YEAR}-01-01 00:00:00+00')"
+    )
+    for year in range(FIRST_YEAR, last_year + 1):
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS quotes_y{year} PARTITION OF quotes "
+            f"FOR VALUES FROM ('{year}-01-01 00:00:00+00') TO ('{year + 1}-01-01 00:00:00+00')"
+        )
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    is_partitioned = conn.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'quotes')"
+    )).scalar()
+
+    last_year = date.today().year + 1
+
+    if is_partitioned:
+        _create_partitions(last_year)
+    else:
+        max_year = conn.execute(sa.text("SELECT extract(year FROM max(date))::int FROM quotes")).scalar()
+        last_year = max(last_year, max_year or 0)
+
+        # Los nombres de índices y constraints son únicos por esquema: liberar los de la tabla antigua
+        op.execute("ALTER TABLE quotes RENAME TO quotes_unpartitioned")
+        op.execute("ALTER TABLE quotes_unpartitioned DROP CONSTRAINT quotes_pkey")
+        op.execute("ALTER TABLE quotes_unpartitioned DROP CONSTRAINT uq_quote_asset_date")
+        op.execute("DROP INDEX IF EXISTS idx_quote_asset_date")
+        op.execute("DROP INDEX IF EXISTS ix_quotes_asset_id")
+        op.execute("DROP INDEX IF EXISTS ix_quotes_date")
+
+        op.execute("""
+            CREATE TABLE quotes (
+                id uuid NOT NULL,
+                asset_id uuid NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+                date timestamptz NOT NULL,
+                open numeric(18, 6) NOT NULL,
+                high numeric(18, 6) NOT NULL,
+                low numeric(18, 6) NOT NULL,
+                close numeric(18, 6) NOT NULL,
+                volume bigint,
+                source varchar(50),
+                created_at timestamptz NOT NULL DEFAULT now()
+            ) PARTITION BY RANGE (date)
+        """)
+        _create_partitions(last_year)
+
+        # Copia antes de crear índices (más rápido) y ordenada por fecha (correlación física para BRIN)
+        op.execute(f"INSERT INTO quotes ({COLUMNS}) SELECT {COLUMNS} FROM quotes_unpartitioned ORDER BY date, asset_id")
+        op.execute("DROP TABLE quotes_unpartitioned")
+
+    op.execute("ALTER TABLE quotes DROP CONSTRAINT IF EXISTS quotes_pkey")
+    op.execute("ALTER TABLE quotes ADD CONSTRAINT quotes_pkey PRIMARY KEY (id, date)")
+    op.execute("ALTER TABLE quotes DROP CONSTRAINT IF EXISTS uq_quote_asset_date")
+    op.execute("ALTER TABLE quotes ADD CONSTRAINT uq_quote_asset_date UNIQUE (asset_id, date)")
+    op.execute("DROP INDEX IF EXISTS idx_quote_asset_date")
+    op.execute("DROP INDEX IF EXISTS ix_quotes_asset_id")
+    op.execute("DROP INDEX IF EXISTS ix_quotes_date")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_quotes_date_brin ON quotes USING brin (date)")
+    op.execute("ANALYZE quotes")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE quotes RENAME TO quotes_partitioned")
+    op.execute("ALTER TABLE quotes_partitioned DROP CONSTRAINT quotes_pkey")
+    op.execute("ALTER TABLE quotes_partitioned DROP CONSTRAINT uq_quote_asset_date")
+    op.execute("DROP INDEX IF EXISTS ix_quotes_date_brin")
+
+    op.execute("""
+        CREATE TABLE quotes (
+            id uuid NOT NULL,
+            asset_id uuid NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+            date timestamptz NOT NULL,
+            open numeric(18, 6) NOT NULL,
+            high numeric(18, 6) NOT NULL,
+            low numeric(18, 6) NOT NULL,
+            close numeric(18, 6) NOT NULL,
+            volume bigint,
+            source varchar(50),
+            created_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    op.execute(f"INSERT INTO quotes ({COLUMNS}) SELECT {COLUMNS} FROM quotes_partitioned")
+    op.execute("DROP TABLE quotes_partitioned CASCADE")
+
+    op.execute("ALTER TABLE quotes ADD CONSTRAINT quotes_pkey PRIMARY KEY (id)")
+    op.execute("ALTER TABLE quotes ADD CONSTRAINT uq_quote_asset_date UNIQUE (asset_id, date)")
+    op.execute("CREATE INDEX idx_quote_asset_date ON quotes (asset_id, date)")
+    op.execute("CREATE INDEX ix_quotes_asset_id ON quotes (asset_id)")
+    op.execute("CREATE INDEX ix_quotes_date ON quotes (date)")
+    op.execute("ANALYZE quotes")
@@ -0,0 +1,29 @@
+"""quotes (date, asset_id) index for keyset pagination
+
+Revision ID: a3c9d51f0b27
+Revises: e16eac8f6742
+Create Date: 2026-10-19 14:00:00.000000
+
+GET /api/quotes/ pagina todas las cotizaciones por cursor ordenando por
+(date desc, asset_id desc). La PK (asset_id, date) solo sirve cuando se filtra
+por activo y el BRIN no devuelve filas ordenadas: sin este índice cada página
+ordenaba el rango completo. Se crea en la tabla particionada (una copia por partición).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9d51f0b27'
+down_revision: Union[str, None] = 'e16eac8f6742'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS ix_quotes_date_asset ON quotes (date, asset_id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_quotes_date_asset")
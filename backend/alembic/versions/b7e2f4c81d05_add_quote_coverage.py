@@ -0,0 +1,48 @@
+"""add quote_coverage table
+
+Revision ID: b7e2f4c81d05
+Revises: a3c9d51f0b27
+Create Date: 2026-10-19 15:00:00.000000
+
+Cobertura de cotizaciones materializada por activo (app/models/quote_coverage.py),
+que actualizan los escritores de cotizaciones dentro de su transacción. Si la tabla
+ya existe (creada con create_all o con una migración autogenerada local) no se toca.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2f4c81d05'
+down_revision: Union[str, None] = 'a3c9d51f0b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('quote_coverage'):
+        return
+
+    op.create_table(
+        'quote_coverage',
+        sa.Column('asset_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('assets.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('required_start', sa.Date(), nullable=False),
+        sa.Column('first_date', sa.Date(), nullable=True),
+        sa.Column('last_date', sa.Date(), nullable=True),
+        sa.Column('expected_count', sa.Integer(), nullable=False),
+        sa.Column('present_count', sa.Integer(), nullable=False),
+        sa.Column('missing_count', sa.Integer(), nullable=False),
+        sa.Column('first_missing_date', sa.Date(), nullable=True),
+        sa.Column('longest_gap', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    op.create_index('ix_quote_coverage_status', 'quote_coverage', ['status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_quote_coverage_status', table_name='quote_coverage')
+    op.drop_table('quote_coverage')
@@ -0,0 +1,80 @@
+"""compact quote schema: (asset_id, date) primary key and smallint source
+
+Revision ID: e16eac8f6742
+Revises: 6180eedddfab
+Create Date: 2026-10-19 13:00:00.000000
+
+- Elimina id (UUID aleatorio) y created_at: la clave es (asset_id, date), que ya era única
+- quotes_pkey pasa a ser (asset_id, date) y sustituye a uq_quote_asset_date
+- source varchar(50) -> smallint codificado con QUOTE_SOURCES (app/models/quote.py);
+  los valores no registrados quedan como 0 ("unknown")
+
+Las columnas se eliminan antes de cambiar el tipo de source para que la reescritura
+de la tabla recupere también su espacio. La API sigue exponiendo un id por cotización
+(uuid5 determinista de asset_id + fecha, ver quote_compat_id).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e16eac8f6742'
+down_revision: Union[str, None] = '6180eedddfab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copia congelada de QUOTE_SOURCES en el momento de la migración
+SOURCES = (
+    "unknown",
+    "alpha_vantage",
+    "yfinance_auto",
+    "manual_import",
+    "provider_import",
+    "historical_repair",
+    "daily_scheduler_backfill",
+    "polygon_grouped",
+    "polygon",
+    "yfinance",
+    "finnhub",
+)
+
+
+def _encode_case(column: str) -> str:
+    whens = " ".join(f"WHEN '{name}' THEN {code}" for code, name in enumerate(SOURCES) if code)
+    return f"CASE {column} {whens} ELSE 0 END"
+
+
+def _decode_case(column: str) -> str:
+    whens = " ".join(f"WHEN {code} THEN '{name}'" for code, name in enumerate(SOURCES))
+    return f"CASE {column} {whens} ELSE 'unknown' END"
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE quotes DROP CONSTRAINT quotes_pkey")
+    op.execute("ALTER TABLE quotes DROP CONSTRAINT uq_quote_asset_date")
+    op.execute("ALTER TABLE quotes DROP COLUMN id")
+    op.execute("ALTER TABLE quotes DROP COLUMN created_at")
+
+    op.execute(f"ALTER TABLE quotes ALTER COLUMN source TYPE smallint USING {_encode_case('source')}")
+    op.execute("ALTER TABLE quotes ALTER COLUMN source SET DEFAULT 0")
+    op.execute("ALTER TABLE quotes ALTER COLUMN source SET NOT NULL")
+
+    op.execute("ALTER TABLE quotes ADD CONSTRAINT quotes_pkey PRIMARY KEY (asset_id, date)")
+    op.execute("ANALYZE quotes")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE quotes DROP CONSTRAINT quotes_pkey")
+
+    op.execute("ALTER TABLE quotes ALTER COLUMN source DROP NOT NULL")
+    op.execute("ALTER TABLE quotes ALTER COLUMN source DROP DEFAULT")
+    op.execute(f"ALTER TABLE quotes ALTER COLUMN source TYPE varchar(50) USING {_decode_case('source')}")
+
+    op.execute("ALTER TABLE quotes ADD COLUMN id uuid NOT NULL DEFAULT gen_random_uuid()")
+    op.execute("ALTER TABLE quotes ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER TABLE quotes ADD COLUMN created_at timestamptz NOT NULL DEFAULT now()")
+
+    op.execute("ALTER TABLE quotes ADD CONSTRAINT quotes_pkey PRIMARY KEY (id, date)")
+    op.execute("ALTER TABLE quotes ADD CONSTRAINT uq_quote_asset_date UNIQUE (asset_id, date)")
+    op.execute("ANALYZE quotes")
@@ -270,8 +270,7 @@ async def get_assets_for_management(
     Incluye estadísticas de sincronización y estado de cotizaciones para cada activo.
     Permite filtrar por estado específico.
     """
-    # Importar la función de coverage
-    from app.api.quotes import _check_asset_needs_import
+    from app.services.quote_coverage_service import quote_coverage_service, classify_coverage
     
     # Obtener todos los activos
     query = select(Asset).order_by(Asset.symbol)
@@ -289,9 +288,11 @@ async def get_assets_for_management(
     
     assets_data = []
     
+    # Cobertura de todos los activos en una sola consulta
+    coverage_map = await quote_coverage_service.get_coverage_map(db)
+    
     for asset in assets:
-        # Obtener información de cobertura
-        check = await _check_asset_needs_import(str(asset.id), db)
+        check = classify_coverage(coverage_map[str(asset.id)])
         
         asset_info = {
             "id": str(asset.id),
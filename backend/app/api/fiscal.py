@@ -1,5 +1,6 @@
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 from sqlalchemy import select
@@ -9,9 +10,12 @@ from app.core.database import get_db
 from app.core.security import get_current_user
 from app.models.transaction import Transaction
 from app.models.asset import Asset
+from app.models.portfolio import Portfolio
 from app.models.user import User
-from app.schemas.fiscal import FiscalReport, FiscalOperation
+from app.schemas.fiscal import FiscalReport, TaxLossHarvestReport
 from app.services.fiscal_service import fiscal_service
+from app.services import fiscal_export_service
+from app.services.tax_loss_harvesting_service import tax_loss_harvesting_service
 
 router = APIRouter()
 
@@ -53,26 +57,7 @@ async def get_fiscal_report(
             return FiscalReport(portfolio_id=portfolio_id)
 
         # Convertir a FiscalOperation
-        fiscal_ops = []
-        for t in transactions:
-            # Asegurar asset_symbol
-            asset_symbol = t.asset.symbol if t.asset else "UNKNOWN"
-            asset_currency = t.asset.currency if t.asset else "USD"
-            
-            fiscal_op = FiscalOperation(
-                id=str(t.id),
-                date=t.transaction_date,
-                type=t.transaction_type,
-                asset_id=str(t.asset_id),
-                asset_symbol=asset_symbol,
-                asset_currency=asset_currency,
-                quantity=t.quantity,
-                price=t.price,
-                fees=t.fees or 0,
-                original_price=t.price, # Guardar valor original antes de conversión
-                original_fees=t.fees or 0
-            )
-            fiscal_ops.append(fiscal_op)
+        fiscal_ops = fiscal_service.build_operations(transactions)
 
         # Calcular reporte
         report = await fiscal_service.calculate_fiscal_impact(portfolio_id, fiscal_ops, target_currency, db)
@@ -89,3 +74,103 @@ async def get_fiscal_report(
         import logging
         logging.getLogger(__name__).error(f"Error calculating fiscal report: {str(e)}")
         raise HTTPException(status_code=500, detail="Error interno al calcular el informe fiscal")
+
+
+@router.get("/harvest", response_model=TaxLossHarvestReport)
+async def get_tax_loss_harvest(
+    portfolio_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Lista los lotes FIFO abiertos con pérdida latente (precio de la tabla virtual),
+    ordenados por pérdida aprovechable en la moneda base del usuario.
+    Marca los lotes con riesgo de wash sale (regla de los 2 meses).
+    """
+    try:
+        user_id = current_user["user_id"]
+
+        if portfolio_id:
+            try:
+                UUID(portfolio_id)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid portfolio ID format")
+
+        user_result = await db.execute(select(User).where(User.id == user_id))
+        user = user_result.scalar_one_or_none()
+        base_currency = user.base_currency if user else "EUR"
+
+        return await tax_loss_harvesting_service.scan(user_id, base_currency, db, portfolio_id=portfolio_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logging.getLogger(__name__).error(f"Error scanning tax-loss harvest: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error interno al calcular las pérdidas latentes")
+
+
+@router.get("/export")
+async def export_fiscal_results(
+    portfolio_id: str,
+    format: str = Query("csv", pattern="^(csv|xlsx)$", description="Formato de exportación: csv o xlsx"),
+    year: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Exporta los resultados fiscales (ventas FIFO) de una cartera en CSV o XLSX.
+
+    Las filas se generan a medida que el motor FIFO las emite, sin construir el
+    informe completo en memoria.
+    """
+    user_id = current_user["user_id"]
+
+    try:
+        pid = UUID(portfolio_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid portfolio ID format")
+
+    # Verificar que la cartera pertenece al usuario
+    portfolio_result = await db.execute(
+        select(Portfolio).where(Portfolio.id == pid, Portfolio.user_id == user_id)
+    )
+    if not portfolio_result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Cartera no encontrada")
+
+    try:
+        user_result = await db.execute(select(User).where(User.id == user_id))
+        user = user_result.scalar_one_or_none()
+        target_currency = user.base_currency if user else "EUR"
+
+        query = (
+            select(Transaction)
+            .options(joinedload(Transaction.asset))
+            .where(Transaction.portfolio_id == pid)
+            .order_by(Transaction.transaction_date)
+        )
+        result = await db.execute(query)
+        fiscal_ops = fiscal_service.build_operations(result.scalars().all())
+
+        # La conversión de divisas necesita la BD; el FIFO posterior es puro cálculo
+        await fiscal_service.convert_operations(fiscal_ops, target_currency, db)
+    except Exception as e:
+        import logging
+        logging.getLogger(__name__).error(f"Error preparing fiscal export: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error interno al preparar la exportación fiscal")
+
+    items = fiscal_export_service.filter_year(fiscal_service.iter_fiscal_results(fiscal_ops), year)
+    suffix = f"_{year}" if year else ""
+
+    if format == "xlsx":
+        return StreamingResponse(
+            fiscal_export_service.iter_xlsx(items),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f'attachment; filename="informe_fiscal{suffix}.xlsx"'}
+        )
+
+    return StreamingResponse(
+        fiscal_export_service.iter_csv(items),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="informe_fiscal{suffix}.csv"'}
+    )
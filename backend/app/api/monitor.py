@@ -2,8 +2,15 @@
 API de Monitoreo del Sistema
 """
 from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.core.http_client import http_client
+from app.core.provider_rate_limit import provider_rate_limiter
+from app.core.response_cache import response_cache
 from app.core.security import get_current_user
 from app.services.market_data_service import market_data_service
+from app.services.price_store_service import price_store_service
+from app.services.quote_partition_service import quote_partition_service
 from app.services.scheduler_service import scheduler_service
 
 router = APIRouter()
@@ -33,5 +40,59 @@ async def get_scheduler_status(
                 "next_run": job.next_run_time.isoformat() if job.next_run_time else None
             }
             for job in scheduler_service.scheduler.get_jobs()
-        ]
+        ],
+        "daily_sync": scheduler_service.get_sync_progress()
     }
+
+@router.get("/providers", tags=["Monitor"])
+async def get_provider_limits_status(
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Límites de peticiones a proveedores externos y uso en este proceso
+    """
+    return {
+        "limits": [
+            {
+                "provider": provider,
+                "endpoint": endpoint,
+                "requests": limit.requests,
+                "per_seconds": limit.per_seconds,
+                "burst": limit.burst
+            }
+            for (provider, endpoint), limit in provider_rate_limiter.limits.items()
+        ],
+        "usage": provider_rate_limiter.get_stats()
+    }
+
+@router.get("/http", tags=["Monitor"])
+async def get_http_client_status(
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Uso del cliente HTTP compartido (pool de conexiones y peticiones por host) y de la
+    caché de histórico en disco en este proceso
+    """
+    return {
+        **http_client.get_stats(),
+        "history_cache": response_cache.get_stats()
+    }
+
+@router.get("/quote-partitions", tags=["Monitor"])
+async def get_quote_partitions(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Particiones anuales de la tabla quotes (límites, filas estimadas y tamaño)
+    """
+    return await quote_partition_service.get_partitions(db)
+
+@router.get("/price-store", tags=["Monitor"])
+async def get_price_store_status(
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Estado del almacén local de precios (lecturas, activos reconstruidos y última sincronización) en este proceso
+    """
+    return price_store_service.get_stats()
@@ -16,6 +16,7 @@ from app.models.quote import Quote
 from app.models.user import User
 from app.schemas.portfolio import PortfolioCreate, PortfolioUpdate, PortfolioResponse
 from app.services.forex_service import forex_service
+from app.services.price_store_service import price_store_service
 
 router = APIRouter()
 
@@ -253,11 +254,19 @@ async def get_portfolio_positions(
     # Batch fetch the last 2 quotes for each active asset (N+1 Optimization)
     # If target_date is set, we want the quote on or before target_date, 
     # and the one before that for daily change.
+    # Almacén de precios local primero; BD solo para los activos que no estén en él
     quotes_map = {}
-    if active_asset_ids:
+    db_asset_ids = []
+    for aid in active_asset_ids:
+        closes = price_store_service.last_closes(aid, ref_date, 2)
+        if closes is None:
+            db_asset_ids.append(aid)
+        else:
+            quotes_map[str(aid)] = closes
+    
+    if db_asset_ids:
         # Subquery to rank quotes by date per asset using row_number window function
         stmt = select(
-            Quote.id,
             Quote.asset_id,
             Quote.date,
             Quote.close,
@@ -265,7 +274,7 @@ async def get_portfolio_positions(
                 partition_by=Quote.asset_id,
                 order_by=Quote.date.desc()
             ).label("rn")
-        ).where(Quote.asset_id.in_(active_asset_ids))
+        ).where(Quote.asset_id.in_(db_asset_ids))
         
         if target_date:
             stmt = stmt.where(Quote.date <= target_date)
@@ -273,32 +282,33 @@ async def get_portfolio_positions(
         stmt = stmt.subquery()
         
         # Select only the top 2 for each asset
-        batch_result = await db.execute(select(stmt).where(stmt.c.rn <= 2))
+        batch_result = await db.execute(
+            select(stmt).where(stmt.c.rn <= 2).order_by(stmt.c.asset_id, stmt.c.rn)
+        )
         
         for row in batch_result:
             aid = str(row.asset_id)
             if aid not in quotes_map:
                 quotes_map[aid] = []
-            quotes_map[aid].append(row)
+            quotes_map[aid].append(float(row.close))
 
     # Procesar posiciones finales
     active_positions = []
     for pos in positions.values():
         if pos["quantity"] > 0:
             asset_id_str = str(pos["asset_id"])
-            asset_quotes = quotes_map.get(asset_id_str, [])
+            asset_closes = quotes_map.get(asset_id_str, [])
             
             # Obtener precio actual (Online > Historic)
             if online and is_today and pos["symbol"] in online_prices and online_prices[pos["symbol"]]:
                 current_price = online_prices[pos["symbol"]]["close"]
                 source = "online"
             else:
-                latest_quote = asset_quotes[0] if asset_quotes else None
-                current_price = float(latest_quote.close) if latest_quote else 0.0
+                current_price = asset_closes[0] if asset_closes else 0.0
                 source = "historic"
             
             # Obtener precio del día anterior (penúltima cotización o fallback a la actual)
-            previous_close = float(asset_quotes[1].close) if len(asset_quotes) > 1 else current_price
+            previous_close = asset_closes[1] if len(asset_closes) > 1 else current_price
             
             # Si estamos en una fecha histórica, el "anterior" debe ser estrictamente menor que la fecha de la cotización actual
             # para que el "resultado del día" tenga sentido.
@@ -1,26 +1,37 @@
 """
 API de Cotizaciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File, Body
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File, Body, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, tuple_, Float
 from sqlalchemy.orm import joinedload
-from typing import List, Optional
-from datetime import datetime, date, timezone, timedelta
+from typing import List, Literal, Optional
+from datetime import datetime, date, timedelta
 from app.models.transaction import Transaction
 from decimal import Decimal
 from pydantic import BaseModel
 import pandas as pd
+import base64
 import io
 import traceback
+import uuid
 from app.core.database import get_db
 from app.core.security import get_current_user
-from app.models.asset import Asset
+from app.models.asset import Asset, AssetType
 from app.models.quote import Quote
 from app.schemas.quote import QuoteResponse, QuoteResponseWithAsset
 # from app.services.finnhub_service import finnhub_service
 from app.services.quote_provider_service import quote_provider_service
-from app.core.utils import clean_decimal
+from app.services.quote_writer_service import quote_writer_service, normalize_quote_frame
+from app.services.quote_coverage_service import quote_coverage_service, classify_coverage
+from app.services.historical_repair_service import historical_repair_service
+from app.services.import_job_service import import_job_service, ImportJobConflict
+from app.services.grouped_backfill_service import grouped_backfill_service, GroupedBackfillRunning
+from app.services.price_store_service import price_store_service
+from app.services.candle_service import candle_service, CandleInterval
+from app.services.live_quote_service import live_quote_service
+from app.core.utils import clean_decimal_series, parse_volume_series
 from sqlalchemy import func
 import logging
 
@@ -34,36 +45,149 @@ class BulkImportRequest(BaseModel):
     force_refresh: bool = False
 
 
+class GroupedBackfillRequest(BaseModel):
+    asset_ids: Optional[List[str]] = None
+
+
+# rows: lista de QuoteResponseWithAsset; columnar: arrays paralelos (ver _columnar_response)
+QuoteFormat = Literal["rows", "columnar"]
+
+COLUMNAR_QUOTE_COLUMNS = (
+    Quote.asset_id,
+    Quote.date,
+    Quote.open.cast(Float).label("open"),
+    Quote.high.cast(Float).label("high"),
+    Quote.low.cast(Float).label("low"),
+    Quote.close.cast(Float).label("close"),
+    Quote.volume,
+)
+
+
+def _encode_cursor(quote_date: datetime, asset_id) -> str:
+    """Cursor opaco con la clave (date, asset_id) de la última fila de la página"""
+    raw = f"{quote_date.isoformat()}|{asset_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        quote_date, asset_id = raw.split("|")
+        return datetime.fromisoformat(quote_date), uuid.UUID(asset_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación no válido"
+        )
+
+
+def _columnar_response(rows, assets: dict, asset_column: bool = True, headers: Optional[dict] = None) -> JSONResponse:
+    """
+    Cotizaciones en columnas: un array por campo (misma posición = misma fila) y los
+    activos una sola vez en assets ({asset_id: {symbol, name}}). Las fechas son días
+    UTC (YYYY-MM-DD) y los precios float. Sin modelos Pydantic por fila.
+    
+    Con asset_column=False (consulta de un solo activo) no se repite asset_id por fila.
+    """
+    payload = {
+        "format": "columnar",
+        "count": len(rows),
+        "assets": assets,
+        "date": [row.date.date().isoformat() for row in rows],
+        "open": [row.open for row in rows],
+        "high": [row.high for row in rows],
+        "low": [row.low for row in rows],
+        "close": [row.close for row in rows],
+        "volume": [row.volume for row in rows],
+    }
+    if asset_column:
+        payload["asset_id"] = [str(row.asset_id) for row in rows]
+    return JSONResponse(payload, headers=headers)
+
+
 @router.get("/", response_model=List[QuoteResponseWithAsset])
 async def get_all_quotes(
+    response: Response,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    limit: int = 2000,
+    asset_id: Optional[uuid.UUID] = None,
+    asset_type: Optional[AssetType] = None,
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    limit: int = Query(2000, ge=1, le=5000),
+    format: QuoteFormat = Query("rows", description="rows (lista de objetos) o columnar (arrays por campo)"),
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Obtener cotizaciones de todos los activos, ordenadas por fecha descendente.
     Incluye información del activo asociado.
-    """
-    query = select(Quote).options(joinedload(Quote.asset)).order_by(Quote.date.desc())
     
+    Paginación por cursor (keyset sobre (date, asset_id)): si hay más filas, la
+    cabecera X-Next-Cursor contiene el cursor de la página siguiente. Cada página
+    continúa el índice desde la anterior, así que cuesta lo mismo que la primera.
+    """
+    conditions = []
     if start_date:
-        query = query.where(Quote.date >= start_date)
+        conditions.append(Quote.date >= start_date)
     if end_date:
-        query = query.where(Quote.date <= end_date)
+        conditions.append(Quote.date <= end_date)
+    if asset_id:
+        conditions.append(Quote.asset_id == asset_id)
+    if asset_type:
+        conditions.append(Quote.asset_id.in_(select(Asset.id).where(Asset.asset_type == asset_type)))
+    if cursor:
+        conditions.append(tuple_(Quote.date, Quote.asset_id) < tuple_(*_decode_cursor(cursor)))
+    
+    if format == "columnar":
+        query = select(*COLUMNAR_QUOTE_COLUMNS)
+    else:
+        query = select(Quote).options(joinedload(Quote.asset))
     
-    query = query.limit(limit)
+    # Una fila de más para saber si hay página siguiente
+    query = query.where(*conditions).order_by(Quote.date.desc(), Quote.asset_id.desc()).limit(limit + 1)
     
-    # Log query execution for debugging performance
-    import time
-    start_time = time.time()
     result = await db.execute(query)
-    quotes = result.scalars().all()
-    duration = time.time() - start_time
-    print(f"⚡ get_all_quotes query took {duration:.4f}s for {len(quotes)} rows")
+    rows = result.all() if format == "columnar" else result.scalars().all()
     
-    return [QuoteResponseWithAsset.model_validate(q) for q in quotes]
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = _encode_cursor(rows[-1].date, rows[-1].asset_id)
+    
+    if format == "columnar":
+        asset_ids = {row.asset_id for row in rows}
+        assets = {}
+        if asset_ids:
+            asset_rows = await db.execute(select(Asset.id, Asset.symbol, Asset.name).where(Asset.id.in_(asset_ids)))
+            assets = {str(a.id): {"symbol": a.symbol, "name": a.name} for a in asset_rows.all()}
+        return _columnar_response(rows, assets, headers=headers)
+    
+    response.headers.update(headers)
+    return [QuoteResponseWithAsset.model_validate(q) for q in rows]
+
+
+@router.get("/live")
+async def stream_live_quotes(
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Cotizaciones en tiempo real de las posiciones del usuario (Server-Sent Events).
+    
+    Eventos: "snapshot" con los precios actuales al conectar y "quotes" con
+    {symbol: cotización} cada vez que cambia el precio de alguna posición.
+    """
+    if live_quote_service.redis is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Cotizaciones en tiempo real no disponibles"
+        )
+    
+    return StreamingResponse(
+        live_quote_service.stream(current_user["user_id"]),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: que nginx no acumule los eventos
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/asset/{asset_id}", response_model=List[QuoteResponseWithAsset])
@@ -72,20 +196,25 @@ async def get_asset_quotes(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     limit: int = 2000,
+    format: QuoteFormat = Query("rows", description="rows (lista de objetos) o columnar (arrays por campo)"),
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Obtener cotizaciones de un activo"""
     # Verificar que el activo existe
     asset_result = await db.execute(select(Asset).where(Asset.id == asset_id))
-    if not asset_result.scalar_one_or_none():
+    asset = asset_result.scalar_one_or_none()
+    if not asset:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Activo no encontrado"
         )
     
-    # Construir query con joinedload para info del activo
-    query = select(Quote).options(joinedload(Quote.asset)).where(Quote.asset_id == asset_id)
+    if format == "columnar":
+        query = select(*COLUMNAR_QUOTE_COLUMNS).where(Quote.asset_id == asset_id)
+    else:
+        # Construir query con joinedload para info del activo
+        query = select(Quote).options(joinedload(Quote.asset)).where(Quote.asset_id == asset_id)
     
     if start_date:
         query = query.where(Quote.date >= start_date)
@@ -95,11 +224,51 @@ async def get_asset_quotes(
     query = query.order_by(Quote.date.desc()).limit(limit)
     
     result = await db.execute(query)
-    quotes = result.scalars().all()
     
+    if format == "columnar":
+        assets = {str(asset.id): {"symbol": asset.symbol, "name": asset.name}}
+        return _columnar_response(result.all(), assets, asset_column=False)
+    
+    quotes = result.scalars().all()
     return [QuoteResponseWithAsset.model_validate(q) for q in quotes]
 
 
+@router.get("/asset/{asset_id}/candles")
+async def get_asset_candles(
+    asset_id: uuid.UUID,
+    request: Request,
+    interval: CandleInterval = Query("week", description="week, month o quarter"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Velas OHLCV semanales, mensuales o trimestrales de un activo, agregadas en BD.
+    
+    La respuesta lleva un ETag con la versión de datos del activo: mientras no se
+    ingesten cotizaciones nuevas el cliente recibe 304 y el servidor la sirve desde Redis.
+    """
+    asset_result = await db.execute(select(Asset.id).where(Asset.id == asset_id))
+    if asset_result.scalar_one_or_none() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Activo no encontrado"
+        )
+    
+    version = await price_store_service.get_data_version(asset_id)
+    headers = {}
+    # Sin Redis las versiones no avanzan: no se puede validar la copia del cliente
+    if price_store_service.redis is not None:
+        etag = f'"{candle_service.cache_key(asset_id, interval, start_date, end_date, version)}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    content = await candle_service.get_candles_json(db, asset_id, interval, start_date, end_date, version)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
 @router.post("/asset/{asset_id}/fetch-history", status_code=status.HTTP_202_ACCEPTED)
 async def fetch_historical_quotes(
     asset_id: str,
@@ -257,88 +426,37 @@ async def import_quotes_from_excel(
         # Renombrar columnas existentes
         df = df.rename(columns={c: column_mapping[c] for c in df.columns if c in column_mapping})
         
-        quotes_created = 0
-        quotes_skipped = 0
-        errors = []
+        # Filas sin fecha se ignoran (filas vacías/pies de tabla del Excel)
+        df = df[df['date'].notna() & (df['date'].astype(str).str.strip() != '')]
         
-        for index, row in df.iterrows():
-            try:
-                # 1. Procesar Fecha
-                raw_date = row['date']
-                if pd.isna(raw_date):
-                    continue
-                
-                if isinstance(raw_date, str):
-                    try:
-                        # Formato común DD/MM/YYYY
-                        quote_date = datetime.strptime(raw_date, '%d/%m/%Y')
-                    except ValueError:
-                        quote_date = pd.to_datetime(raw_date)
-                else:
-                    quote_date = pd.to_datetime(raw_date)
-                
-                # Normalizar a medianoche UTC
-                quote_date = datetime.combine(quote_date.date(), datetime.min.time(), tzinfo=timezone.utc)
-                
-
-                close_val = clean_decimal(row.get('close', 0))
-                open_val = clean_decimal(row.get('open', close_val))
-                high_val = clean_decimal(row.get('high', close_val))
-                low_val = clean_decimal(row.get('low', close_val))
-                
-                # 3. Procesar Volumen (manejar M, K)
-                def parse_volume(val):
-                    if pd.isna(val) or val == '': return 0
-                    if isinstance(val, (int, float)): return int(val)
-                    s = str(val).upper().replace(',', '.').strip()
-                    multiplier = 1
-                    if 'M' in s:
-                        multiplier = 1000000
-                        s = s.replace('M', '')
-                    elif 'K' in s:
-                        multiplier = 1000
-                        s = s.replace('K', '')
-                    
-                    try:
-                        return int(float(s) * multiplier)
-                    except:
-                        return 0
-
-                volume_val = parse_volume(row.get('volume', 0))
-                
-                # 4. Verificar duplicados
-                existing = await db.execute(
-                    select(Quote).where(
-                        and_(
-                            Quote.asset_id == asset_id,
-                            Quote.date == quote_date
-                        )
-                    )
-                )
-                
-                if existing.scalar_one_or_none():
-                    quotes_skipped += 1
-                    continue
-                
-                # 5. Crear cotización
-                new_quote = Quote(
-                    asset_id=asset_id,
-                    date=quote_date,
-                    open=open_val,
-                    high=high_val,
-                    low=low_val,
-                    close=close_val,
-                    volume=volume_val,
-                    source="manual_import"
-                )
-                db.add(new_quote)
-                quotes_created += 1
-                
-            except Exception as e:
-                errors.append(f"Fila {index + 2}: {str(e)}")
-                quotes_skipped += 1
+        # 1. Fechas: formato común DD/MM/YYYY y, si no encaja, parseo genérico celda a celda
+        #    (como pd.to_datetime por valor: las fechas ambiguas se leen mes primero)
+        raw_dates = df['date']
+        dates = pd.to_datetime(raw_dates, format='%d/%m/%Y', errors='coerce')
+        unparsed = dates.isna()
+        if unparsed.any():
+            dates[unparsed] = pd.to_datetime(raw_dates[unparsed], format='mixed', errors='coerce')
+        
+        # 2. Precios (formato español) y volumen (M, K), por columnas
+        prices = pd.DataFrame({'date': dates, 'close': clean_decimal_series(df['close'])}, index=df.index)
+        for col in ('open', 'high', 'low'):
+            if col in df.columns:
+                prices[col] = clean_decimal_series(df[col])
+        prices['volume'] = parse_volume_series(df['volume']) if 'volume' in df.columns else 0
+        
+        invalid = prices['date'].isna() | prices['close'].isna()
+        errors = [f"Fila {index + 2}: fecha o precio de cierre no válido" for index in prices.index[invalid]]
+        quotes_skipped = len(errors)
+        
+        # 3. Normalizar (medianoche UTC, OHLC completos) e insertar en bloque
+        # (los duplicados por fecha se omiten en BD)
+        frame = normalize_quote_frame(prices[~invalid], date_column='date')
+        counts = await quote_writer_service.upsert_quote_frame(db, frame, asset_id, source="manual_import")
+        quotes_created = counts["inserted"]
+        quotes_skipped += counts["skipped"]
         
         await db.commit()
+        await price_store_service.publish_changes(counts["by_asset"])
         
         return {
             "success": True,
@@ -364,7 +482,6 @@ async def _fetch_and_save_quotes(asset_id: str, symbol: str, full_history: bool
     """
     import logging
     from app.core.database import AsyncSessionLocal
-    from app.services.quote_provider_service import quote_provider
     
     logger = logging.getLogger(__name__)
     logger.info(f"🔄 Iniciando fetch de cotizaciones para {symbol} (full_history={full_history})")
@@ -377,11 +494,11 @@ async def _fetch_and_save_quotes(asset_id: str, symbol: str, full_history: bool
     if full_history:
         # Pide histórico largo (ej. 500 días o más si se configura)
         # El provider maneja la lógica interna de fechas por defecto o explícitas
-        quotes_data = await quote_provider.get_historical_quotes(symbol, use_polygon=True)
+        quotes_data = await quote_provider_service.get_historical_quotes(symbol, use_polygon=True)
     else:
         # Pide últimos días (ej. 5d)
         from datetime import date, timedelta
-        quotes_data = await quote_provider.get_historical_quotes(
+        quotes_data = await quote_provider_service.get_historical_quotes(
             symbol, 
             start_date=date.today() - timedelta(days=5),
             end_date=date.today(),
@@ -396,41 +513,14 @@ async def _fetch_and_save_quotes(asset_id: str, symbol: str, full_history: bool
     
     async with AsyncSessionLocal() as db:
         try:
-            for quote_data in quotes_data:
-                # Verificar si ya existe (comparar solo fecha, no timestamp completo)
-                from datetime import date as date_type
-                quote_date = quote_data["date"]
-                if isinstance(quote_date, datetime):
-                    # Normalizar a medianoche para comparación
-                    quote_date = datetime.combine(quote_date.date(), datetime.min.time())
-                
-                existing = await db.execute(
-                    select(Quote).where(
-                        and_(
-                            Quote.asset_id == asset_id,
-                            Quote.date == quote_date
-                        )
-                    )
-                )
-                
-                if existing.scalar_one_or_none():
-                    continue  # Ya existe, skip
-                
-                new_quote = Quote(
-                    asset_id=asset_id,
-                    date=quote_date,
-                    open=quote_data["open"],
-                    high=quote_data["high"],
-                    low=quote_data["low"],
-                    close=quote_data["close"],
-                    volume=quote_data["volume"],
-                    source="provider_import"
-                )
-                
-                db.add(new_quote)
-            
+            counts = await quote_writer_service.upsert_quotes(
+                db,
+                ({**quote_data, "asset_id": asset_id} for quote_data in quotes_data),
+                source="provider_import"
+            )
             await db.commit()
-            logger.info(f"✅ Cotizaciones guardadas exitosamente para {symbol}")
+            await price_store_service.publish_changes(counts["by_asset"])
+            logger.info(f"✅ Cotizaciones guardadas exitosamente para {symbol} ({counts['inserted']} nuevas)")
             
         except Exception as e:
             await db.rollback()
@@ -443,97 +533,10 @@ async def _get_asset_quote_coverage(asset_id: str, db: AsyncSession) -> dict:
     Obtener información detallada sobre la cobertura de cotizaciones de un activo
     identificando huecos reales basados en las transacciones del usuario.
     """
-    from app.models.asset import Asset, AssetType
-    from app.models.transaction import Transaction
-    from datetime import date, timedelta, timezone, datetime
-    
-    # 1. Obtener detalles del activo
-    asset_result = await db.execute(select(Asset).where(Asset.id == asset_id))
-    asset = asset_result.scalar_one_or_none()
-    if not asset:
+    coverage = await quote_coverage_service.get_coverage(db, asset_id)
+    if coverage is None:
         return {"has_quotes": False, "is_complete": False}
-
-    # 2. Determinar la fecha de inicio necesaria (primera TRX - 7 días, o 1 año)
-    tx_result = await db.execute(
-        select(func.min(Transaction.transaction_date)).where(Transaction.asset_id == asset_id)
-    )
-    first_tx_date = tx_result.scalar()
-    
-    today = date.today()
-    if first_tx_date:
-        required_start = first_tx_date.date() - timedelta(days=7)
-    else:
-        required_start = today - timedelta(days=365)
-    
-    # 3. Obtener todas las cotizaciones existentes en ese rango
-    quotes_result = await db.execute(
-        select(Quote.date).where(
-            and_(
-                Quote.asset_id == asset_id,
-                Quote.date >= datetime.combine(required_start, datetime.min.time()).replace(tzinfo=timezone.utc)
-            )
-        ).order_by(Quote.date.asc())
-    )
-    existing_dates = {row[0].date() for row in quotes_result.all()}
-    
-    # 4. Detectar huecos
-    missing_days = []
-    curr = required_start
-    is_crypto = (asset.asset_type == AssetType.CRYPTO)
-    
-    while curr < today:
-        # Si es Crypto, 24/7. Si no, solo L-V.
-        if is_crypto or curr.weekday() < 5:
-            if curr not in existing_dates:
-                missing_days.append(curr)
-        curr += timedelta(days=1)
-    
-    # 5. Calcular métricas finales
-    total_quotes = len(existing_dates)
-    first_date = min(existing_dates) if existing_dates else None
-    last_date = max(existing_dates) if existing_dates else None
-    days_since_last_update = (today - last_date).days if last_date else None
-    
-    # Calcular porcentaje de cobertura sobre días esperados
-    expected_count = total_quotes + len(missing_days)
-    coverage_ratio = total_quotes / expected_count if expected_count > 0 else 0
-    
-    # Un activo está completo si:
-    # 1. Tiene más del 95% de los días esperados (permite festivos aislados)
-    # 2. No tiene huecos grandes (bloques de >5 días seguidos faltantes)
-    # 3. El último dato es reciente (< 5 días para permitir fines de semana largos)
-    
-    max_consecutive_missing = 0
-    if missing_days:
-        consecutive = 1
-        for i in range(1, len(missing_days)):
-            if (missing_days[i] - missing_days[i-1]).days <= 3: # Permitir fin de semana en medio
-                consecutive += 1
-            else:
-                max_consecutive_missing = max(max_consecutive_missing, consecutive)
-                consecutive = 1
-        max_consecutive_missing = max(max_consecutive_missing, consecutive)
-
-    has_large_gaps = max_consecutive_missing > 5
-    is_up_to_date = days_since_last_update < 5 if days_since_last_update is not None else False
-    
-    # Si es Crypto, somos más estrictos con el ratio porque cotiza 24/7
-    min_ratio = 0.99 if is_crypto else 0.94
-    is_complete = coverage_ratio >= min_ratio and not has_large_gaps and is_up_to_date
-    
-    return {
-        "has_quotes": total_quotes > 0,
-        "total_quotes": total_quotes,
-        "first_date": first_date,
-        "last_date": last_date,
-        "days_since_last_update": days_since_last_update,
-        "required_start_date": required_start,
-        "missing_days_count": len(missing_days),
-        "coverage_ratio": round(coverage_ratio, 4),
-        "has_gaps": has_large_gaps or coverage_ratio < min_ratio,
-        "is_complete": is_complete,
-        "needs_update": days_since_last_update > 7 if days_since_last_update is not None else True
-    }
+    return coverage
 
 
 async def _check_asset_needs_import(asset_id: str, db: AsyncSession) -> dict:
@@ -546,37 +549,7 @@ async def _check_asset_needs_import(asset_id: str, db: AsyncSession) -> dict:
         - coverage: dict (información de cobertura)
     """
     coverage = await _get_asset_quote_coverage(asset_id, db)
-    
-    if not coverage["has_quotes"]:
-        return {
-            "needs_import": True,
-            "reason": "no_data",
-            "message": "Sin cotizaciones",
-            "coverage": coverage
-        }
-    
-    if not coverage["is_complete"]:
-        return {
-            "needs_import": True,
-            "reason": "incomplete_data",
-            "message": f"Datos parciales ({coverage['total_quotes']} cotizaciones)",
-            "coverage": coverage
-        }
-    
-    if coverage["needs_update"]:
-        return {
-            "needs_import": True,
-            "reason": "outdated",
-            "message": f"Desactualizado ({coverage['days_since_last_update']} días)",
-            "coverage": coverage
-        }
-    
-    return {
-        "needs_import": False,
-        "reason": "complete",
-        "message": f"Completo ({coverage['total_quotes']} cotizaciones)",
-        "coverage": coverage
-    }
+    return classify_coverage(coverage)
 
 
 @router.get("/asset/{asset_id}/coverage")
@@ -629,8 +602,11 @@ async def get_all_assets_coverage(
         "complete": 0
     }
     
+    # Cobertura de todos los activos en una sola consulta
+    coverage_map = await quote_coverage_service.get_coverage_map(db)
+    
     for asset in assets:
-        check = await _check_asset_needs_import(str(asset.id), db)
+        check = classify_coverage(coverage_map[str(asset.id)])
         
         coverage_list.append({
             "asset_id": str(asset.id),
@@ -654,7 +630,6 @@ async def get_all_assets_coverage(
 @router.post("/import/bulk-historical", status_code=status.HTTP_202_ACCEPTED)
 async def import_bulk_historical(
     request: BulkImportRequest,
-    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -665,8 +640,9 @@ async def import_bulk_historical(
         - asset_ids: Lista opcional de IDs de activos (si no se especifica, procesa todos)
         - force_refresh: Si es True, reimporta incluso si ya tiene datos completos
     
+    Crea un trabajo en la cola persistente de importación (Redis), que procesan los
+    workers de importación. El progreso se consulta en /import/jobs/{job_id}.
     El proceso verifica la cobertura de cada activo y solo importa los que necesitan datos.
-    Solo procesa activos con sync_enabled=True.
     Usa Polygon.io (hasta 500 días) como prioridad, con fallback a yfinance.
     """
     # Obtener activos a procesar (solo los que tienen sync_enabled=True)
@@ -688,149 +664,136 @@ async def import_bulk_historical(
             detail="No se encontraron activos para procesar"
         )
     
-    # Agregar tarea en background
-    background_tasks.add_task(
-        _bulk_import_historical,
-        assets=[{"id": str(a.id), "symbol": a.symbol, "asset_type": a.asset_type} for a in assets],
-        force_refresh=request.force_refresh
-    )
+    try:
+        job = await import_job_service.create_job(
+            assets=[{"id": str(a.id), "symbol": a.symbol, "asset_type": a.asset_type} for a in assets],
+            force_refresh=request.force_refresh,
+            user_id=current_user["user_id"]
+        )
+    except ImportJobConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Ya hay una importación masiva en curso (trabajo {e.job_id})"
+        )
     
     return {
         "message": f"Importación masiva iniciada para {len(assets)} activos",
+        "job_id": job["id"],
         "total_assets": len(assets),
         "force_refresh": request.force_refresh
     }
 
 
-async def _bulk_import_historical(assets: List[dict], force_refresh: bool = False):
+@router.get("/import/jobs")
+async def list_import_jobs(
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Últimos trabajos de importación masiva y el trabajo activo (si lo hay)
+    """
+    return {
+        "active_job_id": await import_job_service.get_active_job_id(),
+        "jobs": await import_job_service.list_jobs()
+    }
+
+
+@router.get("/import/jobs/{job_id}")
+async def get_import_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Estado y progreso de un trabajo de importación masiva
+    """
+    job = await import_job_service.get_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo de importación no encontrado"
+        )
+    return job
+
+
+@router.get("/import/jobs/{job_id}/assets")
+async def get_import_job_assets(
+    job_id: str,
+    state: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Estado por activo de un trabajo de importación (pending, running, done, skipped, failed)
     """
-    Función helper para importación masiva en background con REPARACIÓN DE LAGUNAS.
+    job = await import_job_service.get_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo de importación no encontrado"
+        )
+    return {
+        "job_id": job_id,
+        "assets": await import_job_service.get_job_assets(job_id, state)
+    }
+
+
+@router.post("/import/jobs/{job_id}/cancel")
+async def cancel_import_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Cancelar un trabajo de importación (los activos en curso terminan, el resto se descarta)
+    """
+    job = await import_job_service.cancel_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo de importación no encontrado"
+        )
+    return job
+
+
+@router.post("/import/grouped-backfill", status_code=status.HTTP_202_ACCEPTED)
+async def start_grouped_backfill(
+    background_tasks: BackgroundTasks,
+    request: Optional[GroupedBackfillRequest] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Reparar lagunas con los agregados diarios agrupados de Polygon.io
     
-    Para cada activo:
-    1. Determina el rango de fechas necesario (desde la primera transacción o hace 2 años).
-    2. Identifica días hábiles faltantes (lagunas).
-    3. Descarga y rellena solo lo necesario.
+    Una petición por día para todos los activos de EEUU y crypto a la vez
+    (en lugar de una por activo). Los activos de otros mercados no se tocan:
+    se reparan con /import/bulk-historical.
     """
-    import asyncio
-    from datetime import datetime, date, timezone, timedelta
-    from app.core.database import AsyncSessionLocal
-    from app.models.transaction import Transaction
-    from sqlalchemy import func
+    asset_ids = request.asset_ids if request else None
+    try:
+        await grouped_backfill_service.start(asset_ids, current_user["user_id"])
+    except GroupedBackfillRunning:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ya hay un backfill agrupado de Polygon en curso"
+        )
     
-    logger.info(f"🚀 Iniciando importación y REPARACIÓN de {len(assets)} activos")
+    background_tasks.add_task(grouped_backfill_service.run, asset_ids)
     
-    async with AsyncSessionLocal() as db:
-        processed = 0
-        repaired_assets = 0
-        total_quotes_saved = 0
-        errors = []
-        
-        for asset_data in assets:
-            asset_id = asset_data["id"]
-            symbol = asset_data["symbol"]
-            
-            try:
-                # 1. Determinar rango de reparación
-                # Usar la lógica de cobertura centralizada para ser consistentes
-                coverage = await _get_asset_quote_coverage(asset_id, db)
-                start_date = coverage["required_start_date"]
-                
-                logger.info(f"🔎 Analizando {symbol} desde {start_date} hasta hoy (Reparación)")
-                
-                # 2. Obtener cotizaciones existentes para detectar lagunas
-                existing_result = await db.execute(
-                    select(Quote.date).where(
-                        and_(Quote.asset_id == asset_id, Quote.date >= datetime.combine(start_date, datetime.min.time()).replace(tzinfo=timezone.utc))
-                    )
-                )
-                existing_dates = {r[0].date() for r in existing_result.all()}
-                
-                # 3. Identificar días faltantes
-                missing_days = []
-                curr = start_date
-                today = date.today()
-                asset_type = asset_data.get("asset_type")
-                
-                # Importar AssetType para comparación si no está
-                from app.models.asset import AssetType
-                
-                while curr < today:
-                    # Si es Crypto, incluimos fines de semana. Si no, solo L-V.
-                    is_crypto = (asset_type == AssetType.CRYPTO)
-                    if is_crypto or curr.weekday() < 5:
-                        if curr not in existing_dates:
-                            missing_days.append(curr)
-                    curr += timedelta(days=1)
-                
-                if not missing_days and not force_refresh:
-                    logger.info(f"✅ {symbol} no tiene lagunas detectadas. Saltando.")
-                    processed += 1
-                    continue
-                
-                logger.info(f"📥 {symbol} tiene {len(missing_days)} lagunas. Intentando descarga...")
-                
-                # 4. Descarga de datos MULTI-FUENTE (Usando Facade)
-                quotes_data = await quote_provider_service.get_historical_quotes(
-                    symbol, 
-                    start_date=start_date,
-                    end_date=today
-                )
-                
-                if not quotes_data:
-                    logger.warning(f"❌ Sin datos disponibles en ningún feed para {symbol}")
-                    errors.append(f"{symbol}: Sin datos en Feeds")
-                    processed += 1
-                    continue
-                
-                # 5. Guardar lo que falte
-                saved_count = 0
-                for quote_data in quotes_data:
-                    q_date = quote_data["date"]
-                    # Normalizar a fecha pura para comparación
-                    q_date_only = q_date.date() if isinstance(q_date, datetime) else q_date
-                    
-                    if q_date_only not in existing_dates or force_refresh:
-                        # Asegurar datetime completo para la base de datos en UTC
-                        db_date = datetime.combine(q_date_only, datetime.min.time()).replace(tzinfo=timezone.utc)
-                        
-                        new_quote = Quote(
-                            asset_id=asset_id,
-                            date=db_date,
-                            open=quote_data["open"],
-                            high=quote_data["high"],
-                            low=quote_data["low"],
-                            close=quote_data["close"],
-                            volume=quote_data.get("volume", 0),
-                            source="historical_repair"
-                        )
-                        db.add(new_quote)
-                        saved_count += 1
-                        # Evitar duplicar en el mismo lote si el feed trae repetidos
-                        existing_dates.add(q_date_only) 
-                
-                await db.commit()
-                logger.info(f"✅ {symbol}: Reparado con {saved_count} nuevas cotizaciones")
-                if saved_count > 0:
-                    repaired_assets += 1
-                    total_quotes_saved += saved_count
-                processed += 1
-                
-                # Rate limiting suave para no bloquear el API
-                await asyncio.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"❌ Error reparando {symbol}: {str(e)}")
-                errors.append(f"{symbol}: {str(e)}")
-                await db.rollback()
-                processed += 1
-        
-        logger.info(f"""
-        ═══════════════════════════════════════
-        📊 REPARACIÓN HISTÓRICA COMPLETADA
-        ═══════════════════════════════════════
-        Activos procesados: {processed}
-        Activos con lagunas reparadas: {repaired_assets}
-        Total cotizaciones añadidas: {total_quotes_saved}
-        Errores: {len(errors)}
-        ═══════════════════════════════════════
-        """)
+    return {
+        "message": "Backfill agrupado de Polygon iniciado en segundo plano"
+    }
+
+
+@router.get("/import/grouped-backfill")
+async def get_grouped_backfill_status(
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Progreso del último backfill agrupado de Polygon
+    """
+    return await grouped_backfill_service.get_progress()
+
+
+async def _bulk_import_historical(assets: List[dict], force_refresh: bool = False):
+    """
+    Reparación masiva en el proceso actual, sin pasar por la cola de trabajos
+    (usada por los scripts de mantenimiento de backend/scripts).
+    """
+    await historical_repair_service.run(assets, force_refresh=force_refresh)
@@ -26,15 +26,48 @@ class Settings(BaseSettings):
     
     # Alpha Vantage (Deprecated - use Polygon.io instead)
     ALPHA_VANTAGE_API_KEY: str
-    ALPHA_VANTAGE_RATE_LIMIT: int = 5
+    ALPHA_VANTAGE_RATE_LIMIT: int = 5  # Llamadas por día
     
     # Polygon.io (Reemplazo de Alpha Vantage para históricos)
     POLYGON_API_KEY: str
+    POLYGON_REQUESTS_PER_MINUTE: int = 5
     
     # Finnhub (Cotizaciones en tiempo real)
     FINNHUB_API_KEY: str
+    FINNHUB_REQUESTS_PER_MINUTE: int = 60
     QUOTE_UPDATE_INTERVAL_MINUTES: int = 60
     
+    # Yahoo Finance (sin límite publicado)
+    YAHOO_REQUESTS_PER_MINUTE: int = 120
+    
+    # Cliente HTTP compartido para proveedores de datos (por proceso)
+    HTTP_CLIENT_HTTP2: bool = True
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 50
+    HTTP_CLIENT_MAX_PER_HOST: int = 10
+    HTTP_CLIENT_TIMEOUT_SECONDS: float = 10.0
+    
+    # Caché en disco de descargas históricas (rangos cerrados no caducan)
+    HISTORY_CACHE_ENABLED: bool = True
+    HISTORY_CACHE_DIR: str = "/app/.cache/history"
+    HISTORY_CACHE_MAX_MB: int = 512
+    HISTORY_CACHE_OPEN_TTL_SECONDS: int = 900
+    
+    # Almacén local columnar de precios (ficheros memory-mapped por activo)
+    PRICE_STORE_ENABLED: bool = True
+    PRICE_STORE_DIR: str = "/app/.cache/prices"
+    
+    # Sincronización diaria (cierre): workers concurrentes y límite por proveedor
+    SYNC_WORKERS: int = 8
+    SYNC_YAHOO_CONCURRENCY: int = 4
+    
+    # Importación histórica masiva (cola en Redis): descargas en paralelo por proceso
+    # y si los procesos del API también consumen la cola (False con worker dedicado)
+    IMPORT_WORKERS: int = 4
+    IMPORT_WORKERS_IN_API: bool = True
+    # Pipeline descarga -> escritor: activos descargados en espera y filas por lote de escritura
+    IMPORT_QUEUE_SIZE: int = 16
+    IMPORT_WRITER_BATCH_ROWS: int = 5000
+    
     # Admin user (OBLIGATORIO - sin valores por defecto por seguridad)
     ADMIN_USERNAME: str
     ADMIN_EMAIL: str
@@ -0,0 +1,145 @@
+"""
+Cliente HTTP asíncrono compartido para los servicios de datos de mercado.
+
+Un único httpx.AsyncClient por proceso (HTTP/2, keep-alive, timeouts comunes)
+creado en el arranque y cerrado en el shutdown: las llamadas a Polygon, Finnhub,
+Alpha Vantage y los fallbacks de Yahoo reutilizan conexiones en lugar de pagar
+TCP + TLS en cada petición y no ocupan hilos del thread pool.
+
+httpx limita conexiones globalmente; el límite por host se aplica con un
+semáforo por host. Las métricas (peticiones, en vuelo, errores, latencia por
+host y estado del pool) se exponen en /api/monitor/http.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """httpx.AsyncClient de la aplicación con límites por host y métricas"""
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.stats: Dict[str, Dict] = defaultdict(lambda: {
+            "requests": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "waiting": 0,
+            "seconds": 0.0,
+            "status": defaultdict(int),
+        })
+
+    async def connect(self):
+        """Crea el cliente (startup de la aplicación o de un proceso dedicado)"""
+        if self.client is not None and not self.client.is_closed:
+            return
+        self.client = httpx.AsyncClient(
+            http2=settings.HTTP_CLIENT_HTTP2,
+            timeout=httpx.Timeout(settings.HTTP_CLIENT_TIMEOUT_SECONDS, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                keepalive_expiry=30.0,
+            ),
+            follow_redirects=True,
+        )
+        logger.info(
+            f"🌐 Cliente HTTP compartido iniciado (HTTP/2={settings.HTTP_CLIENT_HTTP2}, "
+            f"{settings.HTTP_CLIENT_MAX_CONNECTIONS} conexiones, {settings.HTTP_CLIENT_MAX_PER_HOST} por host)"
+        )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Petición con el cliente compartido (se crea bajo demanda si no hubo startup,
+        p. ej. en scripts). Propaga las excepciones de httpx.
+        """
+        if self.client is None or self.client.is_closed:
+            await self.connect()
+
+        host = httpx.URL(url).host
+        stats = self.stats[host]
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(settings.HTTP_CLIENT_MAX_PER_HOST)
+
+        stats["waiting"] += 1
+        async with limit:
+            stats["waiting"] -= 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            started = time.monotonic()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.HTTPError:
+                stats["errors"] += 1
+                raise
+            finally:
+                stats["in_flight"] -= 1
+                stats["requests"] += 1
+                stats["seconds"] += time.monotonic() - started
+
+        stats["status"][response.status_code] += 1
+        return response
+
+    def get_stats(self) -> Dict:
+        """Uso por host y estado del pool de conexiones de este proceso"""
+        return {
+            "connected": self.client is not None and not self.client.is_closed,
+            "limits": {
+                "max_connections": settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                "max_per_host": settings.HTTP_CLIENT_MAX_PER_HOST,
+                "http2": settings.HTTP_CLIENT_HTTP2,
+            },
+            "pool": self._pool_stats(),
+            "hosts": {
+                host: {
+                    **{k: v for k, v in values.items() if k not in ("seconds", "status")},
+                    "avg_seconds": round(values["seconds"] / values["requests"], 3) if values["requests"] else 0.0,
+                    "status": dict(values["status"]),
+                }
+                for host, values in self.stats.items()
+            },
+        }
+
+    def _pool_stats(self) -> Optional[Dict]:
+        """Conexiones abiertas del pool de httpcore (inspección best-effort)"""
+        if self.client is None or self.client.is_closed:
+            return None
+        try:
+            connections = self.client._transport._pool.connections
+        except AttributeError:
+            return None
+
+        pool = {"connections": len(connections), "idle": 0, "active": 0, "http2": 0, "by_host": defaultdict(int)}
+        for connection in connections:
+            if connection.is_idle():
+                pool["idle"] += 1
+            else:
+                pool["active"] += 1
+            info = connection.info()
+            if "HTTP/2" in info:
+                pool["http2"] += 1
+            pool["by_host"][info.split(",")[0]] += 1
+        pool["by_host"] = dict(pool["by_host"])
+        return pool
+
+
+http_client = HttpClient()
@@ -0,0 +1,251 @@
+"""
+Rate limiting compartido para las llamadas a proveedores de datos externos.
+
+Token bucket en Redis (script Lua atómico, reloj del propio Redis) por
+proveedor y endpoint: todos los procesos (workers de uvicorn, scheduler,
+worker de importación) consumen del mismo cubo, así que el límite del
+proveedor se respeta globalmente y no por proceso.
+
+acquire() reserva el turno y devuelve cuando toca: si no hay tokens, el cubo
+queda en negativo y la llamada espera (asyncio.sleep) justo hasta su turno.
+Así el ritmo se mantiene en el techo permitido sin sobrepasarlo y sin sondeos.
+
+Si Redis no está disponible (scripts sin conexión, caída) se usa un cubo
+local equivalente en el proceso.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "provider_rate"
+ANY_ENDPOINT = "*"
+
+# ARGV: tokens/segundo, capacidad, tokens pedidos, espera máxima (ms, -1 sin límite), penalización (ms)
+# Devuelve {concedido (0/1), espera en ms}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local max_wait_ms = tonumber(ARGV[4])
+local penalty_ms = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+
+if penalty_ms > 0 then
+    tokens = math.min(tokens, -penalty_ms * rate / 1000)
+end
+
+local wait_ms = 0
+if tokens < requested then
+    wait_ms = math.ceil((requested - tokens) * 1000 / rate)
+end
+
+local granted = 1
+if max_wait_ms >= 0 and wait_ms > max_wait_ms then
+    granted = 0
+else
+    tokens = tokens - requested
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+-- Sin actividad, el cubo caduca cuando ya estaría lleno (equivale a no existir)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) * 1000 / rate) + 1000)
+return {granted, wait_ms}
+"""
+
+
+@dataclass(frozen=True)
+class ProviderLimit:
+    """requests cada per_seconds segundos, con ráfagas de hasta burst peticiones"""
+    requests: int
+    per_seconds: float
+    burst: int = 1
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.per_seconds
+
+
+class ProviderRateLimitTimeout(Exception):
+    """No hay turno disponible dentro de la espera máxima indicada"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Límite de peticiones de {provider} alcanzado (reintentar en {retry_after:.0f}s)")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def default_limits() -> Dict[Tuple[str, str], ProviderLimit]:
+    """
+    Límites por (proveedor, endpoint). El endpoint "*" aplica a todos los
+    endpoints del proveedor sin entrada propia (y comparten cubo).
+    Con burst=1 el ritmo es uniforme y nunca supera el límite en ninguna ventana.
+    """
+    return {
+        # Plan gratuito: 5 peticiones/minuto por API key (todos los endpoints)
+        ("polygon", ANY_ENDPOINT): ProviderLimit(settings.POLYGON_REQUESTS_PER_MINUTE, 60),
+        # Plan gratuito: 60 peticiones/minuto
+        ("finnhub", ANY_ENDPOINT): ProviderLimit(settings.FINNHUB_REQUESTS_PER_MINUTE, 60),
+        # Plan gratuito: llamadas por DÍA. Las llamadas usan timeout=0: la cuota completa
+        # tiene que estar disponible de golpe (burst), no goteando un token cada 86400/N s
+        ("alpha_vantage", ANY_ENDPOINT): ProviderLimit(
+            settings.ALPHA_VANTAGE_RATE_LIMIT, 24 * 3600, burst=settings.ALPHA_VANTAGE_RATE_LIMIT
+        ),
+        # Sin límite publicado: margen conservador para evitar bloqueos temporales
+        ("yahoo", ANY_ENDPOINT): ProviderLimit(settings.YAHOO_REQUESTS_PER_MINUTE, 60, burst=10),
+    }
+
+
+class ProviderRateLimiter:
+    """Token bucket distribuido (Redis) por proveedor/endpoint"""
+
+    def __init__(self, limits: Optional[Dict[Tuple[str, str], ProviderLimit]] = None):
+        self._limits = limits
+        # Cubos locales de respaldo: bucket -> [tokens, instante monotonic]
+        self._local: Dict[str, list] = {}
+        self._local_lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, Dict] = defaultdict(
+            lambda: {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "rejected": 0, "penalties": 0, "local": 0}
+        )
+
+    @property
+    def limits(self) -> Dict[Tuple[str, str], ProviderLimit]:
+        if self._limits is None:
+            self._limits = default_limits()
+        return self._limits
+
+    def _resolve(self, provider: str, endpoint: str) -> Optional[Tuple[str, ProviderLimit]]:
+        for key in ((provider, endpoint), (provider, ANY_ENDPOINT)):
+            limit = self.limits.get(key)
+            if limit is not None:
+                return f"{KEY_PREFIX}:{key[0]}:{key[1]}", limit
+        return None
+
+    async def acquire(
+        self,
+        provider: str,
+        endpoint: str = ANY_ENDPOINT,
+        tokens: int = 1,
+        timeout: Optional[float] = None
+    ) -> float:
+        """
+        Espera (sin bloquear el event loop) hasta tener permiso para llamar al proveedor.
+
+        Args:
+            timeout: Espera máxima aceptable en segundos (None = esperar lo necesario)
+
+        Returns:
+            Segundos esperados
+
+        Raises:
+            ProviderRateLimitTimeout: si el turno llega más tarde que timeout (no se consume)
+        """
+        resolved = self._resolve(provider, endpoint)
+        if resolved is None:
+            return 0.0
+        bucket, limit = resolved
+
+        max_wait_ms = -1 if timeout is None else int(timeout * 1000)
+        granted, wait_ms = await self._reserve(bucket, limit, tokens, max_wait_ms, 0)
+        stats = self.stats[bucket]
+        if not granted:
+            stats["rejected"] += 1
+            raise ProviderRateLimitTimeout(provider, wait_ms / 1000)
+
+        stats["acquired"] += 1
+        if wait_ms > 0:
+            stats["waited"] += 1
+            stats["wait_seconds"] += wait_ms / 1000
+            logger.debug(f"⏳ Rate limit {provider}/{endpoint}: esperando {wait_ms / 1000:.1f}s")
+            await asyncio.sleep(wait_ms / 1000)
+        return wait_ms / 1000
+
+    async def penalize(self, provider: str, seconds: float, endpoint: str = ANY_ENDPOINT):
+        """
+        Vacía el cubo durante `seconds` (p. ej. tras un 429 con Retry-After):
+        todas las llamadas de todos los procesos esperan a que pase.
+        """
+        resolved = self._resolve(provider, endpoint)
+        if resolved is None or seconds <= 0:
+            return
+        bucket, limit = resolved
+        self.stats[bucket]["penalties"] += 1
+        await self._reserve(bucket, limit, 0, -1, int(seconds * 1000))
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Contadores por cubo de este proceso (peticiones, esperas, rechazos)"""
+        return {
+            bucket: {**values, "wait_seconds": round(values["wait_seconds"], 3)}
+            for bucket, values in self.stats.items()
+        }
+
+    async def _reserve(
+        self,
+        bucket: str,
+        limit: ProviderLimit,
+        tokens: int,
+        max_wait_ms: int,
+        penalty_ms: int
+    ) -> Tuple[bool, int]:
+        client = redis_client.client
+        if client is not None:
+            try:
+                script = client.register_script(TOKEN_BUCKET_SCRIPT)
+                granted, wait_ms = await script(
+                    keys=[bucket],
+                    args=[limit.rate, limit.burst, tokens, max_wait_ms, penalty_ms]
+                )
+                return bool(int(granted)), int(wait_ms)
+            except Exception as e:
+                logger.warning(f"⚠️ Rate limit en Redis no disponible ({bucket}), usando límite local: {e}")
+
+        self.stats[bucket]["local"] += 1
+        return await self._reserve_local(bucket, limit, tokens, max_wait_ms, penalty_ms)
+
+    async def _reserve_local(
+        self,
+        bucket: str,
+        limit: ProviderLimit,
+        tokens: int,
+        max_wait_ms: int,
+        penalty_ms: int
+    ) -> Tuple[bool, int]:
+        """Misma lógica que TOKEN_BUCKET_SCRIPT, limitada al proceso actual"""
+        if self._local_lock is None:
+            self._local_lock = asyncio.Lock()
+
+        async with self._local_lock:
+            now = time.monotonic()
+            available, last = self._local.get(bucket, (limit.burst, now))
+            available = min(limit.burst, available + max(0.0, now - last) * limit.rate)
+
+            if penalty_ms > 0:
+                available = min(available, -penalty_ms / 1000 * limit.rate)
+
+            wait_ms = 0
+            if available < tokens:
+                wait_ms = math.ceil((tokens - available) * 1000 / limit.rate)
+
+            granted = max_wait_ms < 0 or wait_ms <= max_wait_ms
+            if granted:
+                available -= tokens
+            self._local[bucket] = [available, now]
+            return granted, wait_ms
+
+
+provider_rate_limiter = ProviderRateLimiter()
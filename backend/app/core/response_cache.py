@@ -0,0 +1,204 @@
+"""
+Caché en disco de respuestas históricas de proveedores (Polygon, Yahoo).
+
+El OHLCV diario de fechas pasadas no cambia, así que las descargas repetidas
+(fetch-history, reparación masiva, scripts de diagnóstico) se sirven desde
+disco en lugar de volver a pedirse.
+
+- Direccionada por contenido: la ruta es el SHA-256 de (proveedor, símbolo,
+  rango de fechas, parámetros), repartida en subdirectorios de 2 caracteres.
+- Rangos cerrados (fin < hoy): no caducan. Rangos que incluyen hoy: TTL corto.
+- Tamaño máximo con expulsión LRU: cada acierto actualiza el mtime del
+  fichero y al superar el límite se borran los menos usados recientemente.
+- Escrituras atómicas (fichero temporal + os.replace): varios procesos
+  (workers del API, worker de importación) comparten el directorio.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ENTRY_SUFFIX = ".json.gz"
+# Tras expulsar, dejar el tamaño en este porcentaje del máximo (evita expulsar en cada escritura)
+EVICTION_TARGET_RATIO = 0.9
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"$d": value.isoformat()}
+    raise TypeError(f"Tipo no serializable en caché: {type(value).__name__}")
+
+
+def _decode(obj: Dict):
+    if "$dt" in obj:
+        return datetime.fromisoformat(obj["$dt"])
+    if "$d" in obj:
+        return date.fromisoformat(obj["$d"])
+    return obj
+
+
+class ResponseCache:
+    """Caché de respuestas históricas en disco con expulsión LRU por tamaño"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or settings.HISTORY_CACHE_DIR
+        self.max_bytes = max_bytes or settings.HISTORY_CACHE_MAX_MB * 1024 * 1024
+        self.enabled = settings.HISTORY_CACHE_ENABLED
+        self._size: Optional[int] = None  # Estimación del tamaño total (se recalcula al expulsar)
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    def _path(self, provider: str, symbol: str, start: Optional[date], end: Optional[date], params: Dict) -> str:
+        key = json.dumps(
+            [provider, symbol.upper(), str(start), str(end), sorted(params.items())],
+            default=str
+        )
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ENTRY_SUFFIX)
+
+    @staticmethod
+    def is_open_range(end: Optional[date]) -> bool:
+        """Un rango sin fin o que llega hasta hoy aún puede recibir datos nuevos"""
+        return end is None or end >= date.today()
+
+    async def get(
+        self,
+        provider: str,
+        symbol: str,
+        start: Optional[date],
+        end: Optional[date],
+        **params
+    ) -> Optional[Any]:
+        """Respuesta cacheada (None si no existe o ha caducado)"""
+        if not self.enabled:
+            return None
+        path = self._path(provider, symbol, start, end, params)
+        try:
+            entry = await asyncio.to_thread(self._read, path)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️ Error leyendo caché de {provider}/{symbol}: {e}")
+            return None
+
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry["expires_at"] is not None and entry["expires_at"] < time.time():
+            self.stats["expired"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        logger.debug(f"💾 Caché de histórico: {provider}/{symbol} {start} → {end}")
+        return entry["payload"]
+
+    async def set(
+        self,
+        provider: str,
+        symbol: str,
+        start: Optional[date],
+        end: Optional[date],
+        payload: Any,
+        **params
+    ):
+        """Guarda una respuesta (sin caducidad si el rango está cerrado)"""
+        if not self.enabled or not payload:
+            return
+        expires_at = time.time() + settings.HISTORY_CACHE_OPEN_TTL_SECONDS if self.is_open_range(end) else None
+        path = self._path(provider, symbol, start, end, params)
+        try:
+            written = await asyncio.to_thread(self._write, path, {"expires_at": expires_at, "payload": payload})
+            self.stats["writes"] += 1
+            await asyncio.to_thread(self._account, written)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️ Error escribiendo caché de {provider}/{symbol}: {e}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "max_bytes": self.max_bytes,
+            "size_bytes": self._size,
+            **self.stats,
+        }
+
+    # ------------------------------------------------------------------
+    # E/S de disco (en hilos: no bloquear el event loop)
+    # ------------------------------------------------------------------
+
+    def _read(self, path: str) -> Optional[Dict]:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f, object_hook=_decode)
+        except FileNotFoundError:
+            return None
+        # Marcar como usado recientemente (orden LRU)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _write(self, path: str, entry: Dict) -> int:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(entry, f, default=_encode)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def _scan(self):
+        """Ficheros de la caché como (mtime, tamaño, ruta)"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _account(self, written: int):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        else:
+            self._size += written
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Borra los ficheros menos usados recientemente hasta bajar del objetivo"""
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._size = total
+        self.stats["evictions"] += removed
+        if removed:
+            logger.info(f"🧹 Caché de histórico: {removed} entradas expulsadas (LRU), {total / 1024 / 1024:.1f} MB")
+
+
+response_cache = ResponseCache()
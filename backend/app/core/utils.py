@@ -3,6 +3,7 @@ Utilidades comunes para el backend
 """
 from decimal import Decimal
 from typing import Any
+import numpy as np
 import pandas as pd
 
 def clean_decimal(val: Any) -> Decimal:
@@ -27,3 +28,38 @@ def clean_decimal(val: Any) -> Decimal:
         return Decimal(s) if s else Decimal('0')
     except:
         return Decimal('0')
+
+
+def clean_decimal_series(values: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de clean_decimal para columnas completas (float64, NaN si no es válido).
+    Solo se limpian las celdas de texto; los números ya tipados se respetan tal cual.
+    """
+    is_text = values.map(type) == str
+    # astype(str): en columnas numéricas la selección vacía es float64 y no admite .str
+    text = (
+        values[is_text]
+        .astype(str)
+        .str.replace('.', '', regex=False)
+        .str.replace(',', '.', regex=False)
+        .str.replace(r'[%€$]', '', regex=True)
+        .str.strip()
+    )
+    cleaned = values.where(~is_text, text)
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def parse_volume_series(values: pd.Series) -> pd.Series:
+    """Convierte volúmenes tipo '1,2M' / '350K' / 1200 a enteros (0 si no es válido)"""
+    is_text = values.map(type) == str
+    text = values[is_text].astype(str).str.upper().str.replace(',', '.', regex=False).str.strip()
+    multiplier = np.select(
+        [text.str.contains('M', regex=False), text.str.contains('K', regex=False)],
+        [1_000_000, 1_000],
+        default=1
+    )
+    text_values = pd.to_numeric(text.str.replace(r'[MK]', '', regex=True), errors='coerce') * multiplier
+    
+    numbers = pd.to_numeric(values.where(~is_text), errors='coerce')
+    numbers = numbers.where(~is_text, text_values)
+    return numbers.fillna(0).astype('int64')
@@ -151,9 +151,25 @@ async def startup_event():
     await session_manager.connect()
     await redis_client.connect()
     
+    # Cliente HTTP compartido de los proveedores de datos
+    from app.core.http_client import http_client
+    await http_client.connect()
+    
+    # Partición de quotes del año siguiente (las inserciones sin partición fallan)
+    from app.services.quote_partition_service import quote_partition_service
+    try:
+        await quote_partition_service.ensure_partitions()
+    except Exception as e:
+        print(f"❌ Error creando particiones de quotes: {e}")
+    
     # Iniciar programador de tareas
     scheduler_service.start()
     
+    # Workers de importación masiva (si no hay un proceso dedicado)
+    if settings.IMPORT_WORKERS_IN_API:
+        from app.services.import_job_service import import_job_service
+        await import_job_service.start_workers()
+    
     # Iniciar servicio de datos de mercado (Background)
     import asyncio
     asyncio.create_task(market_data_service.start_background_service())
@@ -168,6 +184,14 @@ async def shutdown_event():
     from app.services.market_data_service import market_data_service
     
     await market_data_service.stop_background_service()
+    
+    if settings.IMPORT_WORKERS_IN_API:
+        from app.services.import_job_service import import_job_service
+        await import_job_service.stop_workers()
+    
+    from app.core.http_client import http_client
+    await http_client.close()
+    
     await session_manager.disconnect()
     await redis_client.close()
     
@@ -5,6 +5,7 @@ from app.core.database import Base
 from app.models.user import User
 from app.models.asset import Asset, AssetType
 from app.models.quote import Quote
+from app.models.quote_coverage import QuoteCoverage
 from app.models.portfolio import Portfolio
 from app.models.transaction import Transaction, TransactionType
 from app.models.result import Result
@@ -17,6 +18,7 @@ __all__ = [
     "Asset",
     "AssetType",
     "Quote",
+    "QuoteCoverage",
     "Portfolio",
     "Transaction",
     "TransactionType",
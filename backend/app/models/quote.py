@@ -1,22 +1,93 @@
 """
 Modelo de Cotización (Precios históricos)
 """
-from sqlalchemy import Column, DateTime, Numeric, BigInteger, ForeignKey, Index, UniqueConstraint, String
+from sqlalchemy import Column, DateTime, Numeric, BigInteger, ForeignKey, Index, SmallInteger
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 import uuid
 
 from app.core.database import Base
 
 
+# Particionado por año (RANGE sobre date): quotes_historic (< QUOTE_PARTITION_FIRST_YEAR)
+# y una partición quotes_yYYYY por año, creadas por quote_partition_service.
+QUOTE_PARTITION_FIRST_YEAR = 2000
+QUOTE_PARTITION_PREFIX = "quotes_y"
+QUOTE_HISTORIC_PARTITION = "quotes_historic"
+
+
+def quote_partition_name(year: int) -> str:
+    return f"{QUOTE_PARTITION_PREFIX}{year}"
+
+
+def is_quote_partition(table_name: str) -> bool:
+    """Tablas hijas de quotes (no se declaran en los modelos)"""
+    return table_name == QUOTE_HISTORIC_PARTITION or (
+        table_name.startswith(QUOTE_PARTITION_PREFIX) and table_name[len(QUOTE_PARTITION_PREFIX):].isdigit()
+    )
+
+
+# Fuentes de datos codificadas como smallint: el código es la posición en la tupla.
+# Solo se añaden nombres al final (los códigos ya guardados no pueden cambiar).
+QUOTE_SOURCES = (
+    "unknown",
+    "alpha_vantage",
+    "yfinance_auto",
+    "manual_import",
+    "provider_import",
+    "historical_repair",
+    "daily_scheduler_backfill",
+    "polygon_grouped",
+    "polygon",
+    "yfinance",
+    "finnhub",
+)
+QUOTE_SOURCE_CODES = {name: code for code, name in enumerate(QUOTE_SOURCES)}
+
+# Espacio de nombres de los id de compatibilidad (uuid5 de asset_id + fecha)
+QUOTE_ID_NAMESPACE = uuid.UUID("5b0c7e2a-3f4d-4e8b-9a61-2d7f0c8e4b13")
+
+
+def encode_quote_source(name) -> int:
+    """Código de una fuente (las no registradas se guardan como "unknown")"""
+    if isinstance(name, int):
+        return name
+    return QUOTE_SOURCE_CODES.get(name or "unknown", 0)
+
+
+def decode_quote_source(code: int) -> str:
+    return QUOTE_SOURCES[code] if 0 <= code < len(QUOTE_SOURCES) else "unknown"
+
+
+def quote_compat_id(asset_id, quote_date) -> uuid.UUID:
+    """
+    Identificador estable de una cotización para las respuestas de la API
+    (la tabla ya no tiene columna id: la clave es (asset_id, date))
+    """
+    return uuid.uuid5(QUOTE_ID_NAMESPACE, f"{asset_id}:{quote_date.date().isoformat()}")
+
+
+class QuoteSource(TypeDecorator):
+    """Columna smallint que se lee y escribe con el nombre de la fuente"""
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else encode_quote_source(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else decode_quote_source(value)
+
+
 class Quote(Base):
-    """Tabla de cotizaciones históricas (OHLCV)"""
+    """Tabla de cotizaciones históricas (OHLCV), particionada por año"""
     __tablename__ = "quotes"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    asset_id = Column(UUID(as_uuid=True), ForeignKey("assets.id", ondelete="CASCADE"), nullable=False, index=True)
-    date = Column(DateTime(timezone=True), nullable=False, index=True)
+    # PK natural (asset_id, date): sirve también de índice por activo y por activo + rango de
+    # fechas, e incluye la clave de partición
+    asset_id = Column(UUID(as_uuid=True), ForeignKey("assets.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(DateTime(timezone=True), primary_key=True)
     
     # OHLCV - Open, High, Low, Close, Volume
     open = Column(Numeric(18, 6), nullable=False)
@@ -25,18 +96,24 @@ class Quote(Base):
     close = Column(Numeric(18, 6), nullable=False)
     volume = Column(BigInteger, nullable=True)
     
-    # Metadata
-    source = Column(String(50), default="alpha_vantage")  # Fuente de datos
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Fuente de datos (smallint codificado, ver QUOTE_SOURCES)
+    source = Column(QuoteSource, nullable=False, default="unknown", server_default="0")
     
     # Relaciones
     asset = relationship("Asset", back_populates="quotes")
     
-    # Constraints e índices
+    # Índices: BRIN en date (rangos de fechas sin activo apenas ocupan índice) y btree
+    # (date, asset_id) para el listado paginado por cursor de todas las cotizaciones
     __table_args__ = (
-        UniqueConstraint('asset_id', 'date', name='uq_quote_asset_date'),
-        Index('idx_quote_asset_date', 'asset_id', 'date'),
+        Index('ix_quotes_date_brin', 'date', postgresql_using='brin'),
+        Index('ix_quotes_date_asset', 'date', 'asset_id'),
+        {'postgresql_partition_by': 'RANGE (date)'},
     )
     
+    @property
+    def id(self) -> uuid.UUID:
+        """Compatibilidad con clientes que esperan un id por cotización"""
+        return quote_compat_id(self.asset_id, self.date)
+    
     def __repr__(self):
         return f"<Quote {self.asset_id} {self.date} close={self.close}>"
@@ -0,0 +1,31 @@
+"""
+Modelo de Cobertura de Cotizaciones (precalculada por activo)
+"""
+from sqlalchemy import Column, Date, DateTime, Integer, String, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class QuoteCoverage(Base):
+    """
+    Cobertura materializada de cotizaciones por activo.
+    La actualizan los escritores de cotizaciones tras cada lote y una reconciliación nocturna.
+    """
+    __tablename__ = "quote_coverage"
+    
+    asset_id = Column(UUID(as_uuid=True), ForeignKey("assets.id", ondelete="CASCADE"), primary_key=True)
+    required_start = Column(Date, nullable=False)  # Primera transacción - 7 días (o 1 año)
+    first_date = Column(Date, nullable=True)
+    last_date = Column(Date, nullable=True)
+    expected_count = Column(Integer, nullable=False, default=0)  # Sesiones de la bolsa en el rango
+    present_count = Column(Integer, nullable=False, default=0)
+    missing_count = Column(Integer, nullable=False, default=0)
+    first_missing_date = Column(Date, nullable=True)  # Primera sesión sin cotización
+    longest_gap = Column(Integer, nullable=False, default=0)  # Racha máxima de días faltantes
+    status = Column(String(20), nullable=False, index=True)  # no_data, incomplete_data, outdated, complete
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    
+    def __repr__(self):
+        return f"<QuoteCoverage {self.asset_id} {self.status}>"
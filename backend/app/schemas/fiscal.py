@@ -90,3 +90,43 @@ class FiscalReport(BaseModel):
     portfolio_id: str
     generated_at: datetime = Field(default_factory=datetime.now)
     years: List[FiscalYearSummary] = []
+
+class HarvestableLot(BaseModel):
+    """
+    Lote FIFO abierto con pérdida latente (candidato a venta para compensar plusvalías).
+    """
+    portfolio_id: str
+    asset_id: str
+    asset_symbol: str
+    asset_currency: Optional[str] = None
+    acquisition_date: datetime
+    days_held: int
+    quantity: Decimal
+
+    # Valores en moneda original del activo
+    acquisition_price: Decimal
+    cost_basis: Decimal  # (qty * price) + parte proporcional de comisiones
+    current_price: Decimal
+    current_value: Decimal
+    unrealized_result_original: Decimal
+
+    # Resultado en moneda base del usuario (P&L original * tasa actual, igual que el motor fiscal)
+    exchange_rate_used: Decimal
+    harvestable_loss: Decimal  # Pérdida aprovechable (valor positivo)
+    price_source: str  # "online" (tabla virtual) o "historic" (último cierre)
+
+    # Regla de los 2 meses
+    wash_sale_risk: bool = False
+    recent_purchase_quantity: Decimal = Decimal(0)  # Unidades homogéneas compradas en los últimos 60 días
+
+    notes: Optional[str] = None
+
+class TaxLossHarvestReport(BaseModel):
+    """
+    Resultado del escáner de pérdidas latentes de un usuario.
+    """
+    base_currency: str
+    generated_at: datetime = Field(default_factory=datetime.now)
+    total_harvestable_loss: Decimal = Decimal(0)
+    lots: List[HarvestableLot] = []
+    symbols_without_price: List[str] = []
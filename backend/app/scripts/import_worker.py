@@ -0,0 +1,39 @@
+"""
+Proceso dedicado de importación histórica masiva.
+
+Consume la cola de trabajos de Redis (ver app/services/import_job_service.py)
+fuera de los workers del API. Uso:
+
+    python -m app.scripts.import_worker [--workers N]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import os
+
+# Añadir el directorio raíz al path para poder importar la app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.core.http_client import http_client
+from app.core.redis_client import redis_client
+from app.services.import_job_service import import_job_service
+
+
+async def run_worker(workers: int = None):
+    await redis_client.connect()
+    await http_client.connect()
+    try:
+        await import_job_service.run_forever(workers)
+    finally:
+        await http_client.close()
+        await redis_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker de importación histórica masiva")
+    parser.add_argument("--workers", type=int, default=None, help="Descargas en paralelo (por defecto IMPORT_WORKERS)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(run_worker(args.workers))
@@ -1,11 +1,11 @@
 """
 Servicio para Alpha Vantage API
 """
-import httpx
 import logging
 from typing import Optional, Dict, List
 from datetime import datetime, timedelta
 from app.core.config import settings
+from app.core.http_client import http_client
 
 logger = logging.getLogger(__name__)
 
@@ -33,58 +33,58 @@ class AlphaVantageService:
         try:
             output_size = "full" if full_history else "compact"
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(
-                    self.base_url,
-                    params={
-                        "function": "TIME_SERIES_DAILY",
-                        "symbol": symbol,
-                        "outputsize": output_size,
-                        "apikey": self.api_key
-                    }
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Alpha Vantage API error: {response.status_code}")
-                    return None
-                
-                data = response.json()
-                
-                logger.info(f"📡 Respuesta de Alpha Vantage para {symbol}: {list(data.keys())}")
-                
-                # Verificar si hay error en la respuesta
-                if "Error Message" in data:
-                    logger.error(f"❌ Alpha Vantage error for {symbol}: {data['Error Message']}")
-                    return None
-                
-                if "Note" in data:
-                    logger.warning(f"⚠️ Alpha Vantage rate limit: {data['Note']}")
-                    return None
-                
-                # Parsear datos
-                time_series = data.get("Time Series (Daily)", {})
-                
-                if not time_series:
-                    logger.warning(f"⚠️ No hay 'Time Series (Daily)' en la respuesta para {symbol}. Respuesta: {data}")
-                    return None
-                
-                quotes = []
-                for date_str, values in time_series.items():
-                    try:
-                        quotes.append({
-                            "date": datetime.strptime(date_str, "%Y-%m-%d"),
-                            "open": float(values["1. open"]),
-                            "high": float(values["2. high"]),
-                            "low": float(values["3. low"]),
-                            "close": float(values["4. close"]),
-                            "volume": int(values["5. volume"])
-                        })
-                    except (ValueError, KeyError) as e:
-                        logger.warning(f"Error parsing quote for {symbol} on {date_str}: {e}")
-                        continue
-                
-                return quotes
-                
+            response = await http_client.get(
+                self.base_url,
+                params={
+                    "function": "TIME_SERIES_DAILY",
+                    "symbol": symbol,
+                    "outputsize": output_size,
+                    "apikey": self.api_key
+                },
+                timeout=self.timeout
+            )
+            
+            if response.status_code != 200:
+                logger.error(f"Alpha Vantage API error: {response.status_code}")
+                return None
+            
+            data = response.json()
+            
+            logger.info(f"📡 Respuesta de Alpha Vantage para {symbol}: {list(data.keys())}")
+            
+            # Verificar si hay error en la respuesta
+            if "Error Message" in data:
+                logger.error(f"❌ Alpha Vantage error for {symbol}: {data['Error Message']}")
+                return None
+            
+            if "Note" in data:
+                logger.warning(f"⚠️ Alpha Vantage rate limit: {data['Note']}")
+                return None
+            
+            # Parsear datos
+            time_series = data.get("Time Series (Daily)", {})
+            
+            if not time_series:
+                logger.warning(f"⚠️ No hay 'Time Series (Daily)' en la respuesta para {symbol}. Respuesta: {data}")
+                return None
+            
+            quotes = []
+            for date_str, values in time_series.items():
+                try:
+                    quotes.append({
+                        "date": datetime.strptime(date_str, "%Y-%m-%d"),
+                        "open": float(values["1. open"]),
+                        "high": float(values["2. high"]),
+                        "low": float(values["3. low"]),
+                        "close": float(values["4. close"]),
+                        "volume": int(values["5. volume"])
+                    })
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Error parsing quote for {symbol} on {date_str}: {e}")
+                    continue
+            
+            return quotes
+            
         except Exception as e:
             logger.error(f"Error fetching quotes for {symbol}: {e}")
             return None
@@ -1,14 +1,14 @@
 """
 Servicio para obtener datos históricos usando Alpha Vantage
 Plan gratuito: 100 días de histórico con outputsize='compact'
+(REST con el cliente HTTP compartido)
 """
 import logging
 from datetime import datetime, date
 from typing import List, Dict, Optional
-from alpha_vantage.timeseries import TimeSeries
-import pandas as pd
-from decimal import Decimal
 from app.core.config import settings
+from app.core.http_client import http_client
+from app.core.provider_rate_limit import provider_rate_limiter, ProviderRateLimitTimeout
 
 logger = logging.getLogger(__name__)
 
@@ -21,15 +21,26 @@ class AlphaVantageService:
     """Servicio para obtener cotizaciones históricas de Alpha Vantage"""
     
     def __init__(self):
-        try:
-            self.ts = TimeSeries(
-                key=settings.ALPHA_VANTAGE_API_KEY,
-                output_format='pandas'
-            )
-            logger.info("✅ Alpha Vantage service initialized")
-        except Exception as e:
-            logger.error(f"❌ Error inicializando Alpha Vantage: {str(e)}")
-            self.ts = None
+        self.api_key = settings.ALPHA_VANTAGE_API_KEY
+        self.base_url = "https://www.alphavantage.co/query"
+        logger.info("✅ Alpha Vantage service initialized")
+    
+    async def _query(self, function: str, **params) -> Dict:
+        """
+        Llamada a la API. Alpha Vantage responde 200 también en errores,
+        con el mensaje en "Error Message", "Note" o "Information".
+        """
+        response = await http_client.get(
+            self.base_url,
+            params={"function": function, "apikey": self.api_key, **params}
+        )
+        response.raise_for_status()
+        data = response.json()
+        
+        message = data.get("Error Message") or data.get("Note") or data.get("Information")
+        if message:
+            raise ValueError(message)
+        return data
     
     async def get_historical_quotes(
         self,
@@ -50,7 +61,7 @@ class AlphaVantageService:
         Returns:
             Lista de diccionarios con datos OHLCV
         """
-        if not self.ts:
+        if not self.api_key:
             logger.error("❌ Alpha Vantage no está inicializado")
             return None
         
@@ -58,9 +69,17 @@ class AlphaVantageService:
             logger.info(f"🔄 Obteniendo histórico de Alpha Vantage para {symbol}")
             logger.info(f"📅 Plan FREE: Últimos 100 días disponibles")
             
+            # Cuota diaria compartida entre procesos: no esperar horas por un turno
+            try:
+                await provider_rate_limiter.acquire("alpha_vantage", "daily", timeout=0)
+            except ProviderRateLimitTimeout as e:
+                logger.warning(f"⚠️ Límite de API alcanzado para {symbol}")
+                raise RateLimitException(str(e))
+            
             # Obtener datos históricos (últimos 100 días con plan gratuito)
             try:
-                df, meta_data = self.ts.get_daily(
+                data = await self._query(
+                    "TIME_SERIES_DAILY",
                     symbol=symbol.upper(),
                     outputsize='compact'  # 'compact' = últimos 100 días (gratis)
                 )
@@ -75,52 +94,41 @@ class AlphaVantageService:
                 else:
                     raise api_error
             
-            if df is None or df.empty:
+            series = data.get("Time Series (Daily)") or {}
+            if not series:
                 logger.warning(f"⚠️ No se recibieron datos de Alpha Vantage para {symbol}")
                 return None
             
-            logger.info(f"📊 Datos recibidos: {len(df)} registros de Alpha Vantage")
+            logger.info(f"📊 Datos recibidos: {len(series)} registros de Alpha Vantage")
             
-            # Filtrar por rango de fechas si se especifica
-            if start_date or end_date:
-                df.index = pd.to_datetime(df.index)
-                
-                if start_date and end_date:
-                    mask = (df.index.date >= start_date) & (df.index.date <= end_date)
-                elif start_date:
-                    mask = df.index.date >= start_date
-                else:
-                    mask = df.index.date <= end_date
-                
-                df = df.loc[mask]
-                logger.info(f"📊 Después de filtrar fechas: {len(df)} registros")
-            
-            if df.empty:
-                logger.warning(f"⚠️ No hay datos en el rango de fechas para {symbol}")
-                return None
-            
-            # Convertir DataFrame a lista de diccionarios
+            # Convertir a lista de diccionarios (orden cronológico), filtrando por rango si se especifica
             quotes = []
-            for idx, row in df.iterrows():
-                quote_date = idx.date() if hasattr(idx, 'date') else idx
-                # Normalizar a medianoche
-                quote_datetime = datetime.combine(quote_date, datetime.min.time())
+            for day_str in sorted(series):
+                quote_date = date.fromisoformat(day_str)
+                if (start_date and quote_date < start_date) or (end_date and quote_date > end_date):
+                    continue
                 
+                row = series[day_str]
                 # Verificar que tenemos precio de cierre
                 close_price = row.get('4. close')
-                if pd.isna(close_price):
+                if close_price is None:
                     continue
                 
                 quote = {
-                    "date": quote_datetime,
+                    # Normalizar a medianoche
+                    "date": datetime.combine(quote_date, datetime.min.time()),
                     "open": float(row.get('1. open', close_price)),
                     "high": float(row.get('2. high', close_price)),
                     "low": float(row.get('3. low', close_price)),
                     "close": float(close_price),
-                    "volume": int(row.get('5. volume', 0)) if not pd.isna(row.get('5. volume')) else 0
+                    "volume": int(row.get('5. volume') or 0)
                 }
                 quotes.append(quote)
             
+            if not quotes:
+                logger.warning(f"⚠️ No hay datos en el rango de fechas para {symbol}")
+                return None
+            
             logger.info(f"✅ {len(quotes)} cotizaciones procesadas para {symbol} desde Alpha Vantage")
             return quotes
             
@@ -136,14 +144,10 @@ class AlphaVantageService:
         """
         Buscar símbolos usando Alpha Vantage Symbol Search
         """
-        if not self.ts: return []
+        if not self.api_key: return []
         try:
-            # La librería alpha_vantage no siempre expone search directamente en TimeSeries, 
-            # pero podemos usar una llamada custom si es necesario o ver si está disponible.
-            # Nota: la librería 'alpha_vantage' tiene un módulo 'Custom' para esto.
-            from alpha_vantage.custom_api import CustomAPI
-            custom = CustomAPI(key=settings.ALPHA_VANTAGE_API_KEY)
-            data, _ = custom.get_custom_api(function="SYMBOL_SEARCH", keywords=keywords)
+            await provider_rate_limiter.acquire("alpha_vantage", "search", timeout=0)
+            data = await self._query("SYMBOL_SEARCH", keywords=keywords)
             
             # Alpha Vantage devuelve 'bestMatches'
             matches = data.get('bestMatches', [])
@@ -169,11 +173,10 @@ class AlphaVantageService:
         """
         Obtener perfil detallado de la compañía desde Alpha Vantage (OVERVIEW)
         """
-        if not self.ts: return None
+        if not self.api_key: return None
         try:
-            from alpha_vantage.custom_api import CustomAPI
-            custom = CustomAPI(key=settings.ALPHA_VANTAGE_API_KEY)
-            data, _ = custom.get_custom_api(function="OVERVIEW", symbol=symbol.upper())
+            await provider_rate_limiter.acquire("alpha_vantage", "overview", timeout=0)
+            data = await self._query("OVERVIEW", symbol=symbol.upper())
             
             if not data or "Symbol" not in data:
                 return None
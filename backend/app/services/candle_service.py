@@ -0,0 +1,107 @@
+"""
+Velas agregadas (semana, mes, trimestre) de las cotizaciones diarias.
+
+La agregación se hace en PostgreSQL (date_trunc sobre el día UTC): un gráfico
+de varios años recibe unos cientos de velas en lugar de miles de barras
+diarias. El JSON resultante se guarda en Redis con la versión de datos del
+activo en la clave (price_store_service.get_data_version), así que una ingesta
+que modifique el activo invalida sus velas sin borrar nada.
+"""
+import json
+import logging
+from datetime import date
+from typing import Literal, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.redis_client import redis_client
+from app.services.price_store_service import price_store_service
+
+logger = logging.getLogger(__name__)
+
+CandleInterval = Literal["week", "month", "quarter"]
+
+CACHE_PREFIX = "candles"
+# Las claves llevan la versión: el TTL solo limpia las de versiones antiguas
+CACHE_TTL_SECONDS = 24 * 3600
+
+CANDLES_SQL = text("""
+    SELECT
+        date_trunc(:interval, date AT TIME ZONE 'UTC')::date AS bucket,
+        (array_agg(open ORDER BY date))[1]::float8 AS open,
+        max(high)::float8 AS high,
+        min(low)::float8 AS low,
+        (array_agg(close ORDER BY date DESC))[1]::float8 AS close,
+        sum(volume) AS volume,
+        count(*) AS days
+    FROM quotes
+    WHERE asset_id = :asset_id
+      AND date >= :start
+      AND date < :end
+    GROUP BY 1
+    ORDER BY 1
+""")
+
+
+class CandleService:
+    """Velas OHLCV por intervalo con caché versionada en Redis"""
+
+    def cache_key(self, asset_id, interval: str, start: Optional[date], end: Optional[date], version: int) -> str:
+        return f"{CACHE_PREFIX}:{asset_id}:{interval}:{start or ''}:{end or ''}:v{version}"
+
+    async def get_candles_json(
+        self,
+        db: AsyncSession,
+        asset_id,
+        interval: CandleInterval,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        version: Optional[int] = None,
+    ) -> str:
+        """
+        Velas del activo serializadas en columnas (date, open, high, low, close, volume, days).
+        date es el primer día del intervalo; start/end filtran días (end incluido).
+        """
+        if version is None:
+            version = await price_store_service.get_data_version(asset_id)
+        redis = redis_client.client
+        key = self.cache_key(asset_id, interval, start, end, version)
+
+        if redis is not None:
+            try:
+                cached = await redis.get(key)
+                if cached:
+                    return cached
+            except Exception as e:
+                logger.warning(f"⚠️ Error leyendo velas de Redis: {e}")
+
+        rows = (await db.execute(CANDLES_SQL, {
+            "interval": interval,
+            "asset_id": asset_id,
+            "start": start or date.min,
+            "end": date.fromordinal(end.toordinal() + 1) if end else date.max,
+        })).all()
+        payload = json.dumps({
+            "asset_id": str(asset_id),
+            "interval": interval,
+            "version": version,
+            "count": len(rows),
+            "date": [row.bucket.isoformat() for row in rows],
+            "open": [row.open for row in rows],
+            "high": [row.high for row in rows],
+            "low": [row.low for row in rows],
+            "close": [row.close for row in rows],
+            "volume": [row.volume for row in rows],
+            "days": [row.days for row in rows],
+        }, separators=(",", ":"))
+
+        if redis is not None:
+            try:
+                await redis.set(key, payload, ex=CACHE_TTL_SECONDS)
+            except Exception as e:
+                logger.warning(f"⚠️ Error guardando velas en Redis: {e}")
+        return payload
+
+
+candle_service = CandleService()
@@ -14,6 +14,7 @@ from app.models.user import User
 from app.models.portfolio import Portfolio
 from app.schemas.dashboard import DashboardStats, PerformancePoint, MonthlyValue, AssetAllocation
 from app.services.forex_service import forex_service
+from app.services.price_store_service import price_store_service, day_to_date
 from app.services.yfinance_service import yfinance_service
 
 # Configure logger
@@ -76,26 +77,34 @@ class DashboardService:
             if end_date > today:
                 end_date = today
 
-            quotes_result = await db.execute(
-                select(Quote)
-                .where(
-                    and_(
-                        Quote.asset_id.in_(asset_ids),
-                        Quote.date >= start_date,
-                        Quote.date <= end_date
-                    )
-                )
-                .order_by(Quote.date)
-            )
-            quotes = quotes_result.scalars().all()
-            logger.info(f"Found {len(quotes)} quotes")
-            
             # Organize quotes: asset_id -> date -> close_price
+            # Almacén de precios local primero; BD solo para los activos que no estén en él
             quotes_map: Dict[str, Dict[date, float]] = defaultdict(dict)
-            for q in quotes:
-                # q.date is datetime with timezone, convert to date
-                q_date = q.date.date()
-                quotes_map[str(q.asset_id)][q_date] = float(q.close)
+            db_asset_ids = []
+            for aid in asset_ids:
+                series = price_store_service.get_range(aid, start_date, end_date)
+                if series is None:
+                    db_asset_ids.append(aid)
+                    continue
+                days, ohlc = series
+                quotes_map[str(aid)] = dict(zip(map(day_to_date, days.tolist()), ohlc[3].tolist()))
+            
+            if db_asset_ids:
+                quotes_result = await db.execute(
+                    select(Quote.asset_id, Quote.date, Quote.close)
+                    .where(
+                        and_(
+                            Quote.asset_id.in_(db_asset_ids),
+                            Quote.date >= start_date,
+                            Quote.date <= end_date
+                        )
+                    )
+                    .order_by(Quote.date)
+                )
+                for q in quotes_result.all():
+                    # q.date is datetime with timezone, convert to date
+                    quotes_map[str(q.asset_id)][q.date.date()] = float(q.close)
+            logger.info(f"Loaded quotes for {len(asset_ids)} assets ({len(db_asset_ids)} from database)")
 
             # 4.1 Inyectar precios en tiempo real si online=True
             if online and end_date == today:
@@ -170,21 +179,28 @@ class DashboardService:
             
             # 6.5 Initialize last_known_prices with latest available quotes before start_date
             # This prevents the dashboard from showing 0 value at the beginning of the year
-            initial_prices_stmt = select(
-                Quote.asset_id, 
-                Quote.close
-            ).distinct(Quote.asset_id).where(
-                and_(
-                    Quote.asset_id.in_(asset_ids),
-                    Quote.date < start_date
-                )
-            ).order_by(Quote.asset_id, Quote.date.desc())
-            
-            initial_prices_result = await db.execute(initial_prices_stmt)
             last_known_prices: Dict[str, float] = {
-                str(row.asset_id): float(row.close) 
-                for row in initial_prices_result.all()
+                aid: price
+                for aid, (_, price) in price_store_service.as_of(
+                    [aid for aid in asset_ids if aid not in db_asset_ids], start_date - timedelta(days=1)
+                ).items()
             }
+            if db_asset_ids:
+                initial_prices_stmt = select(
+                    Quote.asset_id, 
+                    Quote.close
+                ).distinct(Quote.asset_id).where(
+                    and_(
+                        Quote.asset_id.in_(db_asset_ids),
+                        Quote.date < start_date
+                    )
+                ).order_by(Quote.asset_id, Quote.date.desc())
+                
+                initial_prices_result = await db.execute(initial_prices_stmt)
+                last_known_prices.update({
+                    str(row.asset_id): float(row.close) 
+                    for row in initial_prices_result.all()
+                })
             logger.info(f"Initialized {len(last_known_prices)} prices from previous history")
             
             # Loop through days
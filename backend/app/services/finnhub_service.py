@@ -1,12 +1,13 @@
 """
-Servicio para Finnhub API
+Servicio para Finnhub API (REST con el cliente HTTP compartido)
 """
-import finnhub
 import logging
 from typing import Optional, Dict, List
 from datetime import datetime, timedelta
 import time
 from app.core.config import settings
+from app.core.http_client import http_client
+from app.core.provider_rate_limit import provider_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +17,18 @@ class FinnhubService:
     
     def __init__(self):
         self.api_key = settings.FINNHUB_API_KEY
-        self.client = finnhub.Client(api_key=self.api_key)
+        self.base_url = "https://finnhub.io/api/v1"
+    
+    async def _get(self, path: str, endpoint: str, **params) -> Dict:
+        """GET a la API de Finnhub respetando el rate limit compartido"""
+        await provider_rate_limiter.acquire("finnhub", endpoint)
+        response = await http_client.get(
+            f"{self.base_url}{path}",
+            params=params,
+            headers={"X-Finnhub-Token": self.api_key}
+        )
+        response.raise_for_status()
+        return response.json()
     
     async def get_daily_quotes(self, symbol: str, full_history: bool = False) -> Optional[List[Dict]]:
         """
@@ -47,7 +59,10 @@ class FinnhubService:
                 
                 try:
                     # Llamar a stock_candles para datos históricos
-                    response = self.client.stock_candles(symbol, 'D', start_ts, end_ts)
+                    response = await self._get(
+                        "/stock/candle", "candles",
+                        symbol=symbol, resolution="D", **{"from": start_ts, "to": end_ts}
+                    )
                     
                     if not response or response.get('s') != 'ok':
                         logger.warning(f"⚠️ No hay datos históricos disponibles para {symbol} en Finnhub")
@@ -105,7 +120,7 @@ class FinnhubService:
         try:
             logger.info(f"🔄 Obteniendo cotización actual de Finnhub para {symbol}")
             
-            response = self.client.quote(symbol)
+            response = await self._get("/quote", "quote", symbol=symbol)
             
             if not response or response.get('c') is None:
                 logger.warning(f"⚠️ No hay datos de cotización para {symbol}")
@@ -142,7 +157,7 @@ class FinnhubService:
             Diccionario con datos de cotización actual
         """
         try:
-            response = self.client.quote(symbol)
+            response = await self._get("/quote", "quote", symbol=symbol)
             
             if not response or response.get('c') is None:
                 logger.warning(f"⚠️ No hay datos de cotización actual para {symbol}")
@@ -166,7 +181,7 @@ class FinnhubService:
         Buscar activos usando Finnhub Symbol Search
         """
         try:
-            response = self.client.symbol_lookup(query)
+            response = await self._get("/search", "search", q=query)
             # Finnhub devuelve 'result'
             results = response.get('result', [])
             return results # [{description, displaySymbol, symbol, type}, ...]
@@ -179,7 +194,7 @@ class FinnhubService:
         Obtener perfil de compañía desde Finnhub
         """
         try:
-            res = self.client.company_profile2(symbol=symbol.upper())
+            res = await self._get("/stock/profile2", "profile", symbol=symbol.upper())
             if not res or 'name' not in res:
                 return None
             
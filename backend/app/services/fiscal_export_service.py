@@ -0,0 +1,107 @@
+"""
+Exportación en streaming de resultados fiscales (CSV / XLSX).
+
+Las filas se generan directamente desde FiscalService.iter_fiscal_results, sin
+construir el FiscalReport completo en memoria.
+"""
+import csv
+import io
+import tempfile
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from openpyxl import Workbook
+
+from app.schemas.fiscal import FiscalResultItem
+
+# (Cabecera, atributo de FiscalResultItem)
+EXPORT_COLUMNS = [
+    ("Ejercicio", None),
+    ("Activo", "asset_symbol"),
+    ("Moneda", "asset_currency"),
+    ("Cantidad", "quantity_sold"),
+    ("Fecha Venta", "sale_date"),
+    ("Precio Venta", "sale_price"),
+    ("Comisiones Venta", "sale_fees"),
+    ("Valor Venta", "sale_value"),
+    ("Fecha Compra", "acquisition_date"),
+    ("Precio Compra", "acquisition_price"),
+    ("Comisiones Compra", "acquisition_fees"),
+    ("Valor Compra", "acquisition_value"),
+    ("Resultado (Original)", "gross_result_original"),
+    ("Tasa de Cambio", "exchange_rate_used"),
+    ("Resultado", "gross_result"),
+    ("Días", "days_held"),
+    ("Wash Sale", "is_wash_sale"),
+    ("Pérdida No Computable", "wash_sale_disallowed_loss"),
+    ("Notas", "notes"),
+]
+
+# Filas acumuladas antes de emitir un bloque de CSV
+CSV_FLUSH_ROWS = 500
+# Tamaño de los bloques al enviar el fichero XLSX
+XLSX_CHUNK_SIZE = 64 * 1024
+
+
+def filter_year(items: Iterable[FiscalResultItem], year: Optional[int]) -> Iterator[FiscalResultItem]:
+    """Filtra (de forma perezosa) los resultados por ejercicio de venta"""
+    for item in items:
+        if year is None or item.sale_date.year == year:
+            yield item
+
+
+def _row_values(item: FiscalResultItem) -> list:
+    values = []
+    for _, attr in EXPORT_COLUMNS:
+        if attr is None:
+            values.append(item.sale_date.year)
+            continue
+        value = getattr(item, attr)
+        if isinstance(value, datetime):
+            # Excel no admite zonas horarias; exportamos solo la fecha
+            value = value.date()
+        values.append(value)
+    return values
+
+
+def iter_csv(items: Iterable[FiscalResultItem]) -> Iterator[str]:
+    """Genera el CSV por bloques (separador ';' para Excel en español)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+
+    rows = 0
+    for item in items:
+        writer.writerow(_row_values(item))
+        rows += 1
+        if rows % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+
+def iter_xlsx(items: Iterable[FiscalResultItem]) -> Iterator[bytes]:
+    """
+    Genera el XLSX con openpyxl en modo write-only (las filas se vuelcan a disco a
+    medida que se añaden) y lo envía por bloques.
+
+    El formato ZIP de XLSX solo se puede cerrar al final, por lo que los primeros
+    bytes llegan cuando se ha procesado la última fila; la memoria sigue siendo plana.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Resultados")
+    ws.append([header for header, _ in EXPORT_COLUMNS])
+
+    for item in items:
+        ws.append(_row_values(item))
+
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_CHUNK_SIZE * 16) as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(XLSX_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
@@ -1,12 +1,15 @@
-from typing import List, Dict, Optional
+import logging
+from typing import List, Dict, Optional, Iterator
 from datetime import timedelta
 from decimal import Decimal
 from collections import deque
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.fiscal import FiscalOperation, FiscalResultItem, FiscalReport, FiscalYearSummary
-from app.models.transaction import TransactionType
+from app.models.transaction import Transaction, TransactionType
 from app.services.forex_service import forex_service
 
+logger = logging.getLogger(__name__)
+
 class PositionLot:
     """Clase auxiliar para rastrear lotes abiertos para FIFO."""
     def __init__(self, op: FiscalOperation, quantity: Decimal):
@@ -14,6 +17,48 @@ class PositionLot:
         self.remaining_quantity = quantity
 
 class FiscalService:
+    def build_operations(self, transactions: List[Transaction]) -> List[FiscalOperation]:
+        """
+        Convierte transacciones de BD (con el asset cargado) en FiscalOperation.
+        Guarda precio y comisiones originales antes de cualquier conversión de divisa.
+        """
+        fiscal_ops = []
+        for t in transactions:
+            # Asegurar asset_symbol
+            asset_symbol = t.asset.symbol if t.asset else "UNKNOWN"
+            asset_currency = t.asset.currency if t.asset else "USD"
+
+            fiscal_ops.append(FiscalOperation(
+                id=str(t.id),
+                date=t.transaction_date,
+                type=t.transaction_type,
+                asset_id=str(t.asset_id),
+                asset_symbol=asset_symbol,
+                asset_currency=asset_currency,
+                quantity=t.quantity,
+                price=t.price,
+                fees=t.fees or 0,
+                original_price=t.price, # Guardar valor original antes de conversión
+                original_fees=t.fees or 0
+            ))
+        return fiscal_ops
+
+    def get_open_lots(self, operations: List[FiscalOperation]) -> List[PositionLot]:
+        """
+        Ejecuta el FIFO sobre las operaciones y devuelve los lotes que siguen abiertos
+        (cantidad pendiente > 0), en el orden en que se consumirían.
+        """
+        ops = sorted(operations, key=lambda x: x.date)
+        open_positions: Dict[str, deque[PositionLot]] = {}
+
+        for op in ops:
+            if op.type == TransactionType.BUY:
+                self._process_buy(op, open_positions)
+            elif op.type == TransactionType.SELL:
+                self._process_sell(op, open_positions, {})
+
+        return [lot for lots in open_positions.values() for lot in lots if lot.remaining_quantity > 0]
+
     async def calculate_fiscal_impact(
         self, 
         portfolio_id: str, 
@@ -23,56 +68,86 @@ class FiscalService:
     ) -> FiscalReport:
         # Pre-procesamiento: Conversión de divisas si es necesario
         if db:
-            print(f"DEBUG: Starting currency conversion. Target: {target_currency}")
-            for op in operations:
-                if op.asset_currency and op.asset_currency != target_currency:
-                    # Convertir a moneda objetivo usando fecha de operación
-                    try:
-                        rate = await forex_service.get_exchange_rate(
-                            op.asset_currency, 
-                            target_currency, 
-                            op.date.date(), 
-                            db
-                        )
-                        # DEBUG
-                        # print(f"DEBUG: Converting {op.asset_symbol} {op.date.date()} USD->EUR Rate: {rate}")
-                        
-                        if rate:
-                            # Guardamos los originales si aún no se han rellenado en la creación
-                            # Aunque ya lo hicimos en el API, nos aseguramos aquí
-                            if op.original_price is None:
-                                op.original_price = op.price
-                                op.original_fees = op.fees
-
-                            op.price = op.price * Decimal(str(rate))
-                            op.fees = op.fees * Decimal(str(rate))
-                            # op.asset_currency = target_currency # No cambiamos la etiqueta para mantener rastro, pero los valores ya están convertidos
-                    except Exception as e:
-                        print(f"Error converting currency for fiscal report: {e}")
+            await self.convert_operations(operations, target_currency, db)
+
+        # 1-3. FIFO + Regla de los 2 Meses (Wash Sales)
+        results = list(self.iter_fiscal_results(operations))
+        
+        # 4. Agrupar por años
+        report = self._build_report(portfolio_id, results)
+        return report
 
+    async def convert_operations(
+        self,
+        operations: List[FiscalOperation],
+        target_currency: str,
+        db: AsyncSession
+    ):
+        """Convierte precio y comisiones de cada operación a la moneda objetivo (tasa de la fecha de operación)"""
+        logger.debug(f"Conversión de divisa de operaciones fiscales a {target_currency}")
+        for op in operations:
+            if op.asset_currency and op.asset_currency != target_currency:
+                # Convertir a moneda objetivo usando fecha de operación
+                try:
+                    rate = await forex_service.get_exchange_rate(
+                        op.asset_currency, 
+                        target_currency, 
+                        op.date.date(), 
+                        db
+                    )
+                    # DEBUG
+                    # print(f"DEBUG: Converting {op.asset_symbol} {op.date.date()} USD->EUR Rate: {rate}")
+                    
+                    if rate:
+                        # Guardamos los originales si aún no se han rellenado en la creación
+                        # Aunque ya lo hicimos en el API, nos aseguramos aquí
+                        if op.original_price is None:
+                            op.original_price = op.price
+                            op.original_fees = op.fees
+
+                        op.price = op.price * Decimal(str(rate))
+                        op.fees = op.fees * Decimal(str(rate))
+                        # op.asset_currency = target_currency # No cambiamos la etiqueta para mantener rastro, pero los valores ya están convertidos
+                except Exception as e:
+                    logger.error(f"❌ Error convirtiendo divisa para el informe fiscal ({op.asset_symbol}): {e}")
+
+    def iter_fiscal_results(self, operations: List[FiscalOperation]) -> Iterator[FiscalResultItem]:
+        """
+        Genera los resultados FIFO uno a uno, ya con la regla de wash sale aplicada,
+        en el mismo orden en que los emite el motor.
+
+        La regla de los 2 meses necesita saber qué compras acaban vendidas (incluso por
+        ventas posteriores), así que primero se hace una pasada que solo acumula el consumo
+        de lotes y se descartan los items; la segunda pasada los emite. Así la memoria no
+        crece con el número de resultados (exportaciones en streaming).
+        """
         # 1. Ordenar operaciones cronológicamente
         ops = sorted(operations, key=lambda x: x.date)
         
-        # Estructuras de estado
-        open_positions: Dict[str, deque[PositionLot]] = {} # asset_id -> Queue of lots
-        results: List[FiscalResultItem] = []
         # Mapa para rastrear consumo de lotes (buy_id -> quantity_sold)
         buy_consumption_map = {}
+        open_positions: Dict[str, deque[PositionLot]] = {} # asset_id -> Queue of lots
+        for op in ops:
+            if op.type == TransactionType.BUY:
+                self._process_buy(op, open_positions)
+            elif op.type == TransactionType.SELL:
+                self._process_sell(op, open_positions, buy_consumption_map)
+
+        buys_by_symbol = self._group_buys_by_symbol(ops)
+        # Mapa para rastrear qué cantidad de cada compra ya se ha usado para "lavar" pérdidas
+        buy_usage_map = {}
         
         # 2. Procesar FIFO
+        open_positions = {}
         for op in ops:
             if op.type == TransactionType.BUY:
                 self._process_buy(op, open_positions)
             elif op.type == TransactionType.SELL:
-                sale_results = self._process_sell(op, open_positions, buy_consumption_map)
-                results.extend(sale_results)
-                
-        # 3. Aplicar Regla de los 2 Meses (Wash Sales)
-        self._apply_wash_sale_rules(results, ops, buy_consumption_map)
-        
-        # 4. Agrupar por años
-        report = self._build_report(portfolio_id, results)
-        return report
+                # El consumo ya está calculado: usamos un mapa desechable
+                for item in self._process_sell(op, open_positions, {}):
+                    # 3. Aplicar Regla de los 2 Meses (Wash Sales)
+                    self._apply_wash_sale_rule(item, buys_by_symbol, buy_consumption_map, buy_usage_map)
+                    yield item
 
     def _process_buy(self, op: FiscalOperation, open_positions: Dict[str, deque[PositionLot]]):
         if op.asset_id not in open_positions:
@@ -188,11 +263,7 @@ class FiscalService:
                 
         return results
 
-    def _apply_wash_sale_rules(self, results: List[FiscalResultItem], all_ops: List[FiscalOperation], buy_consumption_map: Dict[str, Decimal]):
-        """
-        Aplica la norma anti-aplicación de pérdidas (regla de los 2 meses).
-        Si se ha comprado valores homogéneos 2 meses antes o después de una venta con pérdidas.
-        """
+    def _group_buys_by_symbol(self, all_ops: List[FiscalOperation]) -> Dict[str, List[FiscalOperation]]:
         # Agrupar compras por symbol para acceso rápido
         buys_by_symbol = {}
         for op in all_ops:
@@ -200,71 +271,75 @@ class FiscalService:
                 if op.asset_symbol not in buys_by_symbol:
                     buys_by_symbol[op.asset_symbol] = []
                 buys_by_symbol[op.asset_symbol].append(op)
+        return buys_by_symbol
 
+    def _apply_wash_sale_rule(
+        self,
+        item: FiscalResultItem,
+        buys_by_symbol: Dict[str, List[FiscalOperation]],
+        buy_consumption_map: Dict[str, Decimal],
+        buy_usage_map: Dict[str, Decimal]
+    ):
+        """Aplica la regla de los 2 meses a un único resultado (los items deben llegar en orden FIFO)."""
         window = timedelta(days=60) # Aproximación de 2 meses
-        
-        # Mapa para rastrear qué cantidad de cada compra ya se ha usado para "lavar" pérdidas
-        # buy_id -> quantity_used_for_wash
-        buy_usage_map = {}
 
-        for item in results:
-            if item.gross_result < 0:
-                potential_buys = buys_by_symbol.get(item.asset_symbol, [])
+        if item.gross_result < 0:
+            potential_buys = buys_by_symbol.get(item.asset_symbol, [])
+            
+            # Cantidad de la pérdida que necesitamos "cubrir" con recompras
+            remaining_loss_qty = item.quantity_sold
+            matched_wash_qty = Decimal(0)
+
+            for buy in potential_buys:
+                # Excluir la compra original que originó este lote (aunque por fecha no debería solaparse si held > 0)
+                if buy.date == item.acquisition_date:
+                    continue
+                    
+                # Verificar si esta compra ha sido VENDIDA (posición cerrada)
+                # Si ya se vendió, no bloquea la pérdida (o la desbloquea en el mismo ejercicio)
+                # Para simplificar el reporte anual: si se vendió, ignoremos el wash sale.
+                buy_id = getattr(buy, 'id', str(id(buy)))
+                sold_qty = buy_consumption_map.get(buy_id, Decimal(0))
                 
-                # Cantidad de la pérdida que necesitamos "cubrir" con recompras
-                remaining_loss_qty = item.quantity_sold
-                matched_wash_qty = Decimal(0)
-
-                for buy in potential_buys:
-                    # Excluir la compra original que originó este lote (aunque por fecha no debería solaparse si held > 0)
-                    if buy.date == item.acquisition_date:
-                        continue
-                        
-                    # Verificar si esta compra ha sido VENDIDA (posición cerrada)
-                    # Si ya se vendió, no bloquea la pérdida (o la desbloquea en el mismo ejercicio)
-                    # Para simplificar el reporte anual: si se vendió, ignoremos el wash sale.
-                    buy_id = getattr(buy, 'id', str(id(buy)))
-                    sold_qty = buy_consumption_map.get(buy_id, Decimal(0))
+                # DEBUG LOG
+                # print(f"DEBUG WASH: Buy {buy.asset_symbol} Qty={buy.quantity} Sold={sold_qty}")
+
+                # Si se ha vendido todo el lote de recompra, saltar
+                if sold_qty >= buy.quantity:
+                    continue
+
+                # Verificar ventana temporal
+                if (item.sale_date - window) <= buy.date <= (item.sale_date + window):
+                    # Esta compra está en la ventana. Es candidata para Wash Sale.
+                    # Verificar cuánta cantidad de esta compra está disponible (no usada por otro wash sale)
+                    used_qty = buy_usage_map.get(buy_id, Decimal(0))
+                    available_qty = buy.quantity - used_qty
                     
-                    # DEBUG LOG
-                    # print(f"DEBUG WASH: Buy {buy.asset_symbol} Qty={buy.quantity} Sold={sold_qty}")
-
-                    # Si se ha vendido todo el lote de recompra, saltar
-                    if sold_qty >= buy.quantity:
-                        continue
-
-                    # Verificar ventana temporal
-                    if (item.sale_date - window) <= buy.date <= (item.sale_date + window):
-                        # Esta compra está en la ventana. Es candidata para Wash Sale.
-                        # Verificar cuánta cantidad de esta compra está disponible (no usada por otro wash sale)
-                        used_qty = buy_usage_map.get(buy_id, Decimal(0))
-                        available_qty = buy.quantity - used_qty
+                    if available_qty > 0:
+                        # Tomar lo que necesitemos hasta cubrir la venta
+                        match = min(remaining_loss_qty, available_qty)
+                        
+                        matched_wash_qty += match
+                        remaining_loss_qty -= match
+                        
+                        # Marcar como usada
+                        buy_usage_map[buy_id] = used_qty + match
                         
-                        if available_qty > 0:
-                            # Tomar lo que necesitemos hasta cubrir la venta
-                            match = min(remaining_loss_qty, available_qty)
-                            
-                            matched_wash_qty += match
-                            remaining_loss_qty -= match
-                            
-                            # Marcar como usada
-                            buy_usage_map[buy_id] = used_qty + match
-                            
-                            if remaining_loss_qty <= 0:
-                                break
+                        if remaining_loss_qty <= 0:
+                            break
+            
+            if matched_wash_qty > 0:
+                item.is_wash_sale = True
+                # Calcular la proporción de la pérdida que no es computable
+                # Si vendí 100 y recompré 10, matched=10. Proporción = 10/100 = 0.1
+                # Pérdida bloqueada = Pérdida total * 0.1
+                ratio = matched_wash_qty / item.quantity_sold
+                item.wash_sale_disallowed_loss = item.gross_result * ratio
                 
-                if matched_wash_qty > 0:
-                    item.is_wash_sale = True
-                    # Calcular la proporción de la pérdida que no es computable
-                    # Si vendí 100 y recompré 10, matched=10. Proporción = 10/100 = 0.1
-                    # Pérdida bloqueada = Pérdida total * 0.1
-                    ratio = matched_wash_qty / item.quantity_sold
-                    item.wash_sale_disallowed_loss = item.gross_result * ratio
-                    
-                    if ratio < 1:
-                        item.notes = f"Wash Sale Parcial ({ratio:.1%}): Recompra de {matched_wash_qty} uds."
-                    else:
-                        item.notes = "Lavado de activos (Wash Sale): Recompra total."
+                if ratio < 1:
+                    item.notes = f"Wash Sale Parcial ({ratio:.1%}): Recompra de {matched_wash_qty} uds."
+                else:
+                    item.notes = "Lavado de activos (Wash Sale): Recompra total."
 
     def _build_report(self, portfolio_id: str, results: List[FiscalResultItem]) -> FiscalReport:
         years = {}
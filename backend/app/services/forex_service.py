@@ -10,6 +10,7 @@ from sqlalchemy import select, and_
 
 from app.models.asset import Asset, AssetType
 from app.models.quote import Quote
+from app.services.price_store_service import price_store_service, day_to_date
 
 logger = logging.getLogger(__name__)
 
@@ -220,21 +221,29 @@ class ForexService:
         # Buscar todas las cotizaciones para estos activos en el rango
         lookback_start = start_date - timedelta(days=7)
         
-        quotes_result = await db.execute(
-            select(Quote).where(
-                and_(
-                    Quote.asset_id.in_([a.id for a in assets.values()]),
-                    Quote.date >= lookback_start,
-                    Quote.date <= end_date
-                )
-            ).order_by(Quote.date)
-        )
-        quotes = quotes_result.scalars().all()
-        
-        # Organizar por (asset_id, date)
+        # Organizar por (asset_id, date): almacén de precios local y BD para los que no estén
         quotes_by_asset: Dict[str, Dict[date, float]] = defaultdict(dict)
-        for q in quotes:
-            quotes_by_asset[str(q.asset_id)][q.date.date()] = float(q.close)
+        db_asset_ids = []
+        for asset in assets.values():
+            series = price_store_service.get_range(asset.id, lookback_start, end_date)
+            if series is None:
+                db_asset_ids.append(asset.id)
+                continue
+            days, ohlc = series
+            quotes_by_asset[str(asset.id)] = dict(zip(map(day_to_date, days.tolist()), ohlc[3].tolist()))
+        
+        if db_asset_ids:
+            quotes_result = await db.execute(
+                select(Quote.asset_id, Quote.date, Quote.close).where(
+                    and_(
+                        Quote.asset_id.in_(db_asset_ids),
+                        Quote.date >= lookback_start,
+                        Quote.date <= end_date
+                    )
+                ).order_by(Quote.date)
+            )
+            for q in quotes_result.all():
+                quotes_by_asset[str(q.asset_id)][q.date.date()] = float(q.close)
             
         # Llenar la caché para el rango solicitado
         for from_curr, to_curr in pairs:
@@ -0,0 +1,257 @@
+"""
+Backfill de cotizaciones con los agregados diarios agrupados de Polygon.io.
+
+El endpoint agrupado devuelve el OHLCV de TODOS los tickers de EEUU (o de todos
+los pares crypto) de un día en una sola petición. Con el límite del plan
+gratuito (5 peticiones/minuto) reparar N activos a lo largo de D días cuesta D
+peticiones en lugar de N, lo que compensa en cuanto hay más activos que días.
+
+Solo se consideran activos que Polygon identifica por el mismo ticker:
+- acciones/ETF de mercados de EEUU (calendario XNYS) sin sufijo de bolsa
+- crypto con par en USD (BTC-USD -> X:BTCUSD)
+El resto sigue reparándose por activo (importación masiva).
+
+El progreso se guarda en Redis para que cualquier worker del API lo consulte y
+un lock evita ejecuciones solapadas.
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis_client import redis_client
+from app.models.asset import Asset, AssetType
+from app.services.polygon_service import polygon_service
+from app.services.price_store_service import price_store_service
+from app.services.quote_coverage_service import quote_coverage_service
+from app.services.quote_writer_service import quote_writer_service
+from app.services.trading_calendar_service import trading_calendar_service, CRYPTO_CALENDAR
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "grouped_backfill:active"
+PROGRESS_KEY = "grouped_backfill:progress"
+# El lock se renueva tras cada día procesado; si el proceso muere caduca solo
+LOCK_TTL_SECONDS = 15 * 60
+PROGRESS_TTL_SECONDS = 7 * 24 * 3600
+# Histórico disponible en el plan gratuito de Polygon
+POLYGON_HISTORY_DAYS = 730
+GROUPED_SOURCE = "polygon_grouped"
+
+# Mercado Polygon -> calendario con el que se enumeran los días a pedir
+MARKET_CALENDAR_CODES = {"stocks": "XNYS", "crypto": CRYPTO_CALENDAR}
+
+
+class GroupedBackfillRunning(Exception):
+    """Ya hay un backfill agrupado en curso"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def polygon_grouped_ticker(symbol: str, asset_type, market: Optional[str]) -> Optional[tuple]:
+    """
+    (mercado Polygon, ticker) con el que aparece el activo en los agregados agrupados,
+    o None si no está cubierto.
+    """
+    symbol = (symbol or "").strip().upper()
+    if not symbol:
+        return None
+
+    if asset_type == AssetType.CRYPTO:
+        base = symbol.replace("/", "-")
+        if base.endswith("-USD"):
+            return "crypto", f"X:{base[:-4]}USD"
+        return None
+
+    if trading_calendar_service.calendar_code_for_market(market) != "XNYS":
+        return None
+    # Índices (^GSPC), forex (EURUSD=X) y tickers con sufijo no están en el agrupado de acciones
+    if symbol.startswith("^") or "=" in symbol or "." in symbol or "-" in symbol:
+        return None
+    return "stocks", symbol
+
+
+class GroupedBackfillService:
+    """Reparación por fecha (una petición por día) para activos de EEUU y crypto"""
+
+    @property
+    def redis(self):
+        return redis_client.client
+
+    async def start(self, asset_ids: Optional[List[str]] = None, user_id: Optional[str] = None) -> bool:
+        """
+        Toma el lock de ejecución (llamar antes de lanzar run en segundo plano).
+
+        Raises:
+            GroupedBackfillRunning: si ya hay un backfill en curso
+        """
+        if not await self.redis.set(LOCK_KEY, _now(), nx=True, ex=LOCK_TTL_SECONDS):
+            raise GroupedBackfillRunning()
+        await self._save_progress({
+            "status": "queued",
+            "created_by": user_id,
+            "asset_ids": len(asset_ids) if asset_ids else None,
+            "created_at": _now(),
+        })
+        return True
+
+    async def get_progress(self) -> Dict:
+        raw = await self.redis.get(PROGRESS_KEY)
+        return json.loads(raw) if raw else {"status": "idle"}
+
+    async def run(self, asset_ids: Optional[List[str]] = None) -> Dict:
+        """
+        Descarga por fecha las sesiones que faltan de los activos cubiertos y las
+        guarda con upsert (ON CONFLICT DO NOTHING: no toca lo ya existente).
+
+        Args:
+            asset_ids: Activos a reparar (por defecto todos los sincronizados)
+        """
+        progress = {
+            "status": "running",
+            "started_at": _now(),
+            "finished_at": None,
+            "markets": {},
+            "assets": 0,
+            "requests": 0,
+            "inserted": 0,
+            "errors": [],
+        }
+
+        try:
+            plan = await self._plan(asset_ids)
+            progress["assets"] = sum(len(p["since"]) for p in plan.values())
+            progress["markets"] = {
+                market: {"assets": len(p["since"]), "dates_total": len(p["dates"]), "dates_done": 0, "rows": 0}
+                for market, p in plan.items()
+            }
+            await self._save_progress(progress)
+
+            for market, market_plan in plan.items():
+                await self._backfill_market(market, market_plan, progress)
+
+            progress["status"] = "completed"
+        except Exception as e:
+            logger.error(f"❌ Error en backfill agrupado de Polygon: {e}", exc_info=True)
+            progress["status"] = "failed"
+            progress["errors"].append(str(e))
+        finally:
+            progress["finished_at"] = _now()
+            await self._save_progress(progress)
+            await self._release()
+
+        logger.info(
+            f"✅ Backfill agrupado de Polygon ({progress['status']}): {progress['requests']} peticiones, "
+            f"{progress['inserted']} cotizaciones nuevas para {progress['assets']} activos"
+        )
+        return progress
+
+    async def _plan(self, asset_ids: Optional[List[str]]) -> Dict[str, Dict]:
+        """
+        Por mercado Polygon: ticker -> asset_id, primera fecha a reparar por activo
+        y días (sesiones del calendario) a pedir.
+        """
+        today = date.today()
+        history_start = today - timedelta(days=POLYGON_HISTORY_DAYS)
+
+        async with AsyncSessionLocal() as db:
+            query = select(Asset.id, Asset.symbol, Asset.asset_type, Asset.market)
+            if asset_ids:
+                query = query.where(Asset.id.in_(asset_ids))
+            else:
+                query = query.where(Asset.sync_enabled == True)
+            assets = (await db.execute(query)).all()
+
+            covered = {}
+            for asset in assets:
+                target = polygon_grouped_ticker(asset.symbol, asset.asset_type, asset.market)
+                if target:
+                    covered[str(asset.id)] = target
+            coverage_map = await quote_coverage_service.get_coverage_map(db, list(covered)) if covered else {}
+
+        plan: Dict[str, Dict] = defaultdict(lambda: {"tickers": {}, "since": {}, "dates": []})
+        for asset_id, (market, ticker) in covered.items():
+            coverage = coverage_map.get(asset_id)
+            if not coverage or not coverage["first_missing_date"]:
+                continue
+            market_plan = plan[market]
+            market_plan["tickers"][ticker] = asset_id
+            market_plan["since"][asset_id] = max(coverage["first_missing_date"], history_start)
+
+        for market, market_plan in plan.items():
+            calendar = trading_calendar_service.get_calendar(MARKET_CALENDAR_CODES[market])
+            # La sesión de hoy no está cerrada: hasta la última sesión completa
+            end = calendar.previous_session(today)
+            start = min(market_plan["since"].values())
+            market_plan["dates"] = calendar.sessions(start, end) if start <= end else []
+
+        return dict(plan)
+
+    async def _backfill_market(self, market: str, market_plan: Dict, progress: Dict):
+        stats = progress["markets"][market]
+        tickers = market_plan["tickers"]
+        since = market_plan["since"]
+        pending_rows: List[Dict] = []
+
+        logger.info(
+            f"🚀 Backfill agrupado {market}: {len(since)} activos, "
+            f"{len(market_plan['dates'])} días ({len(market_plan['dates'])} peticiones)"
+        )
+
+        for day in market_plan["dates"]:
+            grouped = await polygon_service.get_grouped_daily(day, market)
+            progress["requests"] += 1
+            if grouped is None:
+                progress["errors"].append(f"{market} {day}: sin respuesta de Polygon")
+            else:
+                for ticker, quote in grouped.items():
+                    asset_id = tickers.get(ticker)
+                    if asset_id and since[asset_id] <= day:
+                        pending_rows.append({**quote, "asset_id": asset_id})
+
+            if len(pending_rows) >= settings.IMPORT_WRITER_BATCH_ROWS:
+                await self._flush(pending_rows, stats, progress)
+                pending_rows = []
+
+            stats["dates_done"] += 1
+            await self._save_progress(progress)
+            await self._renew_lock()
+
+        if pending_rows:
+            await self._flush(pending_rows, stats, progress)
+            await self._save_progress(progress)
+
+    async def _flush(self, rows: List[Dict], stats: Dict, progress: Dict):
+        async with AsyncSessionLocal() as db:
+            try:
+                counts = await quote_writer_service.upsert_quotes(db, rows, source=GROUPED_SOURCE)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        await price_store_service.publish_changes(counts["by_asset"])
+        stats["rows"] += counts["inserted"]
+        progress["inserted"] += counts["inserted"]
+
+    async def _save_progress(self, progress: Dict):
+        if self.redis is None:
+            return
+        await self.redis.set(PROGRESS_KEY, json.dumps(progress, default=str), ex=PROGRESS_TTL_SECONDS)
+
+    async def _renew_lock(self):
+        if self.redis is not None:
+            await self.redis.expire(LOCK_KEY, LOCK_TTL_SECONDS)
+
+    async def _release(self):
+        if self.redis is not None:
+            await self.redis.delete(LOCK_KEY)
+
+
+grouped_backfill_service = GroupedBackfillService()
@@ -0,0 +1,361 @@
+"""
+Reparación de lagunas en el histórico de cotizaciones.
+
+Para cada activo:
+1. Determina el rango necesario (cobertura: primera transacción - 7 días, o 1 año).
+2. Identifica sesiones de su bolsa sin cotización (lagunas, sin contar festivos).
+3. Descarga (Polygon con fallback a Yahoo) desde la primera laguna y guarda con upsert.
+
+La reparación se ejecuta como un pipeline productor/consumidor (RepairPipeline):
+
+    descargadores (N tareas) -> cola acotada -> escritor único por lotes
+
+Los descargadores solo hacen E/S de red; el escritor agrupa las cotizaciones de
+varios activos en un único upsert masivo (COPY a partir de copy_threshold filas)
+y una sola transacción. Si la BD va más lenta que los feeds, la cola se llena y
+las descargas esperan (backpressure) en lugar de acumular memoria.
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.price_store_service import price_store_service
+from app.services.quote_coverage_service import quote_coverage_service
+from app.services.quote_provider_service import quote_provider_service
+from app.services.quote_writer_service import quote_writer_service
+
+logger = logging.getLogger(__name__)
+
+REPAIR_SOURCE = "historical_repair"
+# Espera máxima del escritor para completar un lote antes de escribir lo que tenga
+WRITER_LINGER_SECONDS = 0.5
+
+AssetSource = Callable[[], Awaitable[Optional[Dict]]]
+ResultCallback = Callable[[Dict, Dict], Awaitable[None]]
+MetricsCallback = Callable[[Dict], Awaitable[None]]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def list_source(assets: List[Dict]) -> AssetSource:
+    """Fuente de activos para el pipeline a partir de una lista en memoria"""
+    pending = iter(assets)
+
+    async def next_asset() -> Optional[Dict]:
+        return next(pending, None)
+
+    return next_asset
+
+
+class RepairPipeline:
+    """
+    Ejecución de una reparación: descargadores concurrentes que alimentan una
+    cola acotada y un único escritor que la vacía en lotes.
+
+    Cada activo termina con una llamada a on_result(asset, result), donde result es
+    {"state": "skipped" | "done" | "no_data" | "failed", "saved": n, "missing": n, "error": str | None}.
+    """
+
+    def __init__(
+        self,
+        force_refresh: bool = False,
+        downloaders: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        batch_rows: Optional[int] = None,
+        on_result: Optional[ResultCallback] = None,
+        on_metrics: Optional[MetricsCallback] = None
+    ):
+        self.force_refresh = force_refresh
+        self.downloaders = downloaders or settings.IMPORT_WORKERS
+        self.batch_rows = batch_rows or settings.IMPORT_WRITER_BATCH_ROWS
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or settings.IMPORT_QUEUE_SIZE)
+        self.on_result = on_result
+        self.on_metrics = on_metrics
+        self.metrics = {
+            "started_at": None,
+            "finished_at": None,
+            "downloaders": self.downloaders,
+            "download": {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0},
+            "write": {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "assets": 0},
+            "queue": {"maxsize": self.queue.maxsize, "max_depth": 0, "blocked_puts": 0, "wait_seconds": 0.0},
+        }
+
+    async def run(self, next_asset: AssetSource) -> Dict:
+        """
+        Procesa activos hasta que next_asset() devuelve None y el escritor vacía la cola.
+
+        Returns:
+            Métricas finales (ver get_metrics)
+        """
+        self.metrics["started_at"] = _now()
+        writer = asyncio.create_task(self._writer())
+        downloaders = [asyncio.create_task(self._downloader(next_asset)) for _ in range(self.downloaders)]
+
+        try:
+            outcomes = await asyncio.gather(*downloaders, return_exceptions=True)
+            # Lo ya descargado se escribe aunque algún descargador haya fallado
+            await self.queue.put(None)
+            await writer
+            for outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    raise outcome
+        finally:
+            for task in (*downloaders, writer):
+                task.cancel()
+            await asyncio.gather(*downloaders, writer, return_exceptions=True)
+            self.metrics["finished_at"] = _now()
+            await self._emit_metrics()
+
+        return self.get_metrics()
+
+    def get_metrics(self) -> Dict:
+        """Métricas por etapa (tiempos medios y máximos) y estado de la cola"""
+        metrics = {
+            **self.metrics,
+            "download": dict(self.metrics["download"]),
+            "write": dict(self.metrics["write"]),
+            "queue": {**self.metrics["queue"], "depth": self.queue.qsize()},
+        }
+        for stage in ("download", "write"):
+            stats = metrics[stage]
+            stats["avg_seconds"] = round(stats["seconds"] / stats["count"], 3) if stats["count"] else 0.0
+            stats["seconds"] = round(stats["seconds"], 3)
+            stats["max_seconds"] = round(stats["max_seconds"], 3)
+        metrics["queue"]["wait_seconds"] = round(metrics["queue"]["wait_seconds"], 3)
+        return metrics
+
+    # ------------------------------------------------------------------
+    # Etapas
+    # ------------------------------------------------------------------
+
+    async def _downloader(self, next_asset: AssetSource):
+        while True:
+            asset = await next_asset()
+            if asset is None:
+                return
+
+            started = time.monotonic()
+            try:
+                item = await self._download(asset)
+            except Exception as e:
+                logger.error(f"❌ Error reparando {asset['symbol']}: {str(e)}")
+                await self._report(asset, {"state": "failed", "saved": 0, "missing": 0, "error": str(e)})
+                continue
+            finally:
+                self._record("download", time.monotonic() - started)
+
+            if item is None:
+                continue
+
+            self.metrics["download"]["rows"] += len(item["rows"])
+            queue_stats = self.metrics["queue"]
+            if self.queue.full():
+                queue_stats["blocked_puts"] += 1
+            wait_started = time.monotonic()
+            await self.queue.put(item)
+            queue_stats["wait_seconds"] += time.monotonic() - wait_started
+            queue_stats["max_depth"] = max(queue_stats["max_depth"], self.queue.qsize())
+
+    async def _download(self, asset: Dict) -> Optional[Dict]:
+        """Descarga las cotizaciones que faltan de un activo (None si no hay nada que escribir)"""
+        asset_id = asset["id"]
+        symbol = asset["symbol"]
+
+        # 1. Determinar rango de reparación
+        # Usar la lógica de cobertura centralizada para ser consistentes
+        coverage = asset.get("coverage")
+        if coverage is None:
+            async with AsyncSessionLocal() as db:
+                coverage = await quote_coverage_service.get_coverage(db, asset_id)
+            if coverage is None:
+                raise ValueError("Activo no encontrado")
+        start_date = coverage["required_start_date"]
+
+        logger.info(f"🔎 Analizando {symbol} desde {start_date} hasta hoy (Reparación)")
+
+        # 2. Sesiones faltantes (lagunas) según el calendario de la bolsa del activo
+        missing_count = coverage["missing_days_count"]
+
+        if not missing_count and not self.force_refresh:
+            logger.info(f"✅ {symbol} no tiene lagunas detectadas. Saltando.")
+            await self._report(asset, {"state": "skipped", "saved": 0, "missing": 0, "error": None})
+            return None
+
+        logger.info(f"📥 {symbol} tiene {missing_count} lagunas. Intentando descarga...")
+
+        # 3. Descarga de datos MULTI-FUENTE (Usando Facade)
+        # Solo desde la primera sesión sin cotización (festivos excluidos por calendario)
+        if coverage["first_missing_date"] and not self.force_refresh:
+            start_date = coverage["first_missing_date"]
+
+        quotes_data = await quote_provider_service.get_historical_quotes(
+            symbol,
+            start_date=start_date,
+            end_date=date.today(),
+            # force_refresh reescribe con datos frescos (p. ej. ajustes por splits)
+            use_cache=not self.force_refresh
+        )
+
+        if not quotes_data:
+            logger.warning(f"❌ Sin datos disponibles en ningún feed para {symbol}")
+            await self._report(asset, {
+                "state": "no_data", "saved": 0, "missing": missing_count, "error": "Sin datos en Feeds"
+            })
+            return None
+
+        return {
+            "asset": asset,
+            "missing": missing_count,
+            "rows": [{**quote_data, "asset_id": asset_id} for quote_data in quotes_data],
+        }
+
+    async def _writer(self):
+        """Vacía la cola agrupando activos hasta batch_rows filas por escritura"""
+        finished = False
+        while not finished:
+            item = await self.queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            rows = len(item["rows"])
+            while rows < self.batch_rows:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), WRITER_LINGER_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+                rows += len(item["rows"])
+
+            await self._flush(batch)
+            await self._emit_metrics()
+
+    async def _flush(self, batch: List[Dict]):
+        """Escribe un lote; si falla, reintenta activo a activo para aislar el error"""
+        try:
+            by_asset = await self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                item = batch[0]
+                logger.error(f"❌ Error guardando {item['asset']['symbol']}: {str(e)}")
+                await self._report(item["asset"], {
+                    "state": "failed", "saved": 0, "missing": item["missing"], "error": str(e)
+                })
+                return
+            logger.warning(f"⚠️ Error en lote de escritura ({len(batch)} activos), reintentando por activo: {e}")
+            for item in batch:
+                await self._flush([item])
+            return
+
+        for item in batch:
+            counts = by_asset.get(str(item["asset"]["id"]), {})
+            saved_count = counts.get("inserted", 0) + counts.get("updated", 0)
+            logger.info(f"✅ {item['asset']['symbol']}: Reparado con {saved_count} nuevas cotizaciones")
+            await self._report(item["asset"], {
+                "state": "done", "saved": saved_count, "missing": item["missing"], "error": None
+            })
+
+    async def _write(self, batch: List[Dict]) -> Dict[str, Dict[str, int]]:
+        started = time.monotonic()
+        rows = [row for item in batch for row in item["rows"]]
+
+        async with AsyncSessionLocal() as db:
+            try:
+                # Guardar lo que falte (o reescribir si force_refresh)
+                counts = await quote_writer_service.upsert_quotes(
+                    db, rows, source=REPAIR_SOURCE, update_existing=self.force_refresh
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        await price_store_service.publish_changes(counts["by_asset"])
+
+        self._record("write", time.monotonic() - started)
+        self.metrics["write"]["rows"] += len(rows)
+        self.metrics["write"]["assets"] += len(batch)
+        return counts["by_asset"]
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
+
+    def _record(self, stage: str, seconds: float):
+        stats = self.metrics[stage]
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    async def _report(self, asset: Dict, result: Dict):
+        if self.on_result is None:
+            return
+        try:
+            await self.on_result(asset, result)
+        except Exception as e:
+            logger.error(f"❌ Error registrando resultado de {asset['symbol']}: {e}")
+
+    async def _emit_metrics(self):
+        if self.on_metrics is None:
+            return
+        try:
+            await self.on_metrics(self.get_metrics())
+        except Exception as e:
+            logger.warning(f"⚠️ Error publicando métricas de reparación: {e}")
+
+
+class HistoricalRepairService:
+    """Reparación de histórico (usada por la importación masiva y los scripts)"""
+
+    def create_pipeline(self, force_refresh: bool = False, **kwargs) -> RepairPipeline:
+        return RepairPipeline(force_refresh=force_refresh, **kwargs)
+
+    async def run(self, assets: List[Dict], force_refresh: bool = False) -> Dict:
+        """Reparación de una lista de activos en el proceso actual (scripts de mantenimiento)"""
+        logger.info(f"🚀 Iniciando importación y REPARACIÓN de {len(assets)} activos")
+
+        summary = {"processed": 0, "repaired_assets": 0, "total_quotes_saved": 0, "errors": []}
+
+        async def on_result(asset: Dict, result: Dict):
+            summary["processed"] += 1
+            if result["error"]:
+                summary["errors"].append(f"{asset['symbol']}: {result['error']}")
+            if result["saved"] > 0:
+                summary["repaired_assets"] += 1
+                summary["total_quotes_saved"] += result["saved"]
+
+        # Cobertura de todos los activos del lote en una sola consulta
+        async with AsyncSessionLocal() as db:
+            coverage_map = await quote_coverage_service.get_coverage_map(db, [a["id"] for a in assets])
+
+        pipeline = self.create_pipeline(force_refresh, on_result=on_result)
+        metrics = await pipeline.run(list_source([
+            {**asset, "coverage": coverage_map.get(str(asset["id"]))} for asset in assets
+        ]))
+
+        logger.info(f"""
+        ═══════════════════════════════════════
+        📊 REPARACIÓN HISTÓRICA COMPLETADA
+        ═══════════════════════════════════════
+        Activos procesados: {summary["processed"]}
+        Activos con lagunas reparadas: {summary["repaired_assets"]}
+        Total cotizaciones añadidas: {summary["total_quotes_saved"]}
+        Errores: {len(summary["errors"])}
+        Descarga: {metrics["download"]["avg_seconds"]}s/activo (máx {metrics["download"]["max_seconds"]}s)
+        Escritura: {metrics["write"]["count"]} lotes, {metrics["write"]["avg_seconds"]}s/lote
+        Cola: profundidad máx {metrics["queue"]["max_depth"]}/{metrics["queue"]["maxsize"]}, \
+esperas {metrics["queue"]["wait_seconds"]}s
+        ═══════════════════════════════════════
+        """)
+        return {**summary, "metrics": metrics}
+
+
+historical_repair_service = HistoricalRepairService()
@@ -0,0 +1,387 @@
+"""
+Cola persistente (Redis) de trabajos de importación histórica masiva.
+
+Un trabajo se guarda en Redis con su estado, contadores y el estado de cada
+activo, por lo que sobrevive a reinicios del API. Solo puede haber un trabajo
+activo a la vez (lock import_jobs:active), lo que evita ejecuciones solapadas.
+
+Claves:
+    import_jobs:active              id del trabajo en curso (SET NX)
+    import_jobs:recent              últimos trabajos (lista, más reciente primero)
+    import_job:{id}                 hash con estado y contadores
+    import_job:{id}:assets          hash asset_id -> JSON {symbol, asset_type, state, saved, error}
+    import_job:{id}:pending         lista de asset_id pendientes
+    import_job:{id}:processing      lista de asset_id reclamados por algún worker
+    import_job:{id}:claims          hash asset_id -> worker_id
+    import_job:{id}:metrics         hash worker_id -> JSON con métricas del pipeline
+    import_worker:{worker_id}       heartbeat del worker (con TTL)
+
+Cada proceso consumidor ejecuta un pipeline de reparación (ver
+historical_repair_service.RepairPipeline): sus descargadores reclaman activos
+moviéndolos de pending a processing y anotando su dueño en un único script Lua
+(atómico), y un único escritor los guarda por lotes. Si un worker muere, su
+heartbeat expira y sus activos vuelven a pending: la reanudación es idempotente porque la escritura es un upsert.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone
+from functools import partial
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.services.historical_repair_service import historical_repair_service
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_KEY = "import_jobs:active"
+RECENT_KEY = "import_jobs:recent"
+RECENT_LIMIT = 20
+# Los registros de trabajos terminados se conservan una semana
+JOB_TTL_SECONDS = 7 * 24 * 3600
+HEARTBEAT_TTL_SECONDS = 30
+POLL_INTERVAL_SECONDS = 2
+
+# Mueve el siguiente activo de pending a processing y registra el worker que lo
+# reclama en una sola operación: la recuperación de reclamaciones huérfanas
+# nunca ve un activo en processing sin dueño.
+# KEYS: pending, processing, claims; ARGV: worker_id
+CLAIM_SCRIPT = """
+local asset_id = redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+if asset_id then
+    redis.call('HSET', KEYS[3], asset_id, ARGV[1])
+end
+return asset_id
+"""
+
+
+class ImportJobConflict(Exception):
+    """Ya hay un trabajo de importación activo"""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"Ya hay una importación masiva en curso ({job_id})")
+        self.job_id = job_id
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _job_key(job_id: str, suffix: str = "") -> str:
+    return f"import_job:{job_id}{':' + suffix if suffix else ''}"
+
+
+class ImportJobService:
+    """Creación/consulta de trabajos y workers que los consumen"""
+
+    def __init__(self):
+        # Sufijo aleatorio por arranque: un contenedor reiniciado conserva hostname y PID (1),
+        # y con el mismo id su heartbeat ocultaría los activos reclamados por el proceso anterior
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_running = False
+        self.concurrency = settings.IMPORT_WORKERS
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def redis(self):
+        return redis_client.client
+
+    # ------------------------------------------------------------------
+    # API de trabajos
+    # ------------------------------------------------------------------
+
+    async def create_job(self, assets: List[Dict], force_refresh: bool, user_id: str) -> Dict:
+        """
+        Crea y encola un trabajo para los activos indicados.
+
+        Raises:
+            ImportJobConflict: si ya hay un trabajo activo
+        """
+        job_id = uuid.uuid4().hex
+        if not await self.redis.set(ACTIVE_KEY, job_id, nx=True):
+            active_id = await self.redis.get(ACTIVE_KEY)
+            raise ImportJobConflict(active_id)
+
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "force_refresh": int(force_refresh),
+            "created_by": user_id,
+            "created_at": _now(),
+            "started_at": "",
+            "finished_at": "",
+            "total": len(assets),
+            "done": 0,
+            "skipped": 0,
+            "failed": 0,
+            "quotes_saved": 0,
+        }
+        asset_states = {
+            a["id"]: json.dumps({
+                "symbol": a["symbol"],
+                "asset_type": a["asset_type"].value if hasattr(a["asset_type"], "value") else a["asset_type"],
+                "state": "pending",
+                "saved": 0,
+                "error": None,
+            })
+            for a in assets
+        }
+
+        pipe = self.redis.pipeline()
+        pipe.hset(_job_key(job_id), mapping=job)
+        if asset_states:
+            pipe.hset(_job_key(job_id, "assets"), mapping=asset_states)
+            pipe.rpush(_job_key(job_id, "pending"), *asset_states.keys())
+        pipe.lpush(RECENT_KEY, job_id)
+        pipe.ltrim(RECENT_KEY, 0, RECENT_LIMIT - 1)
+        await pipe.execute()
+
+        logger.info(f"📋 Trabajo de importación {job_id} encolado ({len(assets)} activos)")
+        return await self.get_job(job_id)
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        """Estado y progreso de un trabajo"""
+        data = await self.redis.hgetall(_job_key(job_id))
+        if not data:
+            return None
+
+        pipe = self.redis.pipeline()
+        pipe.llen(_job_key(job_id, "pending"))
+        pipe.llen(_job_key(job_id, "processing"))
+        pipe.hgetall(_job_key(job_id, "metrics"))
+        pending, processing, metrics = await pipe.execute()
+
+        total = int(data.get("total", 0))
+        finished = int(data.get("done", 0)) + int(data.get("skipped", 0)) + int(data.get("failed", 0))
+        return {
+            "id": job_id,
+            "status": data.get("status"),
+            "force_refresh": data.get("force_refresh") == "1",
+            "created_by": data.get("created_by"),
+            "created_at": data.get("created_at") or None,
+            "started_at": data.get("started_at") or None,
+            "finished_at": data.get("finished_at") or None,
+            "total": total,
+            "done": int(data.get("done", 0)),
+            "skipped": int(data.get("skipped", 0)),
+            "failed": int(data.get("failed", 0)),
+            "quotes_saved": int(data.get("quotes_saved", 0)),
+            "pending": pending,
+            "processing": processing,
+            "progress": round(finished / total * 100, 1) if total else 100.0,
+            # Métricas del pipeline (tiempos por etapa, backpressure) por proceso consumidor
+            "pipeline": {worker: json.loads(value) for worker, value in metrics.items()},
+        }
+
+    async def get_job_assets(self, job_id: str, state: Optional[str] = None) -> List[Dict]:
+        """Estado por activo de un trabajo (opcionalmente filtrado por estado)"""
+        raw = await self.redis.hgetall(_job_key(job_id, "assets"))
+        assets = []
+        for asset_id, value in raw.items():
+            item = {"asset_id": asset_id, **json.loads(value)}
+            if state is None or item["state"] == state:
+                assets.append(item)
+        return sorted(assets, key=lambda a: a["symbol"])
+
+    async def list_jobs(self) -> List[Dict]:
+        """Últimos trabajos (más reciente primero)"""
+        job_ids = await self.redis.lrange(RECENT_KEY, 0, RECENT_LIMIT - 1)
+        jobs = []
+        for job_id in job_ids:
+            job = await self.get_job(job_id)
+            if job:
+                jobs.append(job)
+        return jobs
+
+    async def get_active_job_id(self) -> Optional[str]:
+        return await self.redis.get(ACTIVE_KEY)
+
+    async def cancel_job(self, job_id: str) -> Optional[Dict]:
+        """Cancela un trabajo: descarta lo pendiente (lo que está en curso termina)"""
+        job = await self.get_job(job_id)
+        if not job or job["status"] not in ("queued", "running"):
+            return job
+
+        pipe = self.redis.pipeline()
+        pipe.hset(_job_key(job_id), mapping={"status": "cancelled", "finished_at": _now()})
+        pipe.delete(_job_key(job_id, "pending"))
+        await pipe.execute()
+        await self._release(job_id)
+        logger.info(f"🛑 Trabajo de importación {job_id} cancelado")
+        return await self.get_job(job_id)
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    async def start_workers(self, concurrency: Optional[int] = None):
+        """Arranca el consumidor de importación en este proceso (concurrency = descargas en paralelo)"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.concurrency = concurrency or settings.IMPORT_WORKERS
+        self._tasks = [
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._worker_loop()),
+        ]
+        logger.info(f"🚀 Worker de importación iniciado ({self.concurrency} descargas) en {self.worker_id}")
+
+    async def stop_workers(self):
+        """Detiene los workers (los activos en curso se reanudarán en otro worker)"""
+        self.is_running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("🛑 Workers de importación detenidos")
+
+    async def run_forever(self, concurrency: Optional[int] = None):
+        """Bucle principal para un proceso dedicado de importación"""
+        await self.start_workers(concurrency)
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop_workers()
+
+    async def _heartbeat_loop(self):
+        while self.is_running:
+            try:
+                await self.redis.set(f"import_worker:{self.worker_id}", _now(), ex=HEARTBEAT_TTL_SECONDS)
+            except Exception as e:
+                logger.warning(f"⚠️ Error actualizando heartbeat de importación: {e}")
+            await asyncio.sleep(HEARTBEAT_TTL_SECONDS / 3)
+
+    async def _worker_loop(self):
+        while self.is_running:
+            try:
+                job_id = await self.redis.get(ACTIVE_KEY)
+                if not job_id:
+                    await asyncio.sleep(POLL_INTERVAL_SECONDS)
+                    continue
+
+                force_refresh = await self.redis.hget(_job_key(job_id), "force_refresh") == "1"
+                pipeline = historical_repair_service.create_pipeline(
+                    force_refresh,
+                    downloaders=self.concurrency,
+                    on_result=partial(self._on_asset_result, job_id),
+                    on_metrics=partial(self._store_metrics, job_id),
+                )
+                try:
+                    # Termina cuando no quedan activos pendientes y el escritor ha vaciado la cola
+                    await pipeline.run(partial(self._claim_next, job_id))
+                except Exception:
+                    # Activos reclamados por este proceso que no llegaron a terminar
+                    await self._recover_stale_claims(job_id, include_own=True)
+                    raise
+
+                await self._recover_stale_claims(job_id)
+                await self._finalize_if_done(job_id)
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error en worker de importación: {e}", exc_info=True)
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    async def _claim_next(self, job_id: str) -> Optional[Dict]:
+        """Reclama el siguiente activo pendiente del trabajo (None si no queda ninguno)"""
+        if not self.is_running:
+            return None
+
+        asset_id = await self.redis.eval(
+            CLAIM_SCRIPT, 3,
+            _job_key(job_id, "pending"), _job_key(job_id, "processing"), _job_key(job_id, "claims"),
+            self.worker_id,
+        )
+        if not asset_id:
+            return None
+
+        job_key = _job_key(job_id)
+        if await self.redis.hsetnx(job_key, "started_at", _now()):
+            await self.redis.hset(job_key, "status", "running")
+
+        raw = await self.redis.hget(_job_key(job_id, "assets"), asset_id)
+        state = json.loads(raw)
+        await self._set_asset_state(job_id, asset_id, state, state="running")
+        return {"id": asset_id, "symbol": state["symbol"], "asset_type": state["asset_type"], "job_state": state}
+
+    async def _on_asset_result(self, job_id: str, asset: Dict, result: Dict):
+        asset_id = asset["id"]
+        state = asset["job_state"]
+
+        if result["state"] in ("no_data", "failed"):
+            await self._set_asset_state(job_id, asset_id, state, state="failed", error=result["error"])
+            counter = "failed"
+        else:
+            await self._set_asset_state(job_id, asset_id, state, state=result["state"], saved=result["saved"])
+            counter = result["state"]
+
+        pipe = self.redis.pipeline()
+        pipe.hincrby(_job_key(job_id), counter, 1)
+        if result["saved"]:
+            pipe.hincrby(_job_key(job_id), "quotes_saved", result["saved"])
+        pipe.lrem(_job_key(job_id, "processing"), 0, asset_id)
+        pipe.hdel(_job_key(job_id, "claims"), asset_id)
+        await pipe.execute()
+
+    async def _store_metrics(self, job_id: str, metrics: Dict):
+        await self.redis.hset(_job_key(job_id, "metrics"), self.worker_id, json.dumps(metrics))
+
+    async def _set_asset_state(self, job_id: str, asset_id: str, asset: Dict, **changes):
+        asset.update(changes)
+        await self.redis.hset(_job_key(job_id, "assets"), asset_id, json.dumps(asset))
+
+    async def _recover_stale_claims(self, job_id: str, include_own: bool = False):
+        """
+        Devuelve a pending los activos reclamados por workers cuyo heartbeat ha expirado
+        (y los de este proceso si include_own, tras un fallo de su pipeline)
+        """
+        processing = await self.redis.lrange(_job_key(job_id, "processing"), 0, -1)
+        if not processing:
+            return
+        claims = await self.redis.hgetall(_job_key(job_id, "claims"))
+        for asset_id in processing:
+            owner = claims.get(asset_id)
+            is_own = include_own and owner == self.worker_id
+            if owner and not is_own and await self.redis.exists(f"import_worker:{owner}"):
+                continue
+            # Worker caído (o reclamo sin registrar): reanudar el activo
+            if await self.redis.lrem(_job_key(job_id, "processing"), 1, asset_id):
+                await self.redis.rpush(_job_key(job_id, "pending"), asset_id)
+                await self.redis.hdel(_job_key(job_id, "claims"), asset_id)
+                logger.warning(f"♻️ Reanudando activo {asset_id} del trabajo {job_id} (worker {owner})")
+
+    async def _finalize_if_done(self, job_id: str):
+        pipe = self.redis.pipeline()
+        pipe.llen(_job_key(job_id, "pending"))
+        pipe.llen(_job_key(job_id, "processing"))
+        pipe.hget(_job_key(job_id), "status")
+        pending, processing, status = await pipe.execute()
+
+        if pending or processing:
+            return
+        if status in ("queued", "running"):
+            await self.redis.hset(_job_key(job_id), mapping={"status": "completed", "finished_at": _now()})
+            job = await self.get_job(job_id)
+            logger.info(
+                f"✅ Importación masiva {job_id} completada: {job['done']} reparados, "
+                f"{job['skipped']} sin lagunas, {job['failed']} con error, {job['quotes_saved']} cotizaciones"
+            )
+        await self._release(job_id)
+
+    async def _release(self, job_id: str):
+        """Libera el lock de trabajo activo y programa la caducidad de sus claves"""
+        if await self.redis.get(ACTIVE_KEY) == job_id:
+            await self.redis.delete(ACTIVE_KEY)
+        pipe = self.redis.pipeline()
+        for suffix in ("", "assets", "pending", "processing", "claims", "metrics"):
+            pipe.expire(_job_key(job_id, suffix), JOB_TTL_SECONDS)
+        await pipe.execute()
+
+
+import_job_service = ImportJobService()
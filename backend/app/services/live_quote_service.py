@@ -0,0 +1,167 @@
+"""
+Difusión en tiempo real de cotizaciones (Redis pub/sub -> Server-Sent Events).
+
+MarketDataService publica en LIVE_CHANNEL las cotizaciones cuyo precio ha
+cambiado en cada ciclo. Cada proceso mantiene una única suscripción a Redis y
+reparte los mensajes a las conexiones SSE abiertas en él; cada conexión envía
+solo los símbolos que el usuario tiene en cartera. El cliente recibe los
+cambios al momento sin sondear posiciones ni el dashboard online.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Dict, Optional, Set
+
+from sqlalchemy import select, func, case
+
+from app.core.database import AsyncSessionLocal
+from app.core.redis_client import redis_client
+from app.models.asset import Asset
+from app.models.portfolio import Portfolio
+from app.models.transaction import Transaction, TransactionType
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANNEL = "quotes:live"
+# Comentario SSE periódico: mantiene viva la conexión a través de proxies
+HEARTBEAT_SECONDS = 15
+# Cada cuánto se vuelven a leer las posiciones del usuario (compras/ventas nuevas)
+HOLDINGS_REFRESH_SECONDS = 60
+# Mensajes pendientes por conexión (un cliente lento pierde los más antiguos)
+QUEUE_SIZE = 32
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class LiveQuoteService:
+    """Publicación de cambios de precio y reparto por usuario en este proceso"""
+
+    def __init__(self):
+        self._queues: Set[asyncio.Queue] = set()
+        self._listener: Optional[asyncio.Task] = None
+        self.stats = {"published": 0, "delivered": 0}
+
+    @property
+    def redis(self):
+        return redis_client.client
+
+    async def publish(self, quotes: Dict[str, dict]):
+        """Publica {symbol: cotización} (solo las que han cambiado) para todos los procesos"""
+        if not quotes or self.redis is None:
+            return
+        await self.redis.publish(LIVE_CHANNEL, json.dumps(quotes))
+        self.stats["published"] += len(quotes)
+
+    def get_stats(self) -> Dict:
+        return {"connections": len(self._queues), **self.stats}
+
+    # ------------------------------------------------------------------
+    # Suscripción (una por proceso)
+    # ------------------------------------------------------------------
+
+    def _ensure_listener(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        """Reparte los mensajes del canal a las colas mientras haya conexiones"""
+        while self._queues:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(LIVE_CHANNEL)
+                while self._queues:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    quotes = json.loads(message["data"])
+                    for queue in list(self._queues):
+                        if queue.full():
+                            queue.get_nowait()
+                        queue.put_nowait(quotes)
+            except Exception as e:
+                logger.error(f"❌ Error en la suscripción de cotizaciones en vivo: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.unsubscribe(LIVE_CHANNEL)
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    # ------------------------------------------------------------------
+    # Conexiones SSE
+    # ------------------------------------------------------------------
+
+    async def _user_symbols(self, user_id) -> Set[str]:
+        """Símbolos con saldo distinto de cero en alguna cartera del usuario"""
+        stmt = select(Asset.symbol).\
+            join(Transaction, Asset.id == Transaction.asset_id).\
+            join(Portfolio, Portfolio.id == Transaction.portfolio_id).\
+            where(Portfolio.user_id == user_id).\
+            group_by(Asset.id, Asset.symbol).\
+            having(
+                func.abs(
+                    func.sum(
+                        case(
+                            (Transaction.transaction_type == TransactionType.BUY, Transaction.quantity),
+                            (Transaction.transaction_type == TransactionType.SELL, -Transaction.quantity),
+                            else_=0
+                        )
+                    )
+                ) > 0.000001
+            )
+        async with AsyncSessionLocal() as db:
+            return set((await db.execute(stmt)).scalars().all())
+
+    async def _snapshot(self, symbols: Set[str]) -> Dict[str, dict]:
+        """Valores actuales de la tabla virtual para los símbolos dados"""
+        if not symbols:
+            return {}
+        ordered = sorted(symbols)
+        values = await self.redis.mget([f"quote:{s}" for s in ordered])
+        return {symbol: json.loads(value) for symbol, value in zip(ordered, values) if value}
+
+    async def stream(self, user_id) -> AsyncIterator[str]:
+        """
+        Eventos SSE para un usuario: primero "snapshot" con los precios actuales de sus
+        posiciones y después "quotes" con los símbolos de sus posiciones que cambian.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._queues.add(queue)
+        self._ensure_listener()
+        try:
+            symbols = await self._user_symbols(user_id)
+            symbols_loaded = time.monotonic()
+            snapshot = await self._snapshot(symbols)
+            # Varios procesos publican el mismo ciclo: enviar solo precios distintos al último enviado
+            last_sent = {symbol: quote.get("close") for symbol, quote in snapshot.items()}
+            yield _sse("snapshot", snapshot)
+
+            while True:
+                try:
+                    quotes = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+
+                if time.monotonic() - symbols_loaded > HOLDINGS_REFRESH_SECONDS:
+                    symbols = await self._user_symbols(user_id)
+                    symbols_loaded = time.monotonic()
+
+                changed = {
+                    symbol: quote for symbol, quote in quotes.items()
+                    if symbol in symbols and last_sent.get(symbol) != quote.get("close")
+                }
+                if changed:
+                    for symbol, quote in changed.items():
+                        last_sent[symbol] = quote.get("close")
+                    self.stats["delivered"] += len(changed)
+                    yield _sse("quotes", changed)
+        finally:
+            self._queues.discard(queue)
+
+
+live_quote_service = LiveQuoteService()
@@ -1,7 +1,9 @@
 import asyncio
 import logging
 import json
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
 from sqlalchemy import select, func, case
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import AsyncSessionLocal
@@ -9,6 +11,8 @@ from app.core.redis_client import redis_client
 from app.models.transaction import Transaction, TransactionType
 from app.models.asset import Asset, AssetType
 from app.services.yfinance_service import yfinance_service
+from app.services.trading_calendar_service import trading_calendar_service
+from app.services.live_quote_service import live_quote_service
 
 logger = logging.getLogger(__name__)
 
@@ -20,10 +24,17 @@ class MarketDataService:
     
     def __init__(self):
         self.is_running = False
-        self.update_interval = 60  # Segundos entre actualizaciones
+        self.update_interval = 60  # Segundos entre ciclos (y entre refrescos con el mercado abierto)
+        self.closed_interval = 30 * 60  # Segundos entre refrescos con el mercado cerrado
+        self.open_ttl = 300  # TTL en Redis de las cotizaciones de mercados abiertos
         self.last_update = None
         self.last_error = None
         self.tracked_symbols_count = 0
+        # symbol -> (último refresco en time.monotonic(), mercado abierto en ese refresco)
+        self._refresh_state: Dict[str, Tuple[float, bool]] = {}
+        # symbol -> último cierre publicado en vivo
+        self._published_closes: Dict[str, float] = {}
+        self.last_cycle = {"open": 0, "closed": 0, "refreshed": 0}
 
     async def start_background_service(self):
         """Inicia el bucle de actualización en segundo plano"""
@@ -53,32 +64,75 @@ class MarketDataService:
         """
         1. Identifica todos los activos con saldo > 0 en el sistema.
         2. Identifica todas las monedas catastradas para conversión.
-        3. Obtiene cotizaciones unificadas.
-        4. Actualiza la 'tabla virtual' (Redis).
+        3. Selecciona los símbolos que toca refrescar según el horario de su mercado.
+        4. Obtiene cotizaciones unificadas.
+        5. Actualiza la 'tabla virtual' (Redis).
         """
-        logger.info("🔄 Ejecutando ciclo de actualización de mercado...")
-        
         async with AsyncSessionLocal() as db:
-            active_symbols = await self._get_symbols_to_track(db)
+            tracked = await self._get_symbols_to_track(db)
             
-        if not active_symbols:
+        if not tracked:
             logger.info("⚠️ No hay activos ni monedas para trackear en el sistema.")
             return
 
-        logger.info(f"📊 {len(active_symbols)} símbolos a actualizar ({', '.join(active_symbols[:10])}...)")
+        self.tracked_symbols_count = len(tracked)
+        # Olvidar símbolos que ya no se siguen
+        for symbol in set(self._refresh_state) - set(tracked):
+            del self._refresh_state[symbol]
+
+        due_open, due_closed = self._due_symbols(tracked, datetime.now(timezone.utc))
+        due_symbols = due_open + due_closed  # Primero los de mercados abiertos
+        self.last_cycle["refreshed"] = len(due_symbols)
+        if not due_symbols:
+            return
+
+        logger.info(
+            f"🔄 Actualizando {len(due_symbols)}/{len(tracked)} símbolos "
+            f"({len(due_open)} con mercado abierto, {len(due_closed)} cerrado)"
+        )
         
         # Obtener cotizaciones de Yahoo Finance
         try:
-            quotes = await yfinance_service.fetch_real_time_quotes(active_symbols)
+            quotes = await yfinance_service.fetch_real_time_quotes(due_symbols)
             
             if quotes:
-                await self._update_virtual_table(quotes)
+                closed_ttl = self.closed_interval * 2
+                ttls = {symbol: closed_ttl for symbol in due_closed}
+                await self._update_virtual_table(quotes, ttls)
                 self.last_update = datetime.now()
-                self.tracked_symbols_count = len(quotes)
                 logger.info(f"✅ Tabla virtual actualizada con {len(quotes)} cotizaciones")
         except Exception as e:
              logger.error(f"⚠️ Error obteniendo cotizaciones: {e}")
              raise e # Re-raise to be caught by main loop
+        
+        # Los fallidos también esperan su intervalo: no reintentar cada ciclo un símbolo sin datos
+        refreshed_at = time.monotonic()
+        for symbol in due_open:
+            self._refresh_state[symbol] = (refreshed_at, True)
+        for symbol in due_closed:
+            self._refresh_state[symbol] = (refreshed_at, False)
+
+    def _due_symbols(self, tracked: Dict[str, str], now: datetime) -> Tuple[list, list]:
+        """
+        Símbolos a refrescar en este ciclo, separados en (mercado abierto, mercado cerrado).
+        
+        Con el mercado abierto se refrescan cada update_interval y con el mercado cerrado
+        cada closed_interval. Un cambio de estado (apertura o cierre) fuerza un refresco
+        inmediato para recoger el primer precio de la sesión y el de cierre.
+        """
+        monotonic_now = time.monotonic()
+        due_open, due_closed = [], []
+        open_count = 0
+        for symbol, calendar_code in tracked.items():
+            is_open = trading_calendar_service.get_calendar(calendar_code).is_open(now)
+            open_count += is_open
+            interval = self.update_interval if is_open else self.closed_interval
+            last = self._refresh_state.get(symbol)
+            if last is None or last[1] != is_open or monotonic_now - last[0] >= interval:
+                (due_open if is_open else due_closed).append(symbol)
+        self.last_cycle["open"] = open_count
+        self.last_cycle["closed"] = len(tracked) - open_count
+        return due_open, due_closed
 
     def get_status(self):
         """Retorna el estado actual del servicio"""
@@ -87,19 +141,25 @@ class MarketDataService:
             "last_update": self.last_update.isoformat() if self.last_update else None,
             "tracked_symbols_count": self.tracked_symbols_count,
             "last_error": self.last_error,
-            "update_interval": self.update_interval
+            "update_interval": self.update_interval,
+            "closed_interval": self.closed_interval,
+            "last_cycle": self.last_cycle,
+            "live": live_quote_service.get_stats(),
         }
 
-    async def _get_symbols_to_track(self, db: AsyncSession) -> list[str]:
+    async def _get_symbols_to_track(self, db: AsyncSession) -> Dict[str, str]:
         """
-        Identifica símbolos que deben ser monitorizados 24/7:
+        Identifica símbolos que deben ser monitorizados, con el calendario de su mercado:
         1. Activos con saldo DISTINTO DE CERO en cualquier cartera.
         2. Activos catastrados como tipo 'currency' (Monedas para conversión).
+        
+        Returns:
+            {symbol: código de calendario (trading_calendar_service)}
         """
         # Símbolos con posición activa
-        active_pos_stmt = select(Asset.symbol).\
+        active_pos_stmt = select(Asset.symbol, Asset.market, Asset.asset_type).\
             join(Transaction, Asset.id == Transaction.asset_id).\
-            group_by(Asset.id, Asset.symbol).\
+            group_by(Asset.id, Asset.symbol, Asset.market, Asset.asset_type).\
             having(
                 func.abs(
                     func.sum(
@@ -113,23 +173,31 @@ class MarketDataService:
             )
             
         # Monedas configuradas en el sistema (para conversiones)
-        currencies_stmt = select(Asset.symbol).where(Asset.asset_type == AssetType.CURRENCY)
+        currencies_stmt = select(Asset.symbol, Asset.market, Asset.asset_type).where(Asset.asset_type == AssetType.CURRENCY)
         
         # Combinar resultados
         res_active = await db.execute(active_pos_stmt)
         res_curr = await db.execute(currencies_stmt)
         
-        symbols = set(res_active.scalars().all())
-        symbols.update(res_curr.scalars().all())
-        
-        return list(symbols)
+        return {
+            row.symbol: trading_calendar_service.calendar_code_for_asset(
+                row.market, is_crypto=row.asset_type == AssetType.CRYPTO
+            )
+            for row in [*res_active.all(), *res_curr.all()]
+        }
 
-    async def _update_virtual_table(self, quotes: dict):
+    async def _update_virtual_table(self, quotes: dict, ttls: Optional[Dict[str, int]] = None):
         """
         Guarda las cotizaciones en Redis (La Tabla Virtual).
         Formato Key: 'quote:{symbol}'
         Value: JSON con precio y timestamp
+        TTL: open_ttl, o el de ttls para los símbolos con mercado cerrado (se refrescan menos)
+        
+        Las cotizaciones cuyo precio ha cambiado se publican además en el canal en vivo
+        (live_quote_service) para los clientes conectados por SSE.
         """
+        ttls = ttls or {}
+        changed = {}
         pipeline = redis_client.client.pipeline()
         
         for symbol, data in quotes.items():
@@ -142,8 +210,17 @@ class MarketDataService:
                 if 'date' in data and isinstance(data['date'], datetime):
                     data['date'] = data['date'].isoformat()
                 
-                pipeline.set(key, json.dumps(data), ex=300) # TTL 5 minutos por seguridad
+                pipeline.set(key, json.dumps(data), ex=ttls.get(symbol, self.open_ttl))
+                
+                if self._published_closes.get(symbol) != data.get('close'):
+                    self._published_closes[symbol] = data.get('close')
+                    changed[symbol] = data
                 
         await pipeline.execute()
+        
+        try:
+            await live_quote_service.publish(changed)
+        except Exception as e:
+            logger.error(f"⚠️ Error publicando cotizaciones en vivo: {e}")
 
 market_data_service = MarketDataService()
@@ -2,14 +2,24 @@
 Servicio para obtener datos históricos usando Polygon.io
 Plan gratuito: Hasta 500-730 días de histórico, sin límite diario de requests
 Rate limit: 5 requests/minuto
+
+Cliente asíncrono (cliente HTTP compartido de la aplicación): las esperas del rate
+limit y de los reintentos son asyncio.sleep, así que nunca bloquean el event loop.
+El límite se comparte entre procesos con el token bucket de Redis y las
+respuestas se guardan en la caché de histórico en disco (app/core/response_cache.py).
 """
+import asyncio
 import logging
-import requests
-import time
+import random
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional
-from decimal import Decimal
+
+import httpx
+
 from app.core.config import settings
+from app.core.http_client import http_client
+from app.core.provider_rate_limit import provider_rate_limiter
+from app.core.response_cache import response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -17,24 +27,68 @@ logger = logging.getLogger(__name__)
 class PolygonService:
     """Servicio para obtener cotizaciones históricas de Polygon.io"""
     
+    # Reintentos ante 429, 5xx y errores de red (backoff exponencial con jitter)
+    max_retries = 3
+    backoff_base_seconds = 2.0
+    backoff_max_seconds = 60.0
+    
     def __init__(self):
         self.api_key = settings.POLYGON_API_KEY
         self.base_url = "https://api.polygon.io"
-        self.last_request_time = 0
-        self.min_request_interval = 12  # 12 segundos entre requests (5/min rate limit)
         logger.info("✅ Polygon.io service initialized")
     
-    def _rate_limit(self):
-        """Implementar rate limiting de 5 requests/minuto"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Espera antes de reintentar: Retry-After si el servidor lo indica, si no exponencial con jitter"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max_seconds)
+            except ValueError:
+                pass
+        delay = min(self.backoff_base_seconds * (2 ** attempt), self.backoff_max_seconds)
+        return random.uniform(delay / 2, delay)
+    
+    async def _request(self, path: str, endpoint: str, params: Dict, label: str) -> Optional[httpx.Response]:
+        """
+        GET a Polygon con rate limiting y reintentos.
         
-        if time_since_last < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last
-            logger.debug(f"⏳ Rate limit: esperando {sleep_time:.1f}s")
-            time.sleep(sleep_time)
+        Returns:
+            Respuesta (cualquier código no reintentable) o None si se agotan los reintentos
+        """
+        params = {**params, "apiKey": self.api_key}
+        
+        for attempt in range(self.max_retries + 1):
+            await provider_rate_limiter.acquire("polygon", endpoint)
+            
+            try:
+                response = await http_client.get(f"{self.base_url}{path}", params=params)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    logger.error(f"❌ Error de red con Polygon.io para {label}: {str(e)}")
+                    return None
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"⚠️ Error de red con Polygon.io para {label}, reintentando en {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            
+            if response.status_code == 429:
+                if attempt == self.max_retries:
+                    logger.warning(f"⚠️ Rate limit alcanzado para {label}")
+                    return None
+                delay = self._backoff_delay(attempt, response.headers.get("Retry-After"))
+                # Retrasar también el resto de peticiones (de todos los procesos): la cuota es de la API key
+                await provider_rate_limiter.penalize("polygon", delay, endpoint)
+                logger.warning(f"⚠️ Rate limit (429) de Polygon.io para {label}, reintentando en {delay:.1f}s")
+                continue
+            
+            if response.status_code >= 500 and attempt < self.max_retries:
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"⚠️ Error HTTP {response.status_code} de Polygon.io para {label}, reintentando en {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            
+            return response
         
-        self.last_request_time = time.time()
+        return None
     
     def _convert_ticker_for_polygon(self, symbol: str) -> str:
         """
@@ -86,7 +140,8 @@ class PolygonService:
         self,
         symbol: str,
         start_date: Optional[date] = None,
-        end_date: Optional[date] = None
+        end_date: Optional[date] = None,
+        use_cache: bool = True
     ) -> Optional[List[Dict]]:
         """
         Obtener cotizaciones históricas de Polygon.io
@@ -97,6 +152,7 @@ class PolygonService:
             symbol: Símbolo del activo (ej: TSLA, AAPL, BTC-USD)
             start_date: Fecha de inicio (opcional)
             end_date: Fecha de fin (opcional)
+            use_cache: Si False, ignora la caché en disco (se actualiza con la respuesta)
         
         Returns:
             Lista de diccionarios con datos OHLCV
@@ -111,25 +167,24 @@ class PolygonService:
             if not start_date:
                 start_date = end_date - timedelta(days=500)
             
+            if use_cache:
+                cached = await response_cache.get("polygon", polygon_symbol, start_date, end_date)
+                if cached:
+                    logger.info(f"💾 {len(cached)} cotizaciones de {symbol} desde caché (Polygon.io)")
+                    return cached
+            
             logger.info(f"🔄 Obteniendo histórico de Polygon.io para {symbol}")
             logger.info(f"📅 Rango: {start_date} → {end_date}")
             
-            # Aplicar rate limiting
-            self._rate_limit()
-            
-            # Construir URL de la API
-            url = f"{self.base_url}/v2/aggs/ticker/{polygon_symbol}/range/1/day/{start_date}/{end_date}"
-            params = {
-                "apiKey": self.api_key,
-                "adjusted": "true",
-                "sort": "asc"
-            }
-            
-            # Hacer request
-            response = requests.get(url, params=params, timeout=10)
+            # Hacer request (rate limiting y reintentos incluidos)
+            response = await self._request(
+                f"/v2/aggs/ticker/{polygon_symbol}/range/1/day/{start_date}/{end_date}",
+                "aggs",
+                {"adjusted": "true", "sort": "asc"},
+                symbol
+            )
             
-            if response.status_code == 429:
-                logger.warning(f"⚠️ Rate limit alcanzado para {symbol}")
+            if response is None:
                 return None
             
             if response.status_code != 200:
@@ -180,15 +235,71 @@ class PolygonService:
             logger.info(f"✅ {len(quotes)} cotizaciones obtenidas para {symbol} desde Polygon.io")
             logger.info(f"📊 Rango obtenido: {quotes[0]['date'].date()} → {quotes[-1]['date'].date()}")
             
+            await response_cache.set("polygon", polygon_symbol, start_date, end_date, quotes)
             return quotes
             
-        except requests.RequestException as e:
-            logger.error(f"❌ Error de red con Polygon.io para {symbol}: {str(e)}")
-            return None
         except Exception as e:
             logger.error(f"❌ Error obteniendo histórico de {symbol}: {str(e)}")
             return None
     
+    async def get_grouped_daily(self, day: date, market: str = "stocks") -> Optional[Dict[str, Dict]]:
+        """
+        Agregados diarios agrupados: OHLCV de todos los tickers de un mercado en un día
+        con una sola petición (stocks = EEUU, crypto = pares globales X:BASEUSD)
+
+        Returns:
+            {ticker Polygon: {date, open, high, low, close, volume}} ({} si el día no tuvo sesión),
+            o None si la petición falla
+        """
+        locale = "global" if market == "crypto" else "us"
+        try:
+            cached = await response_cache.get("polygon_grouped", market, day, day)
+            if cached:
+                return cached
+            
+            response = await self._request(
+                f"/v2/aggs/grouped/locale/{locale}/market/{market}/{day.isoformat()}",
+                "grouped",
+                {"adjusted": "true"},
+                f"agrupado {market} {day}"
+            )
+
+            if response is None:
+                return None
+
+            if response.status_code != 200:
+                logger.warning(f"⚠️ Error HTTP {response.status_code} en agrupado {market} {day}")
+                return None
+
+            data = response.json()
+            if data.get("status") not in ("OK", "DELAYED"):
+                logger.warning(f"⚠️ Status no OK en agrupado {market} {day}: {data.get('status')}")
+                return None
+
+            quote_date = datetime.combine(day, datetime.min.time())
+            quotes = {}
+            for item in data.get("results") or []:
+                ticker = item.get("T")
+                close = item.get("c")
+                if not ticker or close is None:
+                    continue
+                quotes[ticker] = {
+                    "date": quote_date,
+                    "open": float(item.get("o", close)),
+                    "high": float(item.get("h", close)),
+                    "low": float(item.get("l", close)),
+                    "close": float(close),
+                    "volume": int(item.get("v") or 0)
+                }
+
+            logger.info(f"✅ Agrupado {market} {day}: {len(quotes)} tickers")
+            await response_cache.set("polygon_grouped", market, day, day, quotes)
+            return quotes
+
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo agrupado {market} {day}: {str(e)}")
+            return None
+
     async def get_latest_quote(self, symbol: str) -> Optional[Dict]:
         """
         Obtener la última cotización disponible de un activo
@@ -210,17 +321,15 @@ class PolygonService:
         Buscar símbolos en Polygon.io
         """
         try:
-            self._rate_limit()
+            response = await self._request(
+                "/v3/reference/tickers",
+                "reference",
+                {"search": query, "active": "true", "limit": 10},
+                query
+            )
             
-            url = f"{self.base_url}/v3/reference/tickers"
-            params = {
-                "apiKey": self.api_key,
-                "search": query,
-                "active": "true",
-                "limit": 10
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
+            if response is None:
+                return None
             
             if response.status_code != 200:
                 logger.warning(f"⚠️ Error buscando símbolos: {response.status_code}")
@@ -0,0 +1,316 @@
+"""
+Almacén local columnar de precios (memory-mapped) para lecturas analíticas.
+
+Un fichero por activo (PRICE_STORE_DIR/<asset_id>.prices) con la serie diaria
+completa en columnas:
+
+    [n: int64][days: int32 x n][relleno a 8 bytes][open | high | low | close: float64 x n]
+
+days son días desde 1970-01-01 (fecha UTC de la cotización). Las lecturas
+abren el fichero con np.memmap y devuelven vistas sin copia: años de precios
+sin consultas a PostgreSQL ni conversión Decimal -> float fila a fila.
+
+Actualización incremental:
+- Tras cada ingesta confirmada, publish_changes apunta en Redis la fecha más
+  antigua modificada de cada activo (quote_writer_service devuelve first_date).
+- sync (un único proceso a la vez, con lock en Redis) reescribe solo esos
+  activos: conserva las filas anteriores a esa fecha y lee de BD el resto.
+- Las escrituras son atómicas (fichero temporal + os.replace): los lectores con
+  el fichero anterior ya mapeado siguen viéndolo completo.
+
+Si el almacén no tiene un activo (o está desactivado) las lecturas devuelven
+None y los llamadores consultan la BD como antes.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis_client import redis_client
+from app.models.asset import Asset
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+FILE_SUFFIX = ".prices"
+HEADER_BYTES = 8
+OHLC_COLUMNS = ("open", "high", "low", "close")
+
+DIRTY_KEY = "price_store:dirty"
+# Versión de los datos de cada activo (se incrementa con cada ingesta que lo modifica)
+VERSION_KEY = "quotes:version"
+LOCK_KEY = "price_store:sync"
+LOCK_TTL_SECONDS = 10 * 60
+# Marca de almacén completo (si falta, sync reconstruye todos los activos)
+BUILT_MARKER = ".built"
+
+# HSET que conserva la fecha más antigua (las fechas ISO se comparan como texto)
+MARK_DIRTY_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if not current or ARGV[i + 1] < current then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+# Borra la marca solo si no ha cambiado durante la reconstrucción
+CLEAR_DIRTY_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+SERIES_SQL = text("""
+    SELECT
+        ((date AT TIME ZONE 'UTC')::date - DATE '1970-01-01') AS day,
+        open::float8, high::float8, low::float8, close::float8
+    FROM quotes
+    WHERE asset_id = :asset_id AND date >= :since
+    ORDER BY date
+""")
+
+# (días, OHLC con forma (4, n))
+PriceSeries = Tuple[np.ndarray, np.ndarray]
+
+
+def day_number(value: date) -> int:
+    return (value - EPOCH).days
+
+
+def day_to_date(day: int) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+
+class PriceStoreService:
+    """Series diarias OHLC por activo en ficheros memory-mapped"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.PRICE_STORE_DIR
+        self.enabled = settings.PRICE_STORE_ENABLED
+        # Mapeos abiertos: asset_id -> (inode, mtime_ns, serie)
+        self._maps: Dict[str, Tuple[int, int, PriceSeries]] = {}
+        self._sync_task: Optional[asyncio.Task] = None
+        self.stats = {"reads": 0, "misses": 0, "rebuilt_assets": 0, "last_sync": None, "last_sync_seconds": None}
+
+    @property
+    def redis(self):
+        return redis_client.client
+
+    def _path(self, asset_id) -> str:
+        return os.path.join(self.directory, f"{asset_id}{FILE_SUFFIX}")
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def get_series(self, asset_id) -> Optional[PriceSeries]:
+        """Serie completa del activo (vistas de solo lectura) o None si no está en el almacén"""
+        if not self.enabled:
+            return None
+        asset_id = str(asset_id)
+        path = self._path(asset_id)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["reads"] += 1
+        cached = self._maps.get(asset_id)
+        if cached and cached[0] == st.st_ino and cached[1] == st.st_mtime_ns:
+            return cached[2]
+
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        n = int(raw[:HEADER_BYTES].view(np.int64)[0])
+        days_end = HEADER_BYTES + 4 * n
+        ohlc_start = days_end + (-days_end % 8)
+        days = raw[HEADER_BYTES:days_end].view(np.int32)
+        ohlc = raw[ohlc_start:ohlc_start + 32 * n].view(np.float64).reshape(4, n)
+        self._maps[asset_id] = (st.st_ino, st.st_mtime_ns, (days, ohlc))
+        return days, ohlc
+
+    def get_range(self, asset_id, start: date, end: date) -> Optional[PriceSeries]:
+        """Filas con start <= fecha <= end (vistas sin copia)"""
+        series = self.get_series(asset_id)
+        if series is None:
+            return None
+        days, ohlc = series
+        lo = np.searchsorted(days, day_number(start), side="left")
+        hi = np.searchsorted(days, day_number(end), side="right")
+        return days[lo:hi], ohlc[:, lo:hi]
+
+    def as_of(self, asset_ids: Iterable, target: date, column: str = "close") -> Dict[str, Tuple[date, float]]:
+        """
+        Último precio en o antes de target por activo: {asset_id: (fecha, precio)}.
+        Los activos que no están en el almacén o sin precio anterior no aparecen.
+        """
+        target_day = day_number(target)
+        row = OHLC_COLUMNS.index(column)
+        prices = {}
+        for asset_id in asset_ids:
+            series = self.get_series(asset_id)
+            if series is None:
+                continue
+            days, ohlc = series
+            i = np.searchsorted(days, target_day, side="right") - 1
+            if i >= 0:
+                prices[str(asset_id)] = (day_to_date(days[i]), float(ohlc[row, i]))
+        return prices
+
+    def last_closes(self, asset_id, target: date, count: int = 2) -> Optional[list]:
+        """Últimos count cierres en o antes de target, del más reciente al más antiguo"""
+        series = self.get_series(asset_id)
+        if series is None:
+            return None
+        days, ohlc = series
+        end = np.searchsorted(days, day_number(target), side="right")
+        return ohlc[3, max(end - count, 0):end][::-1].tolist()
+
+    # ------------------------------------------------------------------
+    # Actualización
+    # ------------------------------------------------------------------
+
+    async def publish_changes(self, by_asset: Dict[str, Dict]):
+        """
+        Marca para reconstrucción los activos modificados por una ingesta (llamar tras el
+        commit con el by_asset de quote_writer_service) y lanza la sincronización.
+        También incrementa su versión de datos (claves de las cachés derivadas, p. ej. velas).
+        """
+        if self.redis is None:
+            return
+        args = []
+        for asset_id, counts in by_asset.items():
+            if counts.get("first_date"):
+                args += [str(asset_id), counts["first_date"].isoformat()]
+        if not args:
+            return
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for asset_id in args[::2]:
+                pipe.hincrby(VERSION_KEY, asset_id, 1)
+            await pipe.execute()
+
+        if not self.enabled:
+            return
+        await self.redis.eval(MARK_DIRTY_SCRIPT, 1, DIRTY_KEY, *args)
+        self.schedule_sync()
+
+    async def get_data_version(self, asset_id) -> int:
+        """Versión de los datos del activo (0 si no ha cambiado desde que existe Redis)"""
+        if self.redis is None:
+            return 0
+        return int(await self.redis.hget(VERSION_KEY, str(asset_id)) or 0)
+
+    def schedule_sync(self):
+        """Sincroniza en segundo plano (sin solapar ejecuciones en este proceso)"""
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self.sync())
+
+    async def sync(self) -> int:
+        """
+        Reconstruye los activos pendientes (o todos si el almacén no está completo).
+
+        Returns:
+            Número de activos reescritos
+        """
+        if not self.enabled or self.redis is None:
+            return 0
+        if not await self.redis.set(LOCK_KEY, str(os.getpid()), nx=True, ex=LOCK_TTL_SECONDS):
+            return 0
+
+        started = time.monotonic()
+        rebuilt = 0
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            full = not os.path.exists(os.path.join(self.directory, BUILT_MARKER))
+            async with AsyncSessionLocal() as db:
+                if full:
+                    asset_ids = (await db.execute(select(Asset.id))).scalars().all()
+                    pending = {str(asset_id): None for asset_id in asset_ids}
+                    logger.info(f"🗄️ Construyendo almacén de precios para {len(pending)} activos")
+                else:
+                    pending = await self.redis.hgetall(DIRTY_KEY)
+
+                for asset_id, since in pending.items():
+                    await self._rebuild_asset(db, asset_id, date.fromisoformat(since) if since else None)
+                    if since:
+                        await self.redis.eval(CLEAR_DIRTY_SCRIPT, 1, DIRTY_KEY, asset_id, since)
+                    rebuilt += 1
+                    await self.redis.expire(LOCK_KEY, LOCK_TTL_SECONDS)
+
+            if full:
+                # Las marcas pendientes se procesan (de nuevo) en la siguiente sincronización
+                open(os.path.join(self.directory, BUILT_MARKER), "w").close()
+        except Exception as e:
+            logger.error(f"❌ Error sincronizando almacén de precios: {e}", exc_info=True)
+        finally:
+            await self.redis.delete(LOCK_KEY)
+
+        self.stats["rebuilt_assets"] += rebuilt
+        self.stats["last_sync"] = time.time()
+        self.stats["last_sync_seconds"] = round(time.monotonic() - started, 3)
+        if rebuilt:
+            logger.info(f"🗄️ Almacén de precios: {rebuilt} activos actualizados en {self.stats['last_sync_seconds']}s")
+        return rebuilt
+
+    async def rebuild_all(self) -> int:
+        """Fuerza la reconstrucción completa en la próxima sincronización y la ejecuta"""
+        marker = os.path.join(self.directory, BUILT_MARKER)
+        if os.path.exists(marker):
+            os.remove(marker)
+        return await self.sync()
+
+    async def _rebuild_asset(self, db: AsyncSession, asset_id: str, since: Optional[date]):
+        """Conserva las filas anteriores a since y lee de BD desde since (todo si es None)"""
+        kept_days = np.empty(0, dtype=np.int32)
+        kept_ohlc = np.empty((4, 0), dtype=np.float64)
+        if since is not None:
+            current = self.get_series(asset_id)
+            if current is None:
+                since = None
+            else:
+                cut = np.searchsorted(current[0], day_number(since), side="left")
+                kept_days, kept_ohlc = current[0][:cut], current[1][:, :cut]
+
+        rows = (await db.execute(
+            SERIES_SQL, {"asset_id": asset_id, "since": since or EPOCH}
+        )).all()
+        fresh = np.array([tuple(row) for row in rows], dtype=np.float64).reshape(-1, 5)
+
+        days = np.concatenate([kept_days, fresh[:, 0].astype(np.int32)])
+        ohlc = np.concatenate([kept_ohlc, fresh[:, 1:].T], axis=1)
+        await asyncio.to_thread(self._write, asset_id, days, ohlc)
+
+    def _write(self, asset_id: str, days: np.ndarray, ohlc: np.ndarray):
+        path = self._path(asset_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        n = len(days)
+        with open(tmp_path, "wb") as f:
+            f.write(np.int64(n).tobytes())
+            f.write(np.ascontiguousarray(days, dtype=np.int32).tobytes())
+            f.write(b"\0" * (-(HEADER_BYTES + 4 * n) % 8))
+            f.write(np.ascontiguousarray(ohlc, dtype=np.float64).tobytes())
+        os.replace(tmp_path, path)
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "built": os.path.exists(os.path.join(self.directory, BUILT_MARKER)),
+            "open_maps": len(self._maps),
+            **self.stats,
+        }
+
+
+price_store_service = PriceStoreService()
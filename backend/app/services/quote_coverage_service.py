@@ -0,0 +1,390 @@
+"""
+Cálculo de cobertura de cotizaciones por activo.
+
+Toda la cobertura (días esperados, presentes, huecos y rachas de huecos) se
+calcula en una única sentencia SQL para cualquier número de activos:
+generate_series de sesiones por activo (calendario de su bolsa, ver
+trading_calendar_service) + LEFT JOIN a quotes + detección de rachas
+(gaps-and-islands) con funciones de ventana.
+
+El resultado se materializa en la tabla quote_coverage: los escritores de
+cotizaciones la refrescan para los activos tocados en cada lote y una tarea
+nocturna la reconcilia completa. Las pantallas de gestión, el planificador de
+importaciones y el scheduler leen de ahí en lugar de recorrer quotes.
+"""
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models.asset import Asset, AssetType
+from app.models.quote_coverage import QuoteCoverage
+from app.services.trading_calendar_service import (
+    trading_calendar_service, MARKET_CALENDARS, DEFAULT_CALENDAR
+)
+
+logger = logging.getLogger(__name__)
+
+# Días de margen antes de la primera transacción / ventana por defecto sin transacciones
+START_MARGIN_DAYS = 7
+DEFAULT_WINDOW_DAYS = 365
+
+COVERAGE_SQL = text("""
+WITH market_calendars AS (
+    SELECT * FROM unnest(CAST(:market_names AS text[]), CAST(:market_codes AS text[])) AS m(market, calendar)
+),
+holidays AS (
+    SELECT * FROM unnest(CAST(:holiday_calendars AS text[]), CAST(:holiday_days AS date[])) AS h(calendar, day)
+),
+scope AS (
+    SELECT
+        a.id AS asset_id,
+        a.asset_type = :crypto AS is_crypto,
+        COALESCE(mc.calendar, :default_calendar) AS calendar,
+        COALESCE(
+            (
+                SELECT (min(t.transaction_date) AT TIME ZONE 'UTC')::date
+                FROM transactions t
+                WHERE t.asset_id = a.id
+            ) - :margin_days,
+            CAST(:today AS date) - :default_days
+        ) AS required_start
+    FROM assets a
+    LEFT JOIN market_calendars mc ON mc.market = upper(trim(a.market))
+    WHERE CAST(:asset_ids AS uuid[]) IS NULL OR a.id = ANY(CAST(:asset_ids AS uuid[]))
+),
+present AS (
+    SELECT DISTINCT q.asset_id, (q.date AT TIME ZONE 'UTC')::date AS day
+    FROM quotes q
+    JOIN scope s ON s.asset_id = q.asset_id
+    WHERE q.date >= (s.required_start::timestamp AT TIME ZONE 'UTC')
+      -- Cota global (subconsulta escalar): permite descartar particiones de años anteriores
+      AND q.date >= ((SELECT min(required_start) FROM scope)::timestamp AT TIME ZONE 'UTC')
+),
+present_stats AS (
+    SELECT asset_id, count(*) AS total_quotes, min(day) AS first_date, max(day) AS last_date
+    FROM present
+    GROUP BY asset_id
+),
+expected AS (
+    -- Sesiones de la bolsa del activo (crypto: todos los días), numeradas en orden
+    SELECT
+        x.asset_id,
+        x.day,
+        row_number() OVER (PARTITION BY x.asset_id ORDER BY x.day) AS seq
+    FROM (
+        SELECT s.asset_id, d::date AS day
+        FROM scope s
+        CROSS JOIN LATERAL generate_series(s.required_start, CAST(:today AS date) - 1, interval '1 day') AS d
+        WHERE s.is_crypto OR (
+            extract(isodow FROM d) < 6
+            AND NOT EXISTS (SELECT 1 FROM holidays h WHERE h.calendar = s.calendar AND h.day = d::date)
+        )
+    ) x
+),
+missing AS (
+    -- Nueva racha cuando la sesión faltante no es la siguiente a la anterior faltante
+    SELECT
+        e.asset_id,
+        e.day,
+        CASE
+            WHEN e.seq - lag(e.seq) OVER (PARTITION BY e.asset_id ORDER BY e.seq) = 1 THEN 0
+            ELSE 1
+        END AS new_run
+    FROM expected e
+    LEFT JOIN present p ON p.asset_id = e.asset_id AND p.day = e.day
+    WHERE p.day IS NULL
+),
+runs AS (
+    SELECT asset_id, day, sum(new_run) OVER (PARTITION BY asset_id ORDER BY day) AS run_id
+    FROM missing
+),
+gap_stats AS (
+    SELECT
+        asset_id,
+        sum(run_length) AS missing_days,
+        max(run_length) AS max_consecutive_missing,
+        min(run_start) AS first_missing_date
+    FROM (
+        SELECT asset_id, run_id, count(*) AS run_length, min(day) AS run_start
+        FROM runs
+        GROUP BY asset_id, run_id
+    ) r
+    GROUP BY asset_id
+)
+SELECT
+    s.asset_id,
+    s.is_crypto,
+    s.required_start,
+    COALESCE(ps.total_quotes, 0) AS total_quotes,
+    ps.first_date,
+    ps.last_date,
+    COALESCE(gs.missing_days, 0) AS missing_days,
+    COALESCE(gs.max_consecutive_missing, 0) AS max_consecutive_missing,
+    gs.first_missing_date
+FROM scope s
+LEFT JOIN present_stats ps ON ps.asset_id = s.asset_id
+LEFT JOIN gap_stats gs ON gs.asset_id = s.asset_id
+""")
+
+
+def build_coverage(
+    is_crypto: bool,
+    required_start: date,
+    total_quotes: int,
+    first_date: Optional[date],
+    last_date: Optional[date],
+    missing_days: int,
+    max_consecutive_missing: int,
+    first_missing_date: Optional[date] = None,
+    today: Optional[date] = None
+) -> dict:
+    """
+    Calcula las métricas finales de cobertura a partir de los agregados por activo.
+
+    Los días esperados son las sesiones reales de la bolsa del activo (sin festivos).
+    Un activo está completo si:
+    1. Tiene al menos el 99% de las sesiones esperadas (algún día suelto sin dato del proveedor)
+    2. No tiene huecos grandes (más de 5 sesiones seguidas faltantes)
+    3. El último dato es reciente (< 5 días para permitir fines de semana largos)
+    """
+    today = today or date.today()
+    days_since_last_update = (today - last_date).days if last_date else None
+
+    expected_count = total_quotes + missing_days
+    coverage_ratio = total_quotes / expected_count if expected_count > 0 else 0
+
+    has_large_gaps = max_consecutive_missing > 5
+    is_up_to_date = days_since_last_update < 5 if days_since_last_update is not None else False
+
+    # Con calendario de bolsa los festivos ya no cuentan como huecos: mismo umbral para todos
+    min_ratio = 0.99
+    is_complete = coverage_ratio >= min_ratio and not has_large_gaps and is_up_to_date
+
+    return {
+        "has_quotes": total_quotes > 0,
+        "total_quotes": total_quotes,
+        "first_date": first_date,
+        "last_date": last_date,
+        "days_since_last_update": days_since_last_update,
+        "required_start_date": required_start,
+        "missing_days_count": missing_days,
+        "first_missing_date": first_missing_date,
+        "longest_gap": max_consecutive_missing,
+        "coverage_ratio": round(coverage_ratio, 4),
+        "has_gaps": has_large_gaps or coverage_ratio < min_ratio,
+        "is_complete": is_complete,
+        "needs_update": days_since_last_update > 7 if days_since_last_update is not None else True
+    }
+
+
+def classify_coverage(coverage: dict) -> dict:
+    """
+    Determina si un activo necesita importación de histórico a partir de su cobertura.
+
+    Retorna:
+        - needs_import: bool
+        - reason: str ("no_data", "incomplete_data", "outdated", "complete")
+        - message: str
+        - coverage: dict (información de cobertura)
+    """
+    if not coverage["has_quotes"]:
+        return {
+            "needs_import": True,
+            "reason": "no_data",
+            "message": "Sin cotizaciones",
+            "coverage": coverage
+        }
+
+    if not coverage["is_complete"]:
+        return {
+            "needs_import": True,
+            "reason": "incomplete_data",
+            "message": f"Datos parciales ({coverage['total_quotes']} cotizaciones)",
+            "coverage": coverage
+        }
+
+    if coverage["needs_update"]:
+        return {
+            "needs_import": True,
+            "reason": "outdated",
+            "message": f"Desactualizado ({coverage['days_since_last_update']} días)",
+            "coverage": coverage
+        }
+
+    return {
+        "needs_import": False,
+        "reason": "complete",
+        "message": f"Completo ({coverage['total_quotes']} cotizaciones)",
+        "coverage": coverage
+    }
+
+
+class QuoteCoverageService:
+    """Cobertura de cotizaciones: cálculo en un solo viaje a la BD y tabla materializada"""
+
+    async def compute_coverage_map(
+        self,
+        db: AsyncSession,
+        asset_ids: Optional[List[str]] = None
+    ) -> Dict[str, dict]:
+        """
+        Calcula (escaneando quotes) la cobertura de los activos indicados, o de todos si asset_ids es None.
+
+        Returns:
+            {asset_id (str): coverage dict}
+        """
+        today = date.today()
+        holiday_calendars, holiday_days = trading_calendar_service.holiday_table(today)
+        result = await db.execute(COVERAGE_SQL, {
+            "crypto": AssetType.CRYPTO.name,
+            "today": today,
+            "margin_days": START_MARGIN_DAYS,
+            "default_days": DEFAULT_WINDOW_DAYS,
+            "market_names": list(MARKET_CALENDARS.keys()),
+            "market_codes": list(MARKET_CALENDARS.values()),
+            "default_calendar": DEFAULT_CALENDAR,
+            "holiday_calendars": holiday_calendars,
+            "holiday_days": holiday_days,
+            "asset_ids": [str(a) for a in asset_ids] if asset_ids is not None else None,
+        })
+
+        return {
+            str(row.asset_id): build_coverage(
+                is_crypto=row.is_crypto,
+                required_start=row.required_start,
+                total_quotes=row.total_quotes,
+                first_date=row.first_date,
+                last_date=row.last_date,
+                missing_days=int(row.missing_days),
+                max_consecutive_missing=int(row.max_consecutive_missing),
+                first_missing_date=row.first_missing_date,
+                today=today
+            )
+            for row in result.all()
+        }
+
+    async def refresh(self, db: AsyncSession, asset_ids: Optional[Iterable] = None) -> Dict[str, dict]:
+        """
+        Recalcula y guarda en quote_coverage la cobertura de los activos indicados (todos si None).
+        No hace commit: se ejecuta dentro de la transacción del escritor.
+        """
+        ids = None if asset_ids is None else list({str(a) for a in asset_ids})
+        if ids is not None and not ids:
+            return {}
+
+        coverage_map = await self.compute_coverage_map(db, ids)
+        if not coverage_map:
+            return coverage_map
+
+        rows = [
+            {
+                "asset_id": asset_id,
+                "required_start": cov["required_start_date"],
+                "first_date": cov["first_date"],
+                "last_date": cov["last_date"],
+                "expected_count": cov["total_quotes"] + cov["missing_days_count"],
+                "present_count": cov["total_quotes"],
+                "missing_count": cov["missing_days_count"],
+                "first_missing_date": cov["first_missing_date"],
+                "longest_gap": cov["longest_gap"],
+                "status": classify_coverage(cov)["reason"],
+            }
+            for asset_id, cov in coverage_map.items()
+        ]
+
+        # 11 parámetros por fila: lotes holgados por debajo del límite de asyncpg
+        for i in range(0, len(rows), 1000):
+            stmt = pg_insert(QuoteCoverage).values(rows[i:i + 1000])
+            excluded = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[QuoteCoverage.asset_id],
+                set_={
+                    "required_start": excluded.required_start,
+                    "first_date": excluded.first_date,
+                    "last_date": excluded.last_date,
+                    "expected_count": excluded.expected_count,
+                    "present_count": excluded.present_count,
+                    "missing_count": excluded.missing_count,
+                    "first_missing_date": excluded.first_missing_date,
+                    "longest_gap": excluded.longest_gap,
+                    "status": excluded.status,
+                    "updated_at": text("now()"),
+                }
+            )
+            await db.execute(stmt)
+
+        return coverage_map
+
+    async def get_coverage_map(
+        self,
+        db: AsyncSession,
+        asset_ids: Optional[List[str]] = None
+    ) -> Dict[str, dict]:
+        """
+        Cobertura precalculada (tabla quote_coverage) de los activos indicados o de todos.
+
+        Las métricas que dependen de la fecha actual (días desde la última cotización,
+        vigencia) se recalculan al leer. Los activos que aún no tienen fila se calculan
+        y materializan en ese momento, en una sesión propia: no se hace commit de la
+        transacción del llamador.
+        """
+        today = date.today()
+        stmt = select(QuoteCoverage, Asset.asset_type).join(Asset, Asset.id == QuoteCoverage.asset_id)
+        if asset_ids is not None:
+            stmt = stmt.where(QuoteCoverage.asset_id.in_(list(asset_ids)))
+        result = await db.execute(stmt)
+
+        coverage_map = {
+            str(cov.asset_id): build_coverage(
+                is_crypto=asset_type == AssetType.CRYPTO,
+                required_start=cov.required_start,
+                total_quotes=cov.present_count,
+                first_date=cov.first_date,
+                last_date=cov.last_date,
+                missing_days=cov.missing_count,
+                max_consecutive_missing=cov.longest_gap,
+                first_missing_date=cov.first_missing_date,
+                today=today
+            )
+            for cov, asset_type in result.all()
+        }
+
+        # Activos sin cobertura materializada (nuevos o anteriores a la tabla)
+        if asset_ids is not None:
+            pending = [str(a) for a in asset_ids if str(a) not in coverage_map]
+        else:
+            all_ids = (await db.execute(select(Asset.id))).scalars().all()
+            pending = [str(a) for a in all_ids if str(a) not in coverage_map]
+
+        if pending:
+            async with AsyncSessionLocal() as session:
+                computed = await self.refresh(session, pending)
+                await session.commit()
+            coverage_map.update(computed)
+
+        return coverage_map
+
+    async def get_coverage(self, db: AsyncSession, asset_id: str) -> Optional[dict]:
+        """Cobertura de un único activo (None si no existe)"""
+        coverage = await self.get_coverage_map(db, [asset_id])
+        return coverage.get(str(asset_id))
+
+    async def reconcile_all(self):
+        """Reconciliación completa de quote_coverage (tarea nocturna)"""
+        logger.info("🔄 Reconciliando cobertura de cotizaciones...")
+        async with AsyncSessionLocal() as db:
+            try:
+                coverage_map = await self.refresh(db)
+                await db.commit()
+                logger.info(f"✅ Cobertura reconciliada para {len(coverage_map)} activos")
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"❌ Error reconciliando cobertura de cotizaciones: {str(e)}")
+
+
+quote_coverage_service = QuoteCoverageService()
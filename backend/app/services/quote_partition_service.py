@@ -0,0 +1,101 @@
+"""
+Mantenimiento de las particiones anuales de quotes.
+
+quotes está particionada por rango de fecha (una partición por año, más
+quotes_historic para lo anterior a QUOTE_PARTITION_FIRST_YEAR). No hay
+partición DEFAULT: una cotización sin partición falla al insertarse, así que
+la partición del año siguiente se crea por adelantado en el arranque y en una
+tarea mensual del scheduler.
+"""
+import logging
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models.quote import QUOTE_HISTORIC_PARTITION, QUOTE_PARTITION_FIRST_YEAR, quote_partition_name
+
+logger = logging.getLogger(__name__)
+
+# Años por delante del actual con partición ya creada
+YEARS_AHEAD = 1
+
+IS_PARTITIONED_SQL = text("""
+    SELECT EXISTS (
+        SELECT 1
+        FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'quotes' AND c.relnamespace = 'public'::regnamespace
+    )
+""")
+
+PARTITIONS_SQL = text("""
+    SELECT
+        c.relname AS name,
+        pg_get_expr(c.relpartbound, c.oid) AS bounds,
+        c.reltuples::bigint AS estimated_rows,
+        pg_total_relation_size(c.oid) AS total_bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.quotes'::regclass
+    ORDER BY c.relname
+""")
+
+
+class QuotePartitionService:
+    """Creación y consulta de las particiones anuales de quotes"""
+
+    async def is_partitioned(self, db: AsyncSession) -> bool:
+        return bool((await db.execute(IS_PARTITIONED_SQL)).scalar())
+
+    async def ensure_partitions(self, db: Optional[AsyncSession] = None, through_year: Optional[int] = None) -> List[str]:
+        """
+        Crea las particiones que falten (la histórica y las anuales hasta through_year,
+        por defecto el año siguiente al actual).
+
+        Returns:
+            Nombres de las particiones creadas
+        """
+        if db is None:
+            async with AsyncSessionLocal() as session:
+                return await self.ensure_partitions(session, through_year)
+
+        through_year = through_year or date.today().year + YEARS_AHEAD
+        if not await self.is_partitioned(db):
+            logger.warning("⚠️ La tabla quotes no está particionada (falta aplicar la migración)")
+            return []
+
+        # Varios workers arrancan a la vez: serializar la creación
+        await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('quote_partitions'))"))
+        existing = {row.name for row in (await db.execute(PARTITIONS_SQL)).all()}
+
+        created = []
+        if QUOTE_HISTORIC_PARTITION not in existing:
+            await db.execute(text(
+                f"CREATE TABLE {QUOTE_HISTORIC_PARTITION} PARTITION OF quotes "
+                f"FOR VALUES FROM (MINVALUE) TO ('{QUOTE_PARTITION_FIRST_YEAR}-01-01 00:00:00+00')"
+            ))
+            created.append(QUOTE_HISTORIC_PARTITION)
+        for year in range(QUOTE_PARTITION_FIRST_YEAR, through_year + 1):
+            name = quote_partition_name(year)
+            if name in existing:
+                continue
+            await db.execute(text(
+                f"CREATE TABLE {name} PARTITION OF quotes "
+                f"FOR VALUES FROM ('{year}-01-01 00:00:00+00') TO ('{year + 1}-01-01 00:00:00+00')"
+            ))
+            created.append(name)
+        await db.commit()
+
+        if created:
+            logger.info(f"🗂️ Particiones de quotes creadas: {', '.join(created)}")
+        return created
+
+    async def get_partitions(self, db: AsyncSession) -> List[Dict]:
+        """Particiones con sus límites, filas estimadas y tamaño en disco"""
+        return [dict(row._mapping) for row in (await db.execute(PARTITIONS_SQL)).all()]
+
+
+quote_partition_service = QuotePartitionService()
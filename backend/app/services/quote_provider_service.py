@@ -23,12 +23,15 @@ class QuoteProviderService:
         symbol: str, 
         start_date: Optional[date] = None, 
         end_date: Optional[date] = None,
-        use_polygon: bool = True
+        use_polygon: bool = True,
+        use_cache: bool = True
     ) -> List[Dict]:
         """
         Obtiene cotizaciones históricas usando una estrategia de fallback:
         1. Polygon.io (Si use_polygon=True y disponible)
         2. Yahoo Finance (Standard/Fallback)
+        
+        use_cache=False ignora la caché de histórico en disco (p. ej. para reescribir datos)
         """
         quotes_data = None
         
@@ -39,7 +42,8 @@ class QuoteProviderService:
                 quotes_data = await polygon_service.get_historical_quotes(
                     symbol, 
                     start_date=start_date,
-                    end_date=end_date
+                    end_date=end_date,
+                    use_cache=use_cache
                 )
             except Exception as e:
                 logger.warning(f"⚠️ Error en Polygon para {symbol}: {e}")
@@ -51,7 +55,8 @@ class QuoteProviderService:
                 quotes_data = await yfinance_service.get_historical_quotes(
                     symbol, 
                     start_date=start_date,
-                    end_date=end_date
+                    end_date=end_date,
+                    use_cache=use_cache
                 )
             except Exception as e:
                 logger.error(f"❌ Error en Yahoo Finance para {symbol}: {e}")
@@ -0,0 +1,326 @@
+"""
+Escritura masiva de cotizaciones (upsert por (asset_id, date)).
+
+Punto único de escritura para todas las vías de ingesta de cotizaciones
+(scheduler, fetch por activo, importación Excel, reparación histórica).
+Sustituye el patrón "SELECT por fila + db.add" por:
+- INSERT ... ON CONFLICT (asset_id, date) en lotes multi-VALUES, o
+- COPY a una tabla temporal + INSERT ... SELECT para cargas grandes.
+
+También incluye la conversión columnar DataFrame -> cotizaciones (sin iterrows)
+que comparten yfinance y la importación de Excel.
+"""
+import logging
+import uuid
+from datetime import datetime, date, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import or_, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.quote import Quote, encode_quote_source
+from app.services.quote_coverage_service import quote_coverage_service
+
+logger = logging.getLogger(__name__)
+
+QUOTE_COLUMNS = ("asset_id", "date", "open", "high", "low", "close", "volume", "source")
+
+
+def normalize_quote_date(value) -> datetime:
+    """Normaliza una fecha (date, datetime naive/aware, Timestamp) a medianoche UTC"""
+    if hasattr(value, "to_pydatetime"):
+        value = value.to_pydatetime()
+    if isinstance(value, datetime):
+        value = value.date()
+    if not isinstance(value, date):
+        raise ValueError(f"Fecha de cotización no válida: {value!r}")
+    return datetime.combine(value, datetime.min.time()).replace(tzinfo=timezone.utc)
+
+
+def normalize_quote_frame(df: pd.DataFrame, date_column: Optional[str] = None) -> pd.DataFrame:
+    """
+    Normaliza un DataFrame OHLCV con operaciones vectorizadas.
+    
+    Acepta columnas en mayúsculas (yfinance: Open, Close...) o minúsculas y toma la
+    fecha del índice o de date_column. Las fechas con zona horaria se convierten a su
+    fecha local de mercado (igual que index.date() en yfinance) y se llevan a medianoche UTC.
+    
+    Returns:
+        DataFrame con columnas date, open, high, low, close (float64) y volume (int64),
+        sin filas con fecha o cierre nulos.
+    """
+    frame = df.rename(columns=lambda c: str(c).lower())
+    
+    raw_dates = frame[date_column] if date_column else frame.index.to_series()
+    dates = pd.to_datetime(raw_dates, errors="coerce")
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    dates = dates.dt.normalize().dt.tz_localize("UTC")
+    
+    close = pd.to_numeric(frame["close"], errors="coerce").to_numpy(dtype="float64")
+    
+    def _price(column: str) -> np.ndarray:
+        if column not in frame:
+            return close
+        values = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype="float64")
+        return np.where(np.isnan(values), close, values)
+    
+    if "volume" in frame:
+        volume = pd.to_numeric(frame["volume"], errors="coerce").to_numpy(dtype="float64")
+        volume = np.where(np.isnan(volume) | (volume < 0), 0, volume).astype("int64")
+    else:
+        volume = np.zeros(len(frame), dtype="int64")
+    
+    result = pd.DataFrame({
+        "date": dates.reset_index(drop=True),
+        "open": _price("open"),
+        "high": _price("high"),
+        "low": _price("low"),
+        "close": close,
+        "volume": volume,
+    })
+    return result.dropna(subset=["date", "close"]).reset_index(drop=True)
+
+
+def frame_to_quotes(frame: pd.DataFrame) -> List[Dict]:
+    """Convierte un DataFrame normalizado (normalize_quote_frame) a la lista de dicts de los servicios"""
+    return [
+        {"date": d, "open": o, "high": h, "low": l, "close": c, "volume": v}
+        for d, o, h, l, c, v in zip(
+            frame["date"].array.to_pydatetime(),
+            frame["open"].tolist(),
+            frame["high"].tolist(),
+            frame["low"].tolist(),
+            frame["close"].tolist(),
+            frame["volume"].tolist(),
+        )
+    ]
+
+
+class QuoteWriterService:
+    """Upsert masivo de cotizaciones con recuento de insertadas/actualizadas"""
+
+    # Filas por sentencia multi-VALUES (8 parámetros por fila, muy por debajo del límite de asyncpg)
+    batch_size = 1000
+    # A partir de este número de filas se usa COPY a tabla temporal
+    copy_threshold = 5000
+
+    async def upsert_quotes(
+        self,
+        db: AsyncSession,
+        rows: Iterable[Dict],
+        source: str,
+        update_existing: bool = False
+    ) -> Dict:
+        """
+        Inserta cotizaciones ignorando (o actualizando) las que ya existen para (asset_id, date).
+
+        Args:
+            db: Sesión de base de datos (no se hace commit: lo decide el llamador)
+            rows: Diccionarios con asset_id, date, open, high, low, close y volume opcional
+            source: Fuente de datos a registrar en la columna source
+            update_existing: Si True, ON CONFLICT DO UPDATE (solo filas cuyos valores cambian)
+
+        Returns:
+            {"inserted": n, "updated": n, "skipped": n,
+             "by_asset": {asset_id: {"inserted": n, "updated": n, "skipped": n, "first_date": date | None}}}
+            (first_date: fecha más antigua insertada o actualizada del activo)
+        """
+        return await self._write_records(db, self._prepare_records(rows, source), source, update_existing)
+
+    async def upsert_quote_frame(
+        self,
+        db: AsyncSession,
+        frame: pd.DataFrame,
+        asset_id,
+        source: str,
+        update_existing: bool = False
+    ) -> Dict:
+        """
+        Variante de upsert_quotes para un DataFrame ya normalizado (normalize_quote_frame)
+        de un único activo: los registros se construyen por columnas, sin normalizar fila a fila.
+        """
+        frame = frame.drop_duplicates(subset="date", keep="last")
+        records = [
+            {**quote, "asset_id": asset_id, "source": source}
+            for quote in frame_to_quotes(frame)
+        ]
+        return await self._write_records(db, records, source, update_existing)
+
+    async def _write_records(
+        self,
+        db: AsyncSession,
+        records: List[Dict],
+        source: str,
+        update_existing: bool
+    ) -> Dict:
+        if not records:
+            return {"inserted": 0, "updated": 0, "skipped": 0, "by_asset": {}}
+
+        if len(records) >= self.copy_threshold:
+            written = await self._copy_upsert(db, records, update_existing)
+        else:
+            written = await self._batched_upsert(db, records, update_existing)
+
+        # Recuento por activo (las filas no devueltas por RETURNING ya existían sin cambios)
+        by_asset: Dict[str, Dict] = {}
+        for record in records:
+            counts = by_asset.setdefault(
+                str(record["asset_id"]), {"inserted": 0, "updated": 0, "skipped": 0, "first_date": None}
+            )
+            counts["skipped"] += 1
+        for asset_id, (inserted, updated, first_date) in written.items():
+            counts = by_asset[asset_id]
+            counts["inserted"] = inserted
+            counts["updated"] = updated
+            counts["skipped"] -= inserted + updated
+            counts["first_date"] = first_date
+
+        inserted = sum(c["inserted"] for c in by_asset.values())
+        updated = sum(c["updated"] for c in by_asset.values())
+        skipped = len(records) - inserted - updated
+
+        # Mantener la cobertura materializada de los activos con filas nuevas (misma transacción)
+        if inserted:
+            await quote_coverage_service.refresh(
+                db, {asset_id for asset_id, c in by_asset.items() if c["inserted"]}
+            )
+
+        logger.debug(f"💾 Upsert cotizaciones ({source}): {inserted} nuevas, {updated} actualizadas, {skipped} sin cambios")
+        return {"inserted": inserted, "updated": updated, "skipped": skipped, "by_asset": by_asset}
+
+    def _prepare_records(self, rows: Iterable[Dict], source: str) -> List[Dict]:
+        """Normaliza fechas y elimina duplicados (asset_id, date) dentro del lote (gana el último)"""
+        by_key: Dict[tuple, Dict] = {}
+        for row in rows:
+            close = row["close"]
+            record = {
+                "asset_id": row["asset_id"],
+                "date": normalize_quote_date(row["date"]),
+                "open": row.get("open", close),
+                "high": row.get("high", close),
+                "low": row.get("low", close),
+                "close": close,
+                "volume": int(row.get("volume") or 0),
+                "source": row.get("source") or source,
+            }
+            by_key[(str(record["asset_id"]), record["date"])] = record
+        return list(by_key.values())
+
+    async def _batched_upsert(self, db: AsyncSession, records: List[Dict], update_existing: bool):
+        """Devuelve {asset_id: (insertadas, actualizadas, fecha más antigua escrita)}"""
+        written: Dict[str, List] = {}
+
+        for i in range(0, len(records), self.batch_size):
+            chunk = records[i:i + self.batch_size]
+            stmt = pg_insert(Quote).values(chunk)
+
+            if update_existing:
+                excluded = stmt.excluded
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Quote.asset_id, Quote.date],
+                    set_={
+                        "open": excluded.open,
+                        "high": excluded.high,
+                        "low": excluded.low,
+                        "close": excluded.close,
+                        "volume": excluded.volume,
+                        "source": excluded.source,
+                    },
+                    # No reescribir filas idénticas (ni contarlas como actualizadas)
+                    where=or_(
+                        Quote.open.is_distinct_from(excluded.open),
+                        Quote.high.is_distinct_from(excluded.high),
+                        Quote.low.is_distinct_from(excluded.low),
+                        Quote.close.is_distinct_from(excluded.close),
+                        Quote.volume.is_distinct_from(excluded.volume),
+                    )
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[Quote.asset_id, Quote.date])
+
+            # xmax = 0 solo en filas recién insertadas (en un UPDATE contiene el txid)
+            result = await db.execute(
+                stmt.returning(Quote.asset_id, Quote.date, literal_column("xmax = 0").label("inserted"))
+            )
+            for asset_id, quote_date, is_new in result.all():
+                counts = written.setdefault(str(asset_id), [0, 0, quote_date.date()])
+                counts[0 if is_new else 1] += 1
+                counts[2] = min(counts[2], quote_date.date())
+
+        return {asset_id: tuple(counts) for asset_id, counts in written.items()}
+
+    async def _copy_upsert(self, db: AsyncSession, records: List[Dict], update_existing: bool):
+        """COPY binario a una tabla temporal y un único INSERT ... SELECT ... ON CONFLICT (mismo retorno que _batched_upsert)"""
+        conn = await db.connection()
+        raw = await conn.get_raw_connection()
+        pg = raw.driver_connection  # asyncpg.Connection (misma transacción que la sesión)
+
+        await pg.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS quotes_staging (
+                asset_id uuid NOT NULL,
+                date timestamptz NOT NULL,
+                open double precision NOT NULL,
+                high double precision NOT NULL,
+                low double precision NOT NULL,
+                close double precision NOT NULL,
+                volume bigint,
+                source smallint
+            ) ON COMMIT DROP
+        """)
+        await pg.execute("TRUNCATE quotes_staging")
+        await pg.copy_records_to_table(
+            "quotes_staging",
+            records=[
+                (
+                    uuid.UUID(r["asset_id"]) if isinstance(r["asset_id"], str) else r["asset_id"],
+                    r["date"],
+                    float(r["open"]),
+                    float(r["high"]),
+                    float(r["low"]),
+                    float(r["close"]),
+                    r["volume"],
+                    encode_quote_source(r["source"]),
+                )
+                for r in records
+            ],
+            columns=list(QUOTE_COLUMNS),
+        )
+
+        if update_existing:
+            conflict = """
+                ON CONFLICT (asset_id, date) DO UPDATE SET
+                    open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+                    close = EXCLUDED.close, volume = EXCLUDED.volume, source = EXCLUDED.source
+                WHERE (quotes.open, quotes.high, quotes.low, quotes.close, quotes.volume)
+                    IS DISTINCT FROM (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+            """
+        else:
+            conflict = "ON CONFLICT (asset_id, date) DO NOTHING"
+
+        rows = await pg.fetch(f"""
+            WITH upserted AS (
+                INSERT INTO quotes (asset_id, date, open, high, low, close, volume, source)
+                SELECT asset_id, date, open, high, low, close, volume, source
+                FROM quotes_staging
+                {conflict}
+                RETURNING asset_id, date, (xmax = 0) AS inserted
+            )
+            SELECT
+                asset_id,
+                count(*) FILTER (WHERE inserted) AS inserted,
+                count(*) FILTER (WHERE NOT inserted) AS updated,
+                (min(date) AT TIME ZONE 'UTC')::date AS first_date
+            FROM upserted
+            GROUP BY asset_id
+        """)
+        return {
+            str(row["asset_id"]): (row["inserted"], row["updated"], row["first_date"])
+            for row in rows
+        }
+
+
+quote_writer_service = QuoteWriterService()
@@ -6,20 +6,36 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from pytz import timezone
 import asyncio
-from datetime import datetime, timedelta
-from sqlalchemy import select, and_
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, func
+from app.core.config import settings
 from app.core.database import AsyncSessionLocal
-from app.models.asset import Asset
+from app.models.asset import Asset, AssetType
 from app.models.quote import Quote
 from app.services.yfinance_service import yfinance_service
+from app.services.quote_writer_service import quote_writer_service
+from app.services.quote_coverage_service import quote_coverage_service
+from app.services.quote_partition_service import quote_partition_service
+from app.services.price_store_service import price_store_service
+from app.services.trading_calendar_service import trading_calendar_service
 from app.models.system_setting import SystemSetting
 
 logger = logging.getLogger(__name__)
 
 class SchedulerService:
+    # Activos por descarga multi-ticker y ventana inicial para activos sin cotizaciones
+    sync_batch_size = 50
+    initial_sync_days = 7
+
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
         self.timezone = timezone('Europe/Madrid')
+        # Peticiones simultáneas permitidas por proveedor durante el cierre diario
+        self.provider_limits = {
+            "yahoo": asyncio.Semaphore(settings.SYNC_YAHOO_CONCURRENCY)
+        }
+        self.sync_progress = {"status": "idle"}
 
     def start(self):
         """Inicia el programador de tareas"""
@@ -37,111 +53,228 @@ class SchedulerService:
             logger.info("🛑 Programador de tareas detenido")
 
     async def sync_all_quotes(self):
-        """Sincroniza las cotizaciones de todos los activos registrados (Cierre Diario - Backfill 5 días)"""
-        logger.info("🔄 Iniciando sincronización automática de cotizaciones (Estrategia Backfill 5d)...")
+        """
+        Sincroniza las cotizaciones de los activos con sync_enabled (Cierre Diario incremental).
         
-        async with AsyncSessionLocal() as db:
-            try:
-                # Obtener todos los activos registrados
-                result = await db.execute(select(Asset))
-                assets = result.scalars().all()
-                
-                logger.info(f"📊 Procesando {len(assets)} activos para cierre diario")
-                
-                # Obtener fecha actual en UTC para validación básica
-                from datetime import timezone as dt_timezone
-                now_utc = datetime.now(dt_timezone.utc)
+        El planificador obtiene la última fecha de cada activo en una consulta agrupada y
+        solo pide la ventana que falta desde esa fecha. Los activos con la misma ventana se
+        piden juntos con descargas multi-ticker. Pool acotado de workers (SYNC_WORKERS) con
+        límite de peticiones simultáneas por proveedor; cada activo se guarda y confirma en
+        su propia sesión, de modo que un fallo (o una caída del proceso) no pierde lo ya
+        sincronizado.
+        """
+        if self.sync_progress["status"] == "running":
+            logger.warning("⚠️ Ya hay una sincronización de cierre en curso, se omite esta ejecución")
+            return
+        
+        logger.info("🔄 Iniciando sincronización automática de cotizaciones (incremental desde última fecha)...")
+        
+        from datetime import timezone as dt_timezone
+        now_utc = datetime.now(dt_timezone.utc)
+        
+        try:
+            async with AsyncSessionLocal() as db:
+                # Última cotización de cada activo activo en una sola consulta agrupada
+                result = await db.execute(
+                    select(
+                        Asset.id,
+                        Asset.symbol,
+                        Asset.asset_type,
+                        Asset.market,
+                        func.max(Quote.date).label("last_date")
+                    )
+                    .outerjoin(Quote, Quote.asset_id == Asset.id)
+                    .where(Asset.sync_enabled == True)
+                    .group_by(Asset.id)
+                )
+                assets = result.all()
+        except Exception as e:
+            logger.error(f"❌ Error general en la sincronización de cierre: {str(e)}")
+            return
+        
+        windows, up_to_date = self._plan_sync_windows(assets, now_utc.date())
+        batches = [
+            (start, end, group[i:i + self.sync_batch_size])
+            for (start, end), group in windows.items()
+            for i in range(0, len(group), self.sync_batch_size)
+        ]
+        pending = sum(len(group) for group in windows.values())
+        
+        workers_count = max(1, min(settings.SYNC_WORKERS, len(batches)))
+        self.sync_progress = {
+            "status": "running",
+            "started_at": now_utc.isoformat(),
+            "finished_at": None,
+            "workers": workers_count,
+            "total": len(assets),
+            "up_to_date": up_to_date,
+            "batches": len(batches),
+            "processed": up_to_date,
+            "failed": 0,
+            "inserted": 0,
+            "in_progress": [],
+            "errors": []
+        }
+        logger.info(
+            f"📊 Cierre diario: {len(assets)} activos, {up_to_date} al día, "
+            f"{pending} pendientes en {len(batches)} lotes ({workers_count} workers)"
+        )
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        for batch in batches:
+            queue.put_nowait(batch)
+        
+        workers = [
+            asyncio.create_task(self._sync_worker(queue, now_utc))
+            for _ in range(workers_count)
+        ]
+        await asyncio.gather(*workers)
+        
+        # Actualizar marca de tiempo de última ejecución exitosa
+        try:
+            async with AsyncSessionLocal() as db:
+                now_str = now_utc.date().isoformat()
+                setting = await db.execute(select(SystemSetting).where(SystemSetting.key == "scheduler_last_sync_date"))
+                setting_obj = setting.scalar_one_or_none()
                 
-                stats_processed = 0
-                stats_inserted = 0
+                if not setting_obj:
+                    setting_obj = SystemSetting(
+                        key="scheduler_last_sync_date", 
+                        value=now_str, 
+                        type="date", 
+                        description="Última ejecución exitosa del cierre diario"
+                    )
+                    db.add(setting_obj)
+                else:
+                    setting_obj.value = now_str
+                await db.commit()
+        except Exception as ex_setting:
+            logger.error(f"⚠️ No se pudo guardar la fecha de sincronización: {ex_setting}")
+        
+        progress = self.sync_progress
+        progress["status"] = "completed"
+        progress["finished_at"] = datetime.now(dt_timezone.utc).isoformat()
+        logger.info(
+            f"✅ Cierre diario completado. Activos: {progress['processed']}, "
+            f"Fallidos: {progress['failed']}, Nuevas Cotizaciones: {progress['inserted']}"
+        )
+
+    def _plan_sync_windows(self, assets, today: date):
+        """
+        Agrupa los activos por ventana de descarga [inicio, fin).
+        
+        - Al día (su última cotización es la última sesión cerrada de su bolsa): se omite.
+        - Con cotizaciones: desde el día siguiente a la última.
+        - Sin cotizaciones: últimos INITIAL_SYNC_DAYS (el histórico completo es cosa de la importación masiva).
+        
+        Returns:
+            ({(start, end): [assets]}, número de activos al día)
+        """
+        windows = defaultdict(list)
+        up_to_date = 0
+        
+        for asset in assets:
+            calendar = trading_calendar_service.for_asset(asset.market, asset.asset_type == AssetType.CRYPTO)
+            last_session = calendar.previous_session(today)
+            
+            if asset.last_date is None:
+                start = today - timedelta(days=self.initial_sync_days)
+            else:
+                last_date = asset.last_date.date()
+                if last_date >= last_session:
+                    up_to_date += 1
+                    continue
+                start = last_date + timedelta(days=1)
+            
+            # Fin exclusivo: hoy (la vela de hoy está incompleta y se descarta igualmente)
+            windows[(start, today)].append(asset)
+        
+        return windows, up_to_date
+
+    async def _sync_worker(self, queue: asyncio.Queue, now_utc: datetime):
+        """Consume lotes (activos con la misma ventana) de la cola hasta vaciarla"""
+        while True:
+            try:
+                start, end, batch = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            
+            progress = self.sync_progress
+            symbols = [asset.symbol for asset in batch]
+            progress["in_progress"].extend(symbols)
+            try:
+                logger.info(f"🔎 Descargando {len(batch)} activos ({start} → {end})...")
+                async with self.provider_limits["yahoo"]:
+                    history = await yfinance_service.get_historical_quotes_batch(symbols, start, end)
                 
-                for asset in assets:
+                for asset in batch:
                     try:
-                        logger.info(f"🔎 Verificando historial reciente para {asset.symbol}...")
-                        
-                        # ESTRATEGIA: Obtener últimos 5 días para rellenar huecos si falló algún día anterior
-                        historical_data = await yfinance_service.get_historical_quotes(asset.symbol, period="5d")
-                        
-                        if historical_data:
-                            for quote_data in historical_data:
-                                # Normalizar fecha a medianoche UTC (ya viene así del servicio, pero aseguramos)
-                                data_date = quote_data["date"]
-                                
-                                # EVITAR FINES DE SEMANA
-                                # (Sábado = 5, Domingo = 6)
-                                from app.models.asset import AssetType
-                                if asset.asset_type != AssetType.CRYPTO and data_date.weekday() >= 5:
-                                    continue
-                                
-                                quote_date = datetime.combine(data_date.date(), datetime.min.time()).replace(tzinfo=dt_timezone.utc)
-                                
-                                # FIX CRÍTICO: Ignorar velas incompletas de HOY
-                                # Solo importar cotizaciones de días estrictamente anteriores
-                                if quote_date.date() >= now_utc.date():
-                                    logger.debug(f"⏭️ Ignorando cotización incompleta de hoy para {asset.symbol} ({quote_date.date()})")
-                                    continue
-                                
-                                # Verificar si ya existe exactamente para esa fecha
-                                existing = await db.execute(
-                                    select(Quote).where(
-                                        and_(
-                                            Quote.asset_id == asset.id,
-                                            Quote.date == quote_date
-                                        )
-                                    )
-                                )
-                                
-                                if existing.scalar_one_or_none():
-                                    continue
-                                    
-                                # Crear nueva cotización
-                                new_quote = Quote(
-                                    asset_id=asset.id,
-                                    date=quote_date,
-                                    open=quote_data["open"],
-                                    high=quote_data["high"],
-                                    low=quote_data["low"],
-                                    close=quote_data["close"],
-                                    volume=quote_data["volume"],
-                                    source="daily_scheduler_backfill"
-                                )
-                                db.add(new_quote)
-                                stats_inserted += 1
-                                logger.info(f"✅ Nuevo cierre importado para {asset.symbol}: {quote_data['close']} ({quote_date.date()})")
-                                
-                        else:
-                            logger.warning(f"⚠️ No se obtuvieron datos históricos para {asset.symbol}")
-                            
-                        stats_processed += 1
-                        
+                        inserted = await self._save_asset_quotes(asset, history.get(asset.symbol), now_utc)
+                        progress["inserted"] += inserted
+                        progress["processed"] += 1
                     except Exception as e:
-                        logger.error(f"❌ Error sincronizando {asset.symbol}: {str(e)}")
-                
-                # Actualizar marca de tiempo de última ejecución exitosa
-                try:
-                    now_str = now_utc.date().isoformat()
-                    setting = await db.execute(select(SystemSetting).where(SystemSetting.key == "scheduler_last_sync_date"))
-                    setting_obj = setting.scalar_one_or_none()
-                    
-                    if not setting_obj:
-                        setting_obj = SystemSetting(
-                            key="scheduler_last_sync_date", 
-                            value=now_str, 
-                            type="date", 
-                            description="Última ejecución exitosa del cierre diario"
-                        )
-                        db.add(setting_obj)
-                    else:
-                        setting_obj.value = now_str
-                except Exception as ex_setting:
-                    logger.error(f"⚠️ No se pudo guardar la fecha de sincronización: {ex_setting}")
+                        self._record_sync_error(asset.symbol, e)
+                    finally:
+                        progress["in_progress"].remove(asset.symbol)
+            except Exception as e:
+                # Fallo del lote completo: se cuentan como fallidos los activos aún no procesados
+                for symbol in symbols:
+                    if symbol in progress["in_progress"]:
+                        self._record_sync_error(symbol, e)
+                        progress["in_progress"].remove(symbol)
+            finally:
+                queue.task_done()
 
+    def _record_sync_error(self, symbol: str, error: Exception):
+        progress = self.sync_progress
+        progress["failed"] += 1
+        # Solo los últimos errores, para no inflar la respuesta del monitor
+        progress["errors"] = (progress["errors"] + [f"{symbol}: {str(error)}"])[-20:]
+        logger.error(f"❌ Error sincronizando {symbol}: {str(error)}")
+
+    async def _save_asset_quotes(self, asset, historical_data, now_utc: datetime) -> int:
+        """Filtra y guarda las cotizaciones descargadas de un activo en su propia transacción"""
+        if not historical_data:
+            logger.warning(f"⚠️ No se obtuvieron datos históricos para {asset.symbol}")
+            return 0
+        
+        calendar = trading_calendar_service.for_asset(asset.market, asset.asset_type == AssetType.CRYPTO)
+        rows = []
+        for quote_data in historical_data:
+            # Normalizar fecha a medianoche UTC (ya viene así del servicio, pero aseguramos)
+            data_date = quote_data["date"]
+            
+            # EVITAR FINES DE SEMANA Y FESTIVOS de la bolsa del activo (crypto cotiza 24/7)
+            if not calendar.is_session(data_date.date()):
+                continue
+            
+            # FIX CRÍTICO: Ignorar velas incompletas de HOY
+            # Solo importar cotizaciones de días estrictamente anteriores
+            if data_date.date() >= now_utc.date():
+                logger.debug(f"⏭️ Ignorando cotización incompleta de hoy para {asset.symbol} ({data_date.date()})")
+                continue
+            
+            rows.append({**quote_data, "asset_id": asset.id})
+        
+        async with AsyncSessionLocal() as db:
+            try:
+                # Upsert en bloque: las fechas ya existentes se ignoran en BD
+                counts = await quote_writer_service.upsert_quotes(db, rows, source="daily_scheduler_backfill")
                 await db.commit()
-                logger.info(f"✅ Cierre diario completado. Activos: {stats_processed}, Nuevas Cotizaciones: {stats_inserted}")
-                
-            except Exception as e:
+            except Exception:
                 await db.rollback()
-                logger.error(f"❌ Error general en la sincronización de cierre: {str(e)}")
+                raise
+        await price_store_service.publish_changes(counts["by_asset"])
+        
+        if counts["inserted"]:
+            logger.info(f"✅ {counts['inserted']} nuevos cierres importados para {asset.symbol}")
+        return counts["inserted"]
+
+    def get_sync_progress(self) -> dict:
+        """Estado/progreso de la última sincronización de cierre"""
+        progress = dict(self.sync_progress)
+        progress["in_progress"] = list(progress.get("in_progress", []))
+        return progress
 
     async def check_startup_sync(self):
         """Verifica al inicio si falta la sincronización del día"""
@@ -196,6 +329,34 @@ class SchedulerService:
                     name='Sincronización diaria de cotizaciones (Cierre)',
                     replace_existing=True
                 )
+                
+                # Reconciliación nocturna de la cobertura materializada (tras el cierre diario)
+                self.scheduler.add_job(
+                    quote_coverage_service.reconcile_all,
+                    CronTrigger(hour=(hour + 2) % 24, minute=minute, timezone='UTC'),
+                    id='reconcile_quote_coverage_daily',
+                    name='Reconciliación diaria de cobertura de cotizaciones',
+                    replace_existing=True
+                )
+                
+                # Particiones anuales de quotes creadas por adelantado
+                self.scheduler.add_job(
+                    quote_partition_service.ensure_partitions,
+                    CronTrigger(day=1, hour=(hour + 3) % 24, minute=minute, timezone='UTC'),
+                    id='ensure_quote_partitions_monthly',
+                    name='Creación mensual de particiones de cotizaciones',
+                    replace_existing=True
+                )
+                
+                # Almacén local de precios: construcción inicial y cambios pendientes
+                # (normalmente ya sincronizados tras cada ingesta)
+                self.scheduler.add_job(
+                    price_store_service.sync,
+                    CronTrigger(minute='*/10', timezone='UTC'),
+                    id='sync_price_store',
+                    name='Sincronización del almacén local de precios',
+                    replace_existing=True
+                )
             except Exception as e:
                 logger.error(f"❌ Error recargando trabajos del scheduler: {str(e)}")
                 # Reintento básico 00:00 UTC
@@ -0,0 +1,233 @@
+"""
+Servicio de escaneo de pérdidas latentes (Tax-Loss Harvesting).
+
+Combina los lotes FIFO abiertos del motor fiscal con los precios de la tabla
+virtual de Redis (quote:{symbol}) y las tasas de ForexService para listar los
+lotes que hoy se venderían con pérdida, ordenados por pérdida aprovechable.
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.core.redis_client import redis_client
+from app.models.portfolio import Portfolio
+from app.models.quote import Quote
+from app.models.transaction import Transaction
+from app.schemas.fiscal import HarvestableLot, TaxLossHarvestReport
+from app.services.fiscal_service import fiscal_service
+from app.services.forex_service import forex_service
+
+logger = logging.getLogger(__name__)
+
+# Misma aproximación de 2 meses que usa FiscalService._apply_wash_sale_rule
+WASH_SALE_WINDOW = timedelta(days=60)
+
+
+class TaxLossHarvestingService:
+    """Escáner de lotes abiertos con pérdida latente para un usuario"""
+
+    async def scan(
+        self,
+        user_id: str,
+        base_currency: str,
+        db: AsyncSession,
+        portfolio_id: Optional[str] = None
+    ) -> TaxLossHarvestReport:
+        """
+        Devuelve los lotes abiertos con pérdida latente, ordenados de mayor a menor pérdida.
+
+        El FIFO se ejecuta por cartera (igual que el informe fiscal), pero el riesgo de
+        wash sale se evalúa sobre todas las carteras del usuario, ya que la regla de los
+        2 meses aplica a valores homogéneos independientemente del bróker.
+        """
+        report = TaxLossHarvestReport(base_currency=base_currency)
+
+        # 1. Transacciones del usuario (todas sus carteras) con el activo cargado
+        stmt = (
+            select(Transaction)
+            .options(joinedload(Transaction.asset))
+            .join(Portfolio)
+            .where(Portfolio.user_id == user_id)
+            .order_by(Transaction.transaction_date, Transaction.id)
+        )
+        result = await db.execute(stmt)
+        transactions = result.scalars().all()
+
+        if not transactions:
+            return report
+
+        # 2. Lotes FIFO abiertos por cartera
+        ops_by_portfolio = defaultdict(list)
+        for t in transactions:
+            ops_by_portfolio[str(t.portfolio_id)].append(t)
+
+        rows = []
+        for pid, txs in ops_by_portfolio.items():
+            for lot in fiscal_service.get_open_lots(fiscal_service.build_operations(txs)):
+                op = lot.op
+                # Comisiones de compra proporcionales a la cantidad pendiente
+                fees_part = (op.fees or Decimal(0)) * (lot.remaining_quantity / op.quantity)
+                rows.append({
+                    "portfolio_id": pid,
+                    "asset_id": op.asset_id,
+                    "asset_symbol": op.asset_symbol,
+                    "asset_currency": op.asset_currency,
+                    "acquisition_date": op.date,
+                    "quantity": float(lot.remaining_quantity),
+                    "acquisition_price": float(op.price),
+                    "cost_basis": float(op.price * lot.remaining_quantity + fees_part),
+                })
+
+        if not rows:
+            return report
+
+        lots = pd.DataFrame(rows)
+
+        # 3. Precios: tabla virtual (Redis) con fallback al último cierre en BD
+        symbols = sorted(lots["asset_symbol"].unique())
+        prices, sources = await self._get_prices(symbols, lots, db)
+
+        # 4. Tasas de cambio actuales por moneda
+        today = datetime.now(timezone.utc).date()
+        currencies = sorted({c for c in lots["asset_currency"].unique() if c})
+        rates = await self._get_rates(currencies, base_currency, today, db)
+
+        # 5. Cálculo vectorizado sobre todos los lotes del usuario
+        now = pd.Timestamp.now(tz="UTC")
+        lots["acquisition_date"] = pd.to_datetime(lots["acquisition_date"], utc=True)
+        lots["current_price"] = lots["asset_symbol"].map(prices)
+        lots["price_source"] = lots["asset_symbol"].map(sources)
+        lots["exchange_rate"] = lots["asset_currency"].map(rates).fillna(1.0)
+
+        missing = lots["current_price"].isna()
+        report.symbols_without_price = sorted(lots.loc[missing, "asset_symbol"].unique())
+        lots = lots.loc[~missing].copy()
+
+        lots["current_value"] = lots["quantity"] * lots["current_price"]
+        lots["unrealized_original"] = lots["current_value"] - lots["cost_basis"]
+        # Igual que el motor fiscal: P&L en divisa original * tasa en la fecha de venta (hoy)
+        lots["unrealized_base"] = lots["unrealized_original"] * lots["exchange_rate"]
+        lots["days_held"] = (now - lots["acquisition_date"]).dt.days
+
+        # Riesgo wash sale: otras unidades homogéneas compradas en los últimos 60 días
+        # que seguirían en cartera tras vender este lote.
+        is_recent = lots["acquisition_date"] >= now - WASH_SALE_WINDOW
+        recent_qty = lots["quantity"].where(is_recent, 0.0)
+        lots["recent_purchase_quantity"] = recent_qty.groupby(lots["asset_id"]).transform("sum") - recent_qty
+        lots["wash_sale_risk"] = lots["recent_purchase_quantity"] > 1e-9
+
+        if portfolio_id:
+            lots = lots.loc[lots["portfolio_id"] == portfolio_id]
+
+        losers = lots.loc[lots["unrealized_base"] < 0].sort_values("unrealized_base")
+
+        report.lots = [self._to_item(row) for row in losers.itertuples(index=False)]
+        report.total_harvestable_loss = sum((item.harvestable_loss for item in report.lots), Decimal(0))
+
+        logger.info(
+            f"🔎 Tax-loss scan usuario {user_id}: {len(lots)} lotes abiertos, "
+            f"{len(report.lots)} con pérdida ({report.total_harvestable_loss:.2f} {base_currency})"
+        )
+
+        return report
+
+    async def _get_prices(self, symbols: List[str], lots: pd.DataFrame, db: AsyncSession):
+        """Lee precios de la tabla virtual y completa los que falten con el último cierre"""
+        prices: Dict[str, float] = {}
+        sources: Dict[str, str] = {}
+
+        try:
+            cached_values = await redis_client.mget([f"quote:{s}" for s in symbols])
+            for symbol, val in zip(symbols, cached_values):
+                if val:
+                    data = json.loads(val)
+                    if data.get("close"):
+                        prices[symbol] = float(data["close"])
+                        sources[symbol] = "online"
+        except Exception as e:
+            logger.warning(f"⚠️ Error leyendo tabla virtual para tax-loss scan: {e}")
+
+        missing = [s for s in symbols if s not in prices]
+        if missing:
+            id_by_symbol = dict(
+                lots.loc[lots["asset_symbol"].isin(missing), ["asset_symbol", "asset_id"]]
+                .drop_duplicates()
+                .itertuples(index=False)
+            )
+            stmt = select(
+                Quote.asset_id,
+                Quote.close
+            ).distinct(Quote.asset_id).where(
+                Quote.asset_id.in_(list(id_by_symbol.values()))
+            ).order_by(Quote.asset_id, Quote.date.desc())
+            result = await db.execute(stmt)
+            last_close = {str(row.asset_id): float(row.close) for row in result.all()}
+
+            for symbol, asset_id in id_by_symbol.items():
+                if asset_id in last_close:
+                    prices[symbol] = last_close[asset_id]
+                    sources[symbol] = "historic"
+
+        return prices, sources
+
+    async def _get_rates(self, currencies: List[str], base_currency: str, today, db: AsyncSession) -> Dict[str, float]:
+        """Tasas actuales (tabla virtual si existe, si no último cierre del par en BD)"""
+        foreign = [c for c in currencies if c != base_currency]
+        rates: Dict[str, float] = {c: 1.0 for c in currencies if c == base_currency}
+
+        if foreign:
+            try:
+                pairs = [f"{curr}{base_currency}=X" for curr in foreign]
+                cached_values = await redis_client.mget([f"quote:{p}" for p in pairs])
+                for curr, val in zip(foreign, cached_values):
+                    if val:
+                        data = json.loads(val)
+                        if data.get("close"):
+                            forex_service.inject_live_rate(curr, base_currency, today, float(data["close"]))
+            except Exception as e:
+                logger.warning(f"⚠️ Error leyendo tasas de la tabla virtual: {e}")
+
+            for curr in foreign:
+                rates[curr] = await forex_service.get_exchange_rate(curr, base_currency, today, db)
+
+        return rates
+
+    def _to_item(self, row) -> HarvestableLot:
+        notes = None
+        if row.wash_sale_risk:
+            notes = (
+                f"Riesgo wash sale: {row.recent_purchase_quantity:g} uds. compradas en los últimos "
+                f"{WASH_SALE_WINDOW.days} días. La pérdida no sería computable mientras se mantengan."
+            )
+
+        return HarvestableLot(
+            portfolio_id=row.portfolio_id,
+            asset_id=row.asset_id,
+            asset_symbol=row.asset_symbol,
+            asset_currency=row.asset_currency,
+            acquisition_date=row.acquisition_date.to_pydatetime(),
+            days_held=int(row.days_held),
+            quantity=Decimal(str(row.quantity)),
+            acquisition_price=Decimal(str(row.acquisition_price)),
+            cost_basis=Decimal(str(round(row.cost_basis, 6))),
+            current_price=Decimal(str(row.current_price)),
+            current_value=Decimal(str(round(row.current_value, 6))),
+            unrealized_result_original=Decimal(str(round(row.unrealized_original, 6))),
+            exchange_rate_used=Decimal(str(row.exchange_rate)),
+            harvestable_loss=Decimal(str(round(-row.unrealized_base, 2))),
+            price_source=row.price_source,
+            wash_sale_risk=bool(row.wash_sale_risk),
+            recent_purchase_quantity=Decimal(str(row.recent_purchase_quantity)),
+            notes=notes
+        )
+
+
+tax_loss_harvesting_service = TaxLossHarvestingService()
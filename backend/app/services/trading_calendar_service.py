@@ -0,0 +1,396 @@
+"""
+Calendarios de negociación por mercado (festivos de cada bolsa).
+
+Cada Market (por nombre, ver app/scripts/seed_markets.py) se asocia a un
+calendario de bolsa con sus reglas de festivos (fijos, móviles y dependientes
+de Semana Santa). Las sesiones de cada año se precalculan como un bitset
+(bit i = día i del año) y se cachean, de modo que consultar si un día cotiza
+o listar las sesiones de un rango no recalcula reglas.
+"""
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Primer año para el que se generan festivos al exportarlos a SQL
+HOLIDAY_HISTORY_START_YEAR = 1990
+
+
+# ---------------------------------------------------------------------------
+# Utilidades de fechas
+# ---------------------------------------------------------------------------
+
+def easter_sunday(year: int) -> date:
+    """Domingo de Pascua (algoritmo gregoriano anónimo / Meeus)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """n-ésimo día de la semana del mes (weekday: 0=lunes). n=-1 para el último"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last = next_month - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed_us(d: date) -> date:
+    """Regla NYSE: sábado -> viernes anterior, domingo -> lunes siguiente"""
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+
+def observed_next_monday(d: date) -> date:
+    """Festivo en fin de semana que se traslada al lunes siguiente (UK, Canadá)"""
+    if d.weekday() >= 5:
+        return d + timedelta(days=7 - d.weekday())
+    return d
+
+
+def christmas_and_boxing_day(year: int) -> List[date]:
+    """Navidad y Boxing Day (UK, Canadá): si caen en fin de semana se trasladan a lunes/martes"""
+    christmas = date(year, 12, 25)
+    if christmas.weekday() == 5:
+        return [date(year, 12, 27), date(year, 12, 28)]
+    if christmas.weekday() == 6:
+        return [date(year, 12, 26), date(year, 12, 27)]
+    if christmas.weekday() == 4:
+        return [christmas, date(year, 12, 28)]
+    return [christmas, date(year, 12, 26)]
+
+
+@lru_cache(maxsize=None)
+def weekday_bits(year: int) -> int:
+    """Bitset de lunes a viernes del año (bit i = día i del año)"""
+    start = date(year, 1, 1)
+    bits = 0
+    for i in range((date(year + 1, 1, 1) - start).days):
+        if (start + timedelta(days=i)).weekday() < 5:
+            bits |= 1 << i
+    return bits
+
+
+# ---------------------------------------------------------------------------
+# Reglas de festivos por bolsa
+# ---------------------------------------------------------------------------
+
+def _nyse_holidays(year: int) -> List[date]:
+    easter = easter_sunday(year)
+    days = [
+        nth_weekday(year, 1, 0, 3),   # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),   # Presidents' Day
+        easter - timedelta(days=2),   # Good Friday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        observed_us(date(year, 7, 4)),
+        nth_weekday(year, 9, 0, 1),   # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        observed_us(date(year, 12, 25)),
+    ]
+    # Año Nuevo: si cae en sábado no se traslada (el viernes es cierre de ejercicio)
+    new_year = date(year, 1, 1)
+    if new_year.weekday() == 6:
+        days.append(new_year + timedelta(days=1))
+    elif new_year.weekday() < 5:
+        days.append(new_year)
+    if year >= 2022:
+        days.append(observed_us(date(year, 6, 19)))  # Juneteenth
+    return days
+
+
+def _lse_holidays(year: int) -> List[date]:
+    easter = easter_sunday(year)
+    days = [
+        observed_next_monday(date(year, 1, 1)),
+        easter - timedelta(days=2),   # Good Friday
+        easter + timedelta(days=1),   # Easter Monday
+        nth_weekday(year, 5, 0, 1),   # Early May bank holiday
+        nth_weekday(year, 5, 0, -1),  # Spring bank holiday
+        nth_weekday(year, 8, 0, -1),  # Summer bank holiday
+    ]
+    return days + christmas_and_boxing_day(year)
+
+
+def _xetra_holidays(year: int) -> List[date]:
+    easter = easter_sunday(year)
+    return [
+        date(year, 1, 1),
+        easter - timedelta(days=2),
+        easter + timedelta(days=1),
+        date(year, 5, 1),
+        date(year, 12, 24),
+        date(year, 12, 25),
+        date(year, 12, 26),
+        date(year, 12, 31),
+    ]
+
+
+def _euronext_holidays(year: int) -> List[date]:
+    easter = easter_sunday(year)
+    return [
+        date(year, 1, 1),
+        easter - timedelta(days=2),
+        easter + timedelta(days=1),
+        date(year, 5, 1),
+        date(year, 12, 25),
+        date(year, 12, 26),
+    ]
+
+
+def _borsa_italiana_holidays(year: int) -> List[date]:
+    easter = easter_sunday(year)
+    return [
+        date(year, 1, 1),
+        easter - timedelta(days=2),
+        easter + timedelta(days=1),
+        date(year, 5, 1),
+        date(year, 8, 15),
+        date(year, 12, 24),
+        date(year, 12, 25),
+        date(year, 12, 26),
+        date(year, 12, 31),
+    ]
+
+
+def _bme_holidays(year: int) -> List[date]:
+    easter = easter_sunday(year)
+    return [
+        date(year, 1, 1),
+        easter - timedelta(days=2),
+        easter + timedelta(days=1),
+        date(year, 5, 1),
+        date(year, 12, 25),
+        date(year, 12, 26),
+    ]
+
+
+def _six_holidays(year: int) -> List[date]:
+    easter = easter_sunday(year)
+    return [
+        date(year, 1, 1),
+        date(year, 1, 2),              # Berchtoldstag
+        easter - timedelta(days=2),
+        easter + timedelta(days=1),
+        easter + timedelta(days=39),   # Ascensión
+        easter + timedelta(days=50),   # Lunes de Pentecostés
+        date(year, 5, 1),
+        date(year, 8, 1),              # Fiesta nacional
+        date(year, 12, 24),
+        date(year, 12, 25),
+        date(year, 12, 26),
+        date(year, 12, 31),
+    ]
+
+
+def _tsx_holidays(year: int) -> List[date]:
+    easter = easter_sunday(year)
+    victoria_day = date(year, 5, 24) - timedelta(days=date(year, 5, 24).weekday())
+    days = [
+        observed_next_monday(date(year, 1, 1)),
+        easter - timedelta(days=2),
+        victoria_day,                  # Lunes anterior al 25 de mayo
+        observed_next_monday(date(year, 7, 1)),
+        nth_weekday(year, 8, 0, 1),    # Civic Holiday
+        nth_weekday(year, 9, 0, 1),    # Labour Day
+        nth_weekday(year, 10, 0, 2),   # Thanksgiving
+    ]
+    if year >= 2008:
+        days.append(nth_weekday(year, 2, 0, 3))  # Family Day
+    return days + christmas_and_boxing_day(year)
+
+
+# ---------------------------------------------------------------------------
+# Calendarios
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class ExchangeCalendar:
+    """Definición de una bolsa: zona horaria, horario de sesión y reglas de festivos"""
+    code: str
+    name: str
+    timezone: str
+    open_time: time
+    close_time: time
+    holiday_rule: Optional[Callable[[int], List[date]]] = None
+    weekends: bool = False  # True si cotiza también sábados y domingos (crypto)
+
+
+EXCHANGE_CALENDARS: Dict[str, ExchangeCalendar] = {
+    cal.code: cal for cal in [
+        ExchangeCalendar("XNYS", "New York (NYSE/NASDAQ)", "America/New_York", time(9, 30), time(16, 0), _nyse_holidays),
+        ExchangeCalendar("XMAD", "Bolsa de Madrid (BME)", "Europe/Madrid", time(9, 0), time(17, 30), _bme_holidays),
+        ExchangeCalendar("XETR", "Xetra / Frankfurt", "Europe/Berlin", time(9, 0), time(17, 30), _xetra_holidays),
+        ExchangeCalendar("XPAR", "Euronext París", "Europe/Paris", time(9, 0), time(17, 30), _euronext_holidays),
+        ExchangeCalendar("XAMS", "Euronext Ámsterdam", "Europe/Amsterdam", time(9, 0), time(17, 30), _euronext_holidays),
+        ExchangeCalendar("XMIL", "Borsa Italiana", "Europe/Rome", time(9, 0), time(17, 30), _borsa_italiana_holidays),
+        ExchangeCalendar("XLON", "London Stock Exchange", "Europe/London", time(8, 0), time(16, 30), _lse_holidays),
+        ExchangeCalendar("XSWX", "SIX Swiss Exchange", "Europe/Zurich", time(9, 0), time(17, 30), _six_holidays),
+        ExchangeCalendar("XTSE", "Toronto Stock Exchange", "America/Toronto", time(9, 30), time(16, 0), _tsx_holidays),
+        # Mercado desconocido: lunes a viernes sin festivos (comportamiento histórico)
+        ExchangeCalendar("XWKD", "Días laborables", "UTC", time(0, 0), time(23, 59)),
+        ExchangeCalendar("CRYPTO", "Crypto 24/7", "UTC", time(0, 0), time(23, 59), weekends=True),
+    ]
+}
+
+DEFAULT_CALENDAR = "XWKD"
+CRYPTO_CALENDAR = "CRYPTO"
+
+# Nombre de Market -> calendario (nombres de app/scripts/seed_markets.py)
+MARKET_CALENDARS: Dict[str, str] = {
+    "NASDAQ": "XNYS",
+    "NYSE": "XNYS",
+    "NEW YORK": "XNYS",
+    "NYSE AMERICAN": "XNYS",
+    "CONTINUO": "XMAD",
+    "MCE": "XMAD",
+    "XETRA": "XETR",
+    "XETRA US STARS": "XETR",
+    "FRANKFURT": "XETR",
+    "PARIS": "XPAR",
+    "MILAN": "XMIL",
+    "AMSTERDAM": "XAMS",
+    "LSE": "XLON",
+    "LONDON": "XLON",
+    "SWX": "XSWX",
+    "TORONTO": "XTSE",
+}
+
+
+class TradingCalendar:
+    """Sesiones de una bolsa precalculadas como bitsets anuales"""
+
+    def __init__(self, exchange: ExchangeCalendar):
+        self.exchange = exchange
+        self.tz = ZoneInfo(exchange.timezone)
+        # 00:00-23:59: abierto todo el día de sesión
+        self.full_day = exchange.open_time == time(0, 0) and exchange.close_time >= time(23, 59)
+        self._year_bits: Dict[int, int] = {}
+
+    def _bits(self, year: int) -> int:
+        """Bitset de sesiones del año (calculado una vez por año y calendario)"""
+        bits = self._year_bits.get(year)
+        if bits is None:
+            start = date(year, 1, 1)
+            if self.exchange.weekends:
+                bits = (1 << (date(year + 1, 1, 1) - start).days) - 1
+            else:
+                bits = weekday_bits(year)
+                if self.exchange.holiday_rule:
+                    for holiday in self.exchange.holiday_rule(year):
+                        if holiday.year == year:
+                            bits &= ~(1 << (holiday - start).days)
+            self._year_bits[year] = bits
+        return bits
+
+    def is_session(self, d: date) -> bool:
+        """True si la bolsa abre ese día"""
+        return bool(self._bits(d.year) >> (d.timetuple().tm_yday - 1) & 1)
+
+    def sessions(self, start: date, end: date) -> List[date]:
+        """Días de sesión en [start, end]"""
+        result = []
+        d = start
+        while d <= end:
+            bits = self._bits(d.year)
+            year_end = min(end, date(d.year, 12, 31))
+            offset = d.timetuple().tm_yday - 1
+            while d <= year_end:
+                if bits >> offset & 1:
+                    result.append(d)
+                d += timedelta(days=1)
+                offset += 1
+        return result
+
+    def holidays(self, start: date, end: date) -> List[date]:
+        """Días laborables (L-V) en [start, end] en los que la bolsa no abre"""
+        if self.exchange.weekends:
+            return []
+        result = []
+        for year in range(start.year, end.year + 1):
+            # Bits a 1 = laborable sin sesión; se recorren solo esos bits
+            holiday_bits = weekday_bits(year) & ~self._bits(year)
+            jan_first = date(year, 1, 1)
+            while holiday_bits:
+                lowest = holiday_bits & -holiday_bits
+                d = jan_first + timedelta(days=lowest.bit_length() - 1)
+                if start <= d <= end:
+                    result.append(d)
+                holiday_bits ^= lowest
+        return result
+
+    def is_open(self, at: datetime) -> bool:
+        """True si la bolsa está en horario de sesión en el instante at (con zona horaria)"""
+        local = at.astimezone(self.tz)
+        if not self.is_session(local.date()):
+            return False
+        return self.full_day or self.exchange.open_time <= local.time() < self.exchange.close_time
+
+    def previous_session(self, d: date) -> date:
+        """Última sesión estrictamente anterior a d"""
+        d -= timedelta(days=1)
+        while not self.is_session(d):
+            d -= timedelta(days=1)
+        return d
+
+
+class TradingCalendarService:
+    """Resolución de calendarios por mercado/activo con caché de bitsets"""
+
+    def __init__(self):
+        self._calendars: Dict[str, TradingCalendar] = {}
+        self._holiday_table_cache: Dict[tuple, tuple] = {}
+
+    def get_calendar(self, code: str) -> TradingCalendar:
+        if code not in self._calendars:
+            self._calendars[code] = TradingCalendar(EXCHANGE_CALENDARS[code])
+        return self._calendars[code]
+
+    def calendar_code_for_market(self, market: Optional[str]) -> str:
+        """Código de calendario para un nombre de Market (XWKD si es desconocido)"""
+        if not market:
+            return DEFAULT_CALENDAR
+        return MARKET_CALENDARS.get(market.strip().upper(), DEFAULT_CALENDAR)
+
+    def calendar_code_for_asset(self, market: Optional[str], is_crypto: bool = False) -> str:
+        return CRYPTO_CALENDAR if is_crypto else self.calendar_code_for_market(market)
+
+    def for_asset(self, market: Optional[str], is_crypto: bool = False) -> TradingCalendar:
+        """Calendario de un activo a partir de su mercado y tipo"""
+        return self.get_calendar(self.calendar_code_for_asset(market, is_crypto))
+
+    def holiday_table(self, end: date, codes: Optional[Iterable[str]] = None):
+        """
+        Festivos (laborables sin sesión) de cada calendario desde HOLIDAY_HISTORY_START_YEAR
+        hasta end, en dos listas paralelas (código, fecha) para pasarlas a SQL con unnest.
+        """
+        codes = tuple(codes or EXCHANGE_CALENDARS.keys())
+        key = (end, codes)
+        if key not in self._holiday_table_cache:
+            start = date(HOLIDAY_HISTORY_START_YEAR, 1, 1)
+            calendars, days = [], []
+            for code in codes:
+                for holiday in self.get_calendar(code).holidays(start, end):
+                    calendars.append(code)
+                    days.append(holiday)
+            self._holiday_table_cache = {key: (calendars, days)}
+        return self._holiday_table_cache[key]
+
+
+trading_calendar_service = TradingCalendarService()
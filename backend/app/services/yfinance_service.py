@@ -1,6 +1,7 @@
 """
 Servicio para obtener datos históricos usando yfinance (Yahoo Finance)
-yfinance es completamente gratuito y sin límites de llamadas
+yfinance es completamente gratuito y sin límites publicados: las llamadas pasan
+por el rate limit compartido (provider "yahoo") para evitar bloqueos temporales
 """
 import yfinance as yf
 import pandas as pd
@@ -10,7 +11,12 @@ from datetime import datetime, date, timedelta, timezone
 from typing import List, Dict, Optional
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+from app.core.http_client import http_client
+from app.core.provider_rate_limit import provider_rate_limiter
 from app.core.redis_client import redis_client
+from app.core.response_cache import response_cache
+from app.services.quote_writer_service import normalize_quote_frame, frame_to_quotes
 
 logger = logging.getLogger(__name__)
 
@@ -90,74 +96,11 @@ class YFinanceService:
             
             logger.info(f"📊 DataFrame shape: {df.shape}, empty: {df.empty}")
             
-            # FALLBACK: Si history() falla o está vacío, intentar descarga manual
             if df.empty:
-                logger.warning(f"⚠️ yfinance history() fallback para {symbol}. Intentando descarga manual v8...")
-                try:
-                    import requests
-                    # Convertir fechas a timestamps
-                    p1 = int(datetime.combine(start_date or (date.today() - timedelta(days=90)), datetime.min.time()).timestamp())
-                    p2 = int(datetime.combine(end_date or date.today(), datetime.max.time()).timestamp())
-                    
-                    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{yf_symbol}?period1={p1}&period2={p2}&interval=1d"
-                    headers = {'User-Agent': 'Mozilla/5.0'}
-                    resp = requests.get(url, headers=headers, timeout=10)
-                    
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        result = data.get('chart', {}).get('result', [{}])[0]
-                        timestamps = result.get('timestamp', [])
-                        indicators = result.get('indicators', {}).get('quote', [{}])[0]
-                        
-                        if timestamps:
-                            quotes = []
-                            for i in range(len(timestamps)):
-                                try:
-                                    # Validar que tengamos el precio de cierre
-                                    close_val = indicators.get('close', [])[i]
-                                    if close_val is None: continue
-                                    
-                                    q_date = datetime.fromtimestamp(timestamps[i], tz=timezone.utc)
-                                    # Normalizar a medianoche UTC
-                                    q_date = datetime.combine(q_date.date(), datetime.min.time()).replace(tzinfo=timezone.utc)
-                                    
-                                    quotes.append({
-                                        "date": q_date,
-                                        "open": float(indicators.get('open', [close_val])[i] or close_val),
-                                        "high": float(indicators.get('high', [close_val])[i] or close_val),
-                                        "low": float(indicators.get('low', [close_val])[i] or close_val),
-                                        "close": float(close_val),
-                                        "volume": int(indicators.get('volume', [0])[i] or 0)
-                                    })
-                                except: continue
-                            
-                            if quotes:
-                                logger.info(f"✅ {len(quotes)} cotizaciones obtenidas vía manual v8 para {symbol}")
-                                return quotes
-                except Exception as e:
-                    logger.error(f"❌ Fallback manual falló para {symbol}: {str(e)}")
-
-            if df.empty:
-                logger.warning(f"⚠️ No hay datos históricos para {symbol} tras agotar opciones.")
                 return None
             
             # Convertir DataFrame a lista de diccionarios (proceder con el DF si no estaba vacío)
-            quotes = []
-            for index, row in df.iterrows():
-                # index es un Timestamp de pandas, convertir a datetime
-                quote_date = index.to_pydatetime()
-                # Normalizar a medianoche UTC
-                quote_date = datetime.combine(quote_date.date(), datetime.min.time()).replace(tzinfo=timezone.utc)
-                
-                quote = {
-                    "date": quote_date,
-                    "open": float(row['Open']),
-                    "high": float(row['High']),
-                    "low": float(row['Low']),
-                    "close": float(row['Close']),
-                    "volume": int(row['Volume']) if row['Volume'] > 0 else 0
-                }
-                quotes.append(quote)
+            quotes = frame_to_quotes(normalize_quote_frame(df))
             
             logger.info(f"✅ {len(quotes)} cotizaciones obtenidas para {symbol} desde yfinance history()")
             return quotes
@@ -166,18 +109,184 @@ class YFinanceService:
             logger.error(f"❌ Error obteniendo datos de yfinance para {symbol}: {str(e)}", exc_info=True)
             return None
     
+    async def _download_v8_chart(
+        self,
+        symbol: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> Optional[List[Dict]]:
+        """
+        Descarga manual del endpoint v8/chart de Yahoo (fallback cuando history() viene vacío)
+        con el cliente HTTP compartido
+        """
+        try:
+            yf_symbol = self._normalize_symbol(symbol)
+            # Convertir fechas a timestamps
+            p1 = int(datetime.combine(start_date or (date.today() - timedelta(days=90)), datetime.min.time()).timestamp())
+            p2 = int(datetime.combine(end_date or date.today(), datetime.max.time()).timestamp())
+            
+            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{yf_symbol}"
+            await provider_rate_limiter.acquire("yahoo", "chart")
+            resp = await http_client.get(
+                url,
+                params={"period1": p1, "period2": p2, "interval": "1d"},
+                headers={'User-Agent': 'Mozilla/5.0'}
+            )
+            
+            if resp.status_code != 200:
+                return None
+            
+            data = resp.json()
+            result = data.get('chart', {}).get('result', [{}])[0]
+            timestamps = result.get('timestamp', [])
+            indicators = result.get('indicators', {}).get('quote', [{}])[0]
+            
+            if not timestamps:
+                return None
+            
+            # Timestamps epoch -> fecha UTC de cada vela
+            v8_df = pd.DataFrame(
+                {k: indicators.get(k) for k in ("open", "high", "low", "close", "volume") if indicators.get(k)},
+                index=pd.to_datetime(timestamps, unit="s", utc=True)
+            )
+            quotes = frame_to_quotes(normalize_quote_frame(v8_df)) if "close" in v8_df else []
+            
+            if quotes:
+                logger.info(f"✅ {len(quotes)} cotizaciones obtenidas vía manual v8 para {symbol}")
+                return quotes
+            return None
+            
+        except Exception as e:
+            logger.error(f"❌ Fallback manual falló para {symbol}: {str(e)}")
+            return None
+    
+    def _download_batch_sync(
+        self,
+        symbols: List[str],
+        start_date: date,
+        end_date: date
+    ) -> Dict[str, List[Dict]]:
+        """
+        Descarga síncrona multi-ticker con yf.download. yfinance hace una petición por
+        ticker, repartidas en como mucho SYNC_YAHOO_CONCURRENCY hilos.
+        Devuelve solo los símbolos con datos; el resto se resuelve con el fallback individual.
+        """
+        yf_symbols = {self._normalize_symbol(s): s for s in symbols}
+        logger.info(f"🔄 Descarga multi-ticker de yfinance: {len(yf_symbols)} símbolos ({start_date} → {end_date})")
+        
+        df = yf.download(
+            tickers=list(yf_symbols.keys()),
+            start=start_date,
+            end=end_date,
+            interval="1d",
+            group_by="ticker",
+            auto_adjust=True,  # Igual que Ticker.history()
+            threads=max(1, settings.SYNC_YAHOO_CONCURRENCY),
+            progress=False,
+            timeout=10
+        )
+        
+        if df is None or df.empty:
+            return {}
+        
+        # Con un solo ticker yfinance devuelve columnas planas: unificar a (ticker, campo)
+        if not isinstance(df.columns, pd.MultiIndex):
+            df.columns = pd.MultiIndex.from_product([list(yf_symbols.keys()), df.columns])
+        
+        # Formato largo (fecha, ticker) -> OHLCV; stack descarta las filas sin datos
+        long_df = df.stack(level=0)
+        
+        results = {}
+        for yf_symbol, frame in long_df.groupby(level=1, sort=False):
+            quotes = frame_to_quotes(normalize_quote_frame(frame.droplevel(1)))
+            if quotes and yf_symbol in yf_symbols:
+                results[yf_symbols[yf_symbol]] = quotes
+        return results
+
+    async def get_historical_quotes_batch(
+        self,
+        symbols: List[str],
+        start_date: date,
+        end_date: date,
+        chunk_size: int = 50,
+        use_cache: bool = True
+    ) -> Dict[str, Optional[List[Dict]]]:
+        """
+        Obtener cotizaciones históricas de varios símbolos con descargas multi-ticker.
+        
+        Los símbolos ya presentes en la caché de histórico no se descargan. El resto se
+        piden en bloques de chunk_size; cada bloque consume del limitador un token por
+        símbolo (yf.download hace una petición por ticker). Los que fallen o vuelvan vacíos se
+        reintentan individualmente con get_historical_quotes (que incluye el fallback manual v8).
+        
+        Returns:
+            {symbol: lista de cotizaciones o None si no hay datos}
+        """
+        loop = asyncio.get_event_loop()
+        unique_symbols = list(dict.fromkeys(symbols))
+        results: Dict[str, Optional[List[Dict]]] = {}
+        
+        if use_cache:
+            for symbol in unique_symbols:
+                cached = await response_cache.get("yahoo", self._normalize_symbol(symbol), start_date, end_date)
+                if cached:
+                    results[symbol] = cached
+        to_download = [s for s in unique_symbols if s not in results]
+        
+        for i in range(0, len(to_download), chunk_size):
+            chunk = to_download[i:i + chunk_size]
+            try:
+                await provider_rate_limiter.acquire("yahoo", "chart", tokens=len(chunk))
+                batch = await loop.run_in_executor(
+                    executor,
+                    self._download_batch_sync,
+                    chunk,
+                    start_date,
+                    end_date
+                )
+                results.update(batch)
+                for symbol, quotes in batch.items():
+                    await response_cache.set("yahoo", self._normalize_symbol(symbol), start_date, end_date, quotes)
+            except Exception as e:
+                logger.error(f"❌ Error en descarga multi-ticker ({len(chunk)} símbolos): {str(e)}")
+        
+        missing = [s for s in unique_symbols if s not in results]
+        if missing:
+            logger.warning(f"⚠️ {len(missing)} símbolos sin datos en la descarga por lotes. Reintentando individualmente...")
+            fallback = await asyncio.gather(*[
+                self.get_historical_quotes(s, start_date=start_date, end_date=end_date, use_cache=use_cache)
+                for s in missing
+            ])
+            results.update(zip(missing, fallback))
+        
+        logger.info(f"✅ Histórico por lotes: {sum(1 for q in results.values() if q)}/{len(unique_symbols)} símbolos con datos")
+        return results
+    
     async def get_historical_quotes(
         self,
         symbol: str,
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
-        period: str = "3mo"
+        period: str = "3mo",
+        use_cache: bool = True
     ) -> Optional[List[Dict]]:
         """
         Obtener cotizaciones históricas de Yahoo Finance (async wrapper)
+        
+        Las respuestas se guardan en la caché de histórico en disco; con use_cache=False
+        se descarga igualmente (y se actualiza la caché).
         """
+        yf_symbol = self._normalize_symbol(symbol)
+        cache_params = {} if start_date and end_date else {"period": period}
+        if use_cache:
+            cached = await response_cache.get("yahoo", yf_symbol, start_date, end_date, **cache_params)
+            if cached:
+                logger.info(f"💾 {len(cached)} cotizaciones de {symbol} desde caché (Yahoo Finance)")
+                return cached
+        
+        await provider_rate_limiter.acquire("yahoo", "chart")
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
+        quotes = await loop.run_in_executor(
             executor,
             self._download_historical_sync,
             symbol,
@@ -185,6 +294,17 @@ class YFinanceService:
             end_date,
             period
         )
+        if not quotes:
+            # FALLBACK: Si history() falla o está vacío, intentar descarga manual
+            logger.warning(f"⚠️ yfinance history() fallback para {symbol}. Intentando descarga manual v8...")
+            quotes = await self._download_v8_chart(symbol, start_date, end_date)
+        
+        if not quotes:
+            logger.warning(f"⚠️ No hay datos históricos para {symbol} tras agotar opciones.")
+            return quotes
+        
+        await response_cache.set("yahoo", yf_symbol, start_date, end_date, quotes, **cache_params)
+        return quotes
     
     async def get_current_quote(self, symbol: str) -> Optional[Dict]:
         """
@@ -199,6 +319,7 @@ class YFinanceService:
                 return cached_data
 
         try:
+            await provider_rate_limiter.acquire("yahoo", "quote")
             yf_symbol = self._normalize_symbol(symbol)
             ticker = yf.Ticker(yf_symbol)
             current_price = None
@@ -230,15 +351,14 @@ class YFinanceService:
             # 4. Scrape manual como último recurso
             if current_price is None:
                 try:
-                    import requests
                     logger.info(f"🕵️ Intentando scraping manual para {yf_symbol} (original: {symbol})")
-                    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{yf_symbol}?interval=1m&range=1d"
-                    headers = {'User-Agent': 'Mozilla/5.0'}
-                    loop = asyncio.get_event_loop()
-                    def fetch_url():
-                        return requests.get(url, headers=headers, timeout=5)
-                    
-                    response = await loop.run_in_executor(executor, fetch_url)
+                    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{yf_symbol}"
+                    response = await http_client.get(
+                        url,
+                        params={"interval": "1m", "range": "1d"},
+                        headers={'User-Agent': 'Mozilla/5.0'},
+                        timeout=5
+                    )
                     if response.status_code == 200:
                         data = response.json()
                         meta = data.get('chart', {}).get('result', [{}])[0].get('meta', {})
@@ -342,7 +462,9 @@ class YFinanceService:
             # 1. Búsqueda paralela inicial para encontrar tickers candidatos
             # Manejamos excepciones individualmente para que una API bloqueada no mate el proceso
             async def safe_yf_search():
-                try: return await loop.run_in_executor(executor, lambda: yf.Search(search_query, max_results=8).quotes)
+                try:
+                    await provider_rate_limiter.acquire("yahoo", "search")
+                    return await loop.run_in_executor(executor, lambda: yf.Search(search_query, max_results=8).quotes)
                 except: return []
 
             async def safe_av_search():
@@ -405,6 +527,7 @@ class YFinanceService:
             # 4. EXTRACCIÓN DETALLADA (Agnóstica pero jerárquica)
             # Consultamos por el ticker ganador en las tres fuentes para asegurar la moneda
             async def get_details():
+                await provider_rate_limiter.acquire("yahoo", "quote")
                 dt_tasks = [
                     loop.run_in_executor(executor, lambda: yf.Ticker(best_ticker).info),
                     alpha_vantage_service.get_company_profile(best_ticker),
@@ -506,6 +629,7 @@ class YFinanceService:
                 ticker = yf.Ticker(symbol)
                 return ticker.info
             
+            await provider_rate_limiter.acquire("yahoo", "quote")
             loop = asyncio.get_event_loop()
             info = await loop.run_in_executor(executor, _get_info)
             
@@ -29,7 +29,7 @@ async def download_quotes_for_assets():
         assets_without_quotes = []
         for asset_dict in assets_data:
             quote_count = await session.execute(
-                select(func.count(Quote.id)).where(Quote.asset_id == asset_dict["id"])
+                select(func.count()).where(Quote.asset_id == asset_dict["id"])
             )
             if quote_count.scalar() == 0:
                 assets_without_quotes.append(asset_dict)
@@ -27,7 +27,7 @@ async def check_existing_dates():
             res_ex = await db.execute(select(Quote).where(and_(Quote.asset_id == asset_id, Quote.date >= datetime(2026,1,5), Quote.date < datetime(2026,1,6))))
             exact = res_ex.scalar_one_or_none()
             if exact:
-                print(f"  Registro exacto: date={exact.date}, close={exact.close}, created_at={exact.created_at}")
+                print(f"  Registro exacto: date={exact.date}, close={exact.close}, source={exact.source}")
         else:
             print(f"✅ NO ENCONTRADO: {target} NO existe en existing_dates.")
 
@@ -32,10 +32,10 @@ async def diagnose_dia_mc():
         )
         quotes = res.scalars().all()
         
-        print(f"{'FECHA (UTC/TZ)':<30} | {'CIERRE':<10} | {'SOURCE':<20} | {'CREATED_AT':<20}")
-        print("-" * 90)
+        print(f"{'FECHA (UTC/TZ)':<30} | {'CIERRE':<10} | {'SOURCE':<20}")
+        print("-" * 66)
         for q in quotes:
-            print(f"{str(q.date):<30} | {float(q.close):<10.4f} | {q.source:<20} | {str(q.created_at)}")
+            print(f"{str(q.date):<30} | {float(q.close):<10.4f} | {q.source:<20}")
 
 if __name__ == "__main__":
     asyncio.run(diagnose_dia_mc())
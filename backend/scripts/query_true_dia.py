@@ -9,15 +9,16 @@ load_dotenv(os.path.join(root_dir, '.env'))
 
 from sqlalchemy import text
 from app.core.database import AsyncSessionLocal
+from app.models.quote import decode_quote_source
 
 async def q():
     # ID real de DIA.MC según check_asset_details.py
     asset_id = '424e567b-b2f1-4f80-a170-d20e5e3314ee'
     async with AsyncSessionLocal() as db:
-        res = await db.execute(text(f"SELECT date, close, source, created_at FROM quotes WHERE date >= '2026-01-01' AND asset_id = '{asset_id}' ORDER BY date"))
-        print(f"{'FECHA':<30} | {'CIERRE':<10} | {'SOURCE':<20} | {'CREATED_AT':<20}")
+        res = await db.execute(text(f"SELECT date, close, source FROM quotes WHERE date >= '2026-01-01' AND asset_id = '{asset_id}' ORDER BY date"))
+        print(f"{'FECHA':<30} | {'CIERRE':<10} | {'SOURCE':<20}")
         for row in res.all():
-            print(f"{str(row[0]):<30} | {float(row[1]):<10.4f} | {row[2]:<20} | {str(row[3])}")
+            print(f"{str(row[0]):<30} | {float(row[1]):<10.4f} | {decode_quote_source(row[2]):<20}")
 
 if __name__ == "__main__":
     asyncio.run(q())
@@ -9,13 +9,14 @@ load_dotenv(os.path.join(root_dir, '.env'))
 
 from sqlalchemy import text
 from app.core.database import AsyncSessionLocal
+from app.models.quote import decode_quote_source
 
 async def q():
     async with AsyncSessionLocal() as db:
-        res = await db.execute(text("SELECT date, close, source, created_at FROM quotes WHERE date >= '2026-01-01' AND asset_id = '55818ddf-5e1e-4c90-bec0-df2ca999fc7c' ORDER BY date"))
-        print(f"{'FECHA':<30} | {'CIERRE':<10} | {'SOURCE':<20} | {'CREATED_AT':<20}")
+        res = await db.execute(text("SELECT date, close, source FROM quotes WHERE date >= '2026-01-01' AND asset_id = '55818ddf-5e1e-4c90-bec0-df2ca999fc7c' ORDER BY date"))
+        print(f"{'FECHA':<30} | {'CIERRE':<10} | {'SOURCE':<20}")
         for row in res.all():
-            print(f"{str(row[0]):<30} | {float(row[1]):<10.4f} | {row[2]:<20} | {str(row[3])}")
+            print(f"{str(row[0]):<30} | {float(row[1]):<10.4f} | {decode_quote_source(row[2]):<20}")
 
 if __name__ == "__main__":
     asyncio.run(q())
@@ -0,0 +1,91 @@
+"""
+Tests del token bucket local de respaldo (ProviderRateLimiter._reserve_local)
+"""
+import asyncio
+
+import pytest
+
+from app.core import provider_rate_limit
+from app.core.config import settings
+from app.core.provider_rate_limit import ANY_ENDPOINT, ProviderLimit, ProviderRateLimiter, default_limits
+
+BUCKET = "provider_rate:test:*"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj monotonic controlado por el test"""
+    now = {"value": 1000.0}
+    monkeypatch.setattr(provider_rate_limit.time, "monotonic", lambda: now["value"])
+    return now
+
+
+def reserve(limiter, limit, tokens=1, max_wait_ms=-1, penalty_ms=0):
+    return asyncio.run(limiter._reserve_local(BUCKET, limit, tokens, max_wait_ms, penalty_ms))
+
+
+def test_burst_then_wait(clock):
+    limiter = ProviderRateLimiter(limits={})
+    limit = ProviderLimit(60, 60, burst=2)  # 1 token/s
+
+    assert reserve(limiter, limit) == (True, 0)
+    assert reserve(limiter, limit) == (True, 0)
+    # Cubo vacío: el tercero espera 1s y el cuarto (reservado a continuación) 2s
+    assert reserve(limiter, limit) == (True, 1000)
+    assert reserve(limiter, limit) == (True, 2000)
+
+
+def test_refill_is_capped_at_burst(clock):
+    limiter = ProviderRateLimiter(limits={})
+    limit = ProviderLimit(60, 60, burst=2)
+
+    reserve(limiter, limit, tokens=2)
+    clock["value"] += 3600
+    assert reserve(limiter, limit, tokens=2) == (True, 0)
+    assert reserve(limiter, limit) == (True, 1000)
+
+
+def test_multiple_tokens(clock):
+    limiter = ProviderRateLimiter(limits={})
+    limit = ProviderLimit(120, 60, burst=10)  # 2 tokens/s
+
+    # 50 tokens con 10 disponibles: 40 de deuda = 20s
+    assert reserve(limiter, limit, tokens=50) == (True, 20000)
+
+
+def test_timeout_rejects_without_consuming(clock):
+    limiter = ProviderRateLimiter(limits={})
+    limit = ProviderLimit(60, 60, burst=1)
+
+    reserve(limiter, limit)
+    assert reserve(limiter, limit, max_wait_ms=500) == (False, 1000)
+    # El rechazo no consumió: tras 1s hay turno inmediato
+    clock["value"] += 1
+    assert reserve(limiter, limit) == (True, 0)
+
+
+def test_penalty_empties_the_bucket(clock):
+    limiter = ProviderRateLimiter(limits={})
+    limit = ProviderLimit(60, 60, burst=5)
+
+    reserve(limiter, limit, tokens=0, penalty_ms=10000)
+    assert reserve(limiter, limit) == (True, 11000)
+
+
+def test_alpha_vantage_daily_quota_is_available_back_to_back(clock):
+    limiter = ProviderRateLimiter(limits={})
+    limit = default_limits()[("alpha_vantage", ANY_ENDPOINT)]
+    quota = settings.ALPHA_VANTAGE_RATE_LIMIT
+
+    # Como en alpha_vantage_service: timeout=0 (sin esperas)
+    for _ in range(quota):
+        assert reserve(limiter, limit, max_wait_ms=0) == (True, 0)
+    granted, wait_ms = reserve(limiter, limit, max_wait_ms=0)
+    assert granted is False
+    assert wait_ms == 24 * 3600 * 1000 // quota
+
+
+def test_unknown_provider_is_not_limited():
+    limiter = ProviderRateLimiter(limits={})
+
+    assert asyncio.run(limiter.acquire("desconocido")) == 0.0
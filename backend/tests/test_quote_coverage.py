@@ -0,0 +1,82 @@
+"""
+Tests del cálculo y la clasificación de cobertura (quote_coverage_service)
+"""
+from datetime import date
+
+from app.services.quote_coverage_service import build_coverage, classify_coverage
+
+TODAY = date(2024, 6, 14)
+
+
+def coverage(**overrides) -> dict:
+    values = {
+        "is_crypto": False,
+        "required_start": date(2024, 1, 1),
+        "total_quotes": 100,
+        "first_date": date(2024, 1, 2),
+        "last_date": date(2024, 6, 13),
+        "missing_days": 0,
+        "max_consecutive_missing": 0,
+        "today": TODAY,
+    }
+    values.update(overrides)
+    return build_coverage(**values)
+
+
+def test_build_coverage_complete():
+    result = coverage()
+
+    assert result["is_complete"] is True
+    assert result["coverage_ratio"] == 1.0
+    assert result["days_since_last_update"] == 1
+    assert result["needs_update"] is False
+    assert classify_coverage(result)["reason"] == "complete"
+
+
+def test_build_coverage_tolerates_isolated_missing_sessions():
+    # 1 sesión de 200 sin dato: ratio 0.995 >= 0.99
+    result = coverage(total_quotes=199, missing_days=1, max_consecutive_missing=1)
+
+    assert result["is_complete"] is True
+    assert result["has_gaps"] is False
+
+
+def test_build_coverage_large_gap_is_incomplete():
+    result = coverage(total_quotes=994, missing_days=6, max_consecutive_missing=6)
+
+    assert result["coverage_ratio"] >= 0.99
+    assert result["has_gaps"] is True
+    assert classify_coverage(result)["reason"] == "incomplete_data"
+
+
+def test_build_coverage_low_ratio_is_incomplete():
+    result = coverage(total_quotes=90, missing_days=10, max_consecutive_missing=2)
+
+    assert result["coverage_ratio"] == 0.9
+    assert classify_coverage(result)["needs_import"] is True
+
+
+def test_classify_coverage_without_quotes():
+    result = coverage(total_quotes=0, first_date=None, last_date=None, missing_days=0)
+
+    assert result["has_quotes"] is False
+    assert result["needs_update"] is True
+    assert classify_coverage(result)["reason"] == "no_data"
+
+
+def test_stale_data_is_not_complete():
+    # Sin datos desde hace 6 días: ya no está al día (umbral de 5)
+    result = coverage(last_date=date(2024, 6, 8))
+
+    assert result["is_complete"] is False
+    assert result["needs_update"] is False
+    assert classify_coverage(result)["reason"] == "incomplete_data"
+
+
+def test_classify_coverage_outdated():
+    # Completo pero sin actualizar en más de 7 días (p. ej. activo sin precios recientes)
+    result = dict(coverage(), is_complete=True, needs_update=True, days_since_last_update=10)
+
+    classification = classify_coverage(result)
+    assert classification["reason"] == "outdated"
+    assert classification["needs_import"] is True
@@ -0,0 +1,90 @@
+"""
+Tests de la normalización de DataFrames OHLCV (quote_writer_service)
+"""
+from datetime import date, datetime, timezone
+
+import pandas as pd
+import pytest
+
+from app.services.quote_writer_service import frame_to_quotes, normalize_quote_date, normalize_quote_frame
+
+
+def utc_midnight(year: int, month: int, day: int) -> datetime:
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+def test_normalize_quote_frame_yfinance_columns():
+    index = pd.DatetimeIndex(["2024-03-01 00:00", "2024-03-04 00:00"], tz="America/New_York")
+    df = pd.DataFrame({
+        "Open": [10.0, 11.0],
+        "High": [12.0, 13.0],
+        "Low": [9.0, 10.5],
+        "Close": [11.5, 12.5],
+        "Volume": [1000, 2000],
+    }, index=index)
+
+    result = normalize_quote_frame(df)
+
+    # Fecha local del mercado llevada a medianoche UTC
+    assert result["date"].tolist() == [pd.Timestamp("2024-03-01", tz="UTC"), pd.Timestamp("2024-03-04", tz="UTC")]
+    assert result["close"].tolist() == [11.5, 12.5]
+    assert result["volume"].dtype == "int64"
+
+
+def test_normalize_quote_frame_fills_missing_prices_with_close():
+    df = pd.DataFrame({
+        "date": ["2024-01-02", "2024-01-03"],
+        "close": [5.0, 6.0],
+        "open": [None, 5.5],
+    })
+
+    result = normalize_quote_frame(df, date_column="date")
+
+    assert result["open"].tolist() == [5.0, 5.5]
+    assert result["high"].tolist() == [5.0, 6.0]
+    assert result["low"].tolist() == [5.0, 6.0]
+    assert result["volume"].tolist() == [0, 0]
+
+
+def test_normalize_quote_frame_drops_invalid_rows_and_negative_volume():
+    df = pd.DataFrame({
+        "date": ["2024-01-02", "no es fecha", "2024-01-04"],
+        "close": [5.0, 6.0, None],
+        "volume": [-10, 20, 30],
+    })
+
+    result = normalize_quote_frame(df, date_column="date")
+
+    assert len(result) == 1
+    assert result.loc[0, "volume"] == 0
+
+
+def test_frame_to_quotes_returns_python_datetimes():
+    df = pd.DataFrame({"date": ["2024-01-02"], "close": [5.0], "volume": [7]})
+
+    quotes = frame_to_quotes(normalize_quote_frame(df, date_column="date"))
+
+    assert quotes == [{
+        "date": utc_midnight(2024, 1, 2),
+        "open": 5.0,
+        "high": 5.0,
+        "low": 5.0,
+        "close": 5.0,
+        "volume": 7,
+    }]
+    assert type(quotes[0]["date"]) is datetime
+
+
+@pytest.mark.parametrize("value", [
+    date(2024, 5, 6),
+    datetime(2024, 5, 6, 15, 30),
+    datetime(2024, 5, 6, 22, 0, tzinfo=timezone.utc),
+    pd.Timestamp("2024-05-06 09:00"),
+])
+def test_normalize_quote_date(value):
+    assert normalize_quote_date(value) == utc_midnight(2024, 5, 6)
+
+
+def test_normalize_quote_date_rejects_invalid_values():
+    with pytest.raises(ValueError):
+        normalize_quote_date("2024-05-06")
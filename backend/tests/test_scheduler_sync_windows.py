@@ -0,0 +1,51 @@
+"""
+Tests de la planificación de ventanas del cierre diario (SchedulerService._plan_sync_windows)
+"""
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+from app.models.asset import AssetType
+from app.services.scheduler_service import scheduler_service
+
+# Lunes 2024-06-17: la última sesión cerrada de NYSE es el viernes 14
+TODAY = date(2024, 6, 17)
+
+
+def asset(symbol: str, last_date=None, market: str = "NASDAQ", asset_type=AssetType.STOCK):
+    if last_date is not None:
+        last_date = datetime(last_date.year, last_date.month, last_date.day, tzinfo=timezone.utc)
+    return SimpleNamespace(symbol=symbol, market=market, asset_type=asset_type, last_date=last_date)
+
+
+def test_up_to_date_assets_are_skipped():
+    windows, up_to_date = scheduler_service._plan_sync_windows([asset("AAPL", date(2024, 6, 14))], TODAY)
+
+    assert windows == {}
+    assert up_to_date == 1
+
+
+def test_assets_with_same_last_date_share_a_window():
+    assets = [asset("AAPL", date(2024, 6, 12)), asset("MSFT", date(2024, 6, 12)), asset("SAN.MC", date(2024, 6, 10), "CONTINUO")]
+
+    windows, up_to_date = scheduler_service._plan_sync_windows(assets, TODAY)
+
+    assert up_to_date == 0
+    assert [a.symbol for a in windows[(date(2024, 6, 13), TODAY)]] == ["AAPL", "MSFT"]
+    assert [a.symbol for a in windows[(date(2024, 6, 11), TODAY)]] == ["SAN.MC"]
+
+
+def test_assets_without_quotes_get_initial_window():
+    windows, _ = scheduler_service._plan_sync_windows([asset("NEW")], TODAY)
+
+    start = date.fromordinal(TODAY.toordinal() - scheduler_service.initial_sync_days)
+    assert list(windows) == [(start, TODAY)]
+
+
+def test_crypto_needs_the_weekend():
+    # Crypto cotiza el fin de semana: con datos hasta el viernes no está al día
+    windows, up_to_date = scheduler_service._plan_sync_windows(
+        [asset("BTC-USD", date(2024, 6, 14), market=None, asset_type=AssetType.CRYPTO)], TODAY
+    )
+
+    assert up_to_date == 0
+    assert list(windows) == [(date(2024, 6, 15), TODAY)]
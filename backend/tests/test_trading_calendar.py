@@ -0,0 +1,110 @@
+"""
+Tests de los calendarios de negociación (trading_calendar_service)
+"""
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app.services.trading_calendar_service import (
+    CRYPTO_CALENDAR,
+    DEFAULT_CALENDAR,
+    TradingCalendarService,
+    easter_sunday,
+    nth_weekday,
+    weekday_bits,
+)
+
+
+@pytest.fixture
+def service() -> TradingCalendarService:
+    return TradingCalendarService()
+
+
+@pytest.mark.parametrize("year, expected", [
+    (2019, date(2019, 4, 21)),
+    (2024, date(2024, 3, 31)),
+    (2025, date(2025, 4, 20)),
+])
+def test_easter_sunday(year, expected):
+    assert easter_sunday(year) == expected
+
+
+def test_nth_weekday():
+    assert nth_weekday(2024, 1, 0, 3) == date(2024, 1, 15)   # MLK Day
+    assert nth_weekday(2024, 5, 0, -1) == date(2024, 5, 27)  # Memorial Day
+    assert nth_weekday(2024, 11, 3, 4) == date(2024, 11, 28)  # Thanksgiving
+
+
+def test_weekday_bits_counts_weekdays():
+    assert bin(weekday_bits(2024)).count("1") == 262
+    assert bin(weekday_bits(2023)).count("1") == 260
+
+
+def test_nyse_holidays_2024(service):
+    holidays = service.get_calendar("XNYS").holidays(date(2024, 1, 1), date(2024, 12, 31))
+
+    assert holidays == [
+        date(2024, 1, 1),
+        date(2024, 1, 15),
+        date(2024, 2, 19),
+        date(2024, 3, 29),
+        date(2024, 5, 27),
+        date(2024, 6, 19),
+        date(2024, 7, 4),
+        date(2024, 9, 2),
+        date(2024, 11, 28),
+        date(2024, 12, 25),
+    ]
+
+
+def test_bme_sessions_skip_easter_and_weekends(service):
+    calendar = service.get_calendar("XMAD")
+
+    sessions = calendar.sessions(date(2024, 3, 28), date(2024, 4, 3))
+
+    # Viernes Santo y Lunes de Pascua cerrados
+    assert sessions == [date(2024, 3, 28), date(2024, 4, 2), date(2024, 4, 3)]
+    assert calendar.previous_session(date(2024, 4, 2)) == date(2024, 3, 28)
+
+
+def test_sessions_across_year_boundary(service):
+    sessions = service.get_calendar("XNYS").sessions(date(2024, 12, 30), date(2025, 1, 3))
+
+    assert sessions == [date(2024, 12, 30), date(2024, 12, 31), date(2025, 1, 2), date(2025, 1, 3)]
+
+
+def test_crypto_trades_every_day(service):
+    calendar = service.get_calendar(CRYPTO_CALENDAR)
+
+    assert calendar.holidays(date(2024, 1, 1), date(2024, 12, 31)) == []
+    assert calendar.is_session(date(2024, 12, 25))
+    assert calendar.previous_session(date(2024, 6, 10)) == date(2024, 6, 9)
+
+
+def test_calendar_resolution(service):
+    assert service.calendar_code_for_market(" nasdaq ") == "XNYS"
+    assert service.calendar_code_for_market("CONTINUO") == "XMAD"
+    assert service.calendar_code_for_market("DESCONOCIDO") == DEFAULT_CALENDAR
+    assert service.calendar_code_for_market(None) == DEFAULT_CALENDAR
+    assert service.calendar_code_for_asset("NASDAQ", is_crypto=True) == CRYPTO_CALENDAR
+
+
+@pytest.mark.parametrize("code, at, expected", [
+    # 14:00 UTC = 10:00 en Nueva York (horario de verano)
+    ("XNYS", datetime(2024, 6, 14, 14, 0, tzinfo=timezone.utc), True),
+    ("XNYS", datetime(2024, 6, 14, 12, 0, tzinfo=timezone.utc), False),
+    ("XNYS", datetime(2024, 6, 19, 14, 0, tzinfo=timezone.utc), False),  # Juneteenth
+    ("XMAD", datetime(2024, 6, 14, 7, 30, tzinfo=timezone.utc), True),
+    ("XMAD", datetime(2024, 6, 15, 10, 0, tzinfo=timezone.utc), False),  # Sábado
+    ("CRYPTO", datetime(2024, 6, 15, 23, 59, 30, tzinfo=timezone.utc), True),
+])
+def test_is_open(service, code, at, expected):
+    assert service.get_calendar(code).is_open(at) is expected
+
+
+def test_holiday_table_is_parallel(service):
+    calendars, days = service.holiday_table(date(2024, 12, 31), codes=["XNYS"])
+
+    assert len(calendars) == len(days)
+    assert set(calendars) == {"XNYS"}
+    assert date(2024, 7, 4) in days
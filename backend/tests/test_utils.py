@@ -0,0 +1,39 @@
+"""
+Tests de las conversiones vectorizadas de app.core.utils (importación de Excel)
+"""
+import pandas as pd
+
+from app.core.utils import clean_decimal_series, parse_volume_series
+
+
+def test_clean_decimal_series_numeric_column():
+    # openpyxl devuelve las celdas numéricas ya como float64
+    result = clean_decimal_series(pd.Series([1.5, 2.0, 3.25]))
+    assert result.tolist() == [1.5, 2.0, 3.25]
+
+
+def test_clean_decimal_series_spanish_text():
+    result = clean_decimal_series(pd.Series(["1.234,56", "3,2 €", "12%", "$7"]))
+    assert result.tolist() == [1234.56, 3.2, 12.0, 7.0]
+
+
+def test_clean_decimal_series_mixed_column():
+    result = clean_decimal_series(pd.Series([1.5, "1.234,5", None, "n/d"], dtype=object))
+    assert result.iloc[:2].tolist() == [1.5, 1234.5]
+    assert result.iloc[2:].isna().all()
+
+
+def test_parse_volume_series_numeric_column():
+    result = parse_volume_series(pd.Series([1200.0, None]))
+    assert result.tolist() == [1200, 0]
+    assert result.dtype == "int64"
+
+
+def test_parse_volume_series_suffixes():
+    result = parse_volume_series(pd.Series(["1,2M", "350K", "10", "abc"]))
+    assert result.tolist() == [1_200_000, 350_000, 10, 0]
+
+
+def test_parse_volume_series_mixed_column():
+    result = parse_volume_series(pd.Series([5, "2K", None], dtype=object))
+    assert result.tolist() == [5, 2_000, 0]
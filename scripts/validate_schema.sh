@@ -37,7 +37,7 @@ echo ""
 # 2. Verificar versión de Alembic
 echo -e "${YELLOW}▶ Verificando versión de migraciones...${NC}"
 CURRENT_VERSION=$(docker compose exec backend alembic current 2>/dev/null | grep -oP '^\K[a-z0-9]+' | head -1)
-EXPECTED_VERSION="29bc6e996add"
+EXPECTED_VERSION="b7e2f4c81d05"
 
 if [ "$CURRENT_VERSION" != "$EXPECTED_VERSION" ]; then
     echo -e "${RED}✗ Versión incorrecta: $CURRENT_VERSION (esperada: $EXPECTED_VERSION)${NC}"